@@ -56,5 +56,32 @@ def _unpickle_ufunc(name):
 if parse_version(numpy.__version__) < parse_version('1.7.0'):
     copy_reg.pickle(numpy.ufunc, _pickle_ufunc, _unpickle_ufunc)
 
+# Pickling support for instance methods --------------------------------------
+
+import types
+import inspect
+
+# Bound and unbound methods are used as getters and setters of
+# ParameterAdapter.  They are pickled as an attribute of their instance or
+# class.  Private names are mangled with the class that defines the method.
+def _pickle_method(method):
+    obj = method.im_self
+    if obj is None:
+        obj = method.im_class
+    name = method.im_func.__name__
+    if name.startswith('__') and not name.endswith('__'):
+        name = _mangledName(method, name)
+    return getattr, (obj, name)
+
+def _mangledName(method, name):
+    for cls in inspect.getmro(method.im_class):
+        mangled = '_' + cls.__name__.lstrip('_') + name
+        f = cls.__dict__.get(mangled)
+        if getattr(f, '__func__', f) is method.im_func:
+            return mangled
+    return name
+
+copy_reg.pickle(types.MethodType, _pickle_method)
+
 
 # End of file
@@ -24,9 +24,10 @@ well as default operations.
 The subpackages define various pieces of the evaluation network.
 """
 
-__all__ = ["Equation"]
+__all__ = ["Equation", "EquationProfiler"]
 
 from diffpy.srfit.equation.equationmod import Equation
+from diffpy.srfit.equation.profiler import EquationProfiler
 
 
 # End of file
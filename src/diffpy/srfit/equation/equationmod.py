@@ -35,6 +35,11 @@ Example
 > eq.b.setValue(3)
 > eq() # uses last assignment of a and b, returns 0
 
+Equations can be compiled into a flat evaluation tape, which avoids the
+recursive evaluation of the Literal tree:
+> eq.setCompiled(True)
+> eq(a=1) # same result as before, returns 4
+
 See the class documentation for more information.
 """
 
@@ -45,6 +50,7 @@ from collections import OrderedDict
 from diffpy.srfit.equation.visitors import validate, getArgs, swap
 from diffpy.srfit.equation.literals.operators import Operator
 from diffpy.srfit.equation.literals.literal import Literal
+from diffpy.srfit.equation.tape import EvaluationTape
 
 class Equation(Operator):
     """Class for holding and evaluating a Literal tree.
@@ -65,6 +71,8 @@ class Equation(Operator):
     root    --  The root Literal of the equation tree
     argdict --  An OrderedDict of Arguments from the root.
     args    --  Property that gets the values of argdict.
+    compiled    --  Flag indicating if the Equation is evaluated with a flat
+                evaluation tape (read only). See setCompiled.
 
     Operator Attributes
     args    --  List of Literal arguments, set with 'addLiteral'
@@ -81,6 +89,9 @@ class Equation(Operator):
     nin = None
     nout = 1
 
+    # EvaluationTape of the root when compiled, otherwise None.
+    _tape = None
+
     def __init__(self, name = None, root = None):
         """Initialize.
 
@@ -118,6 +129,31 @@ class Equation(Operator):
         return self.__call__(*args, **kw)
 
 
+    @property
+    def compiled(self):
+        """True when this Equation is evaluated with an EvaluationTape."""
+        return self._tape is not None
+
+
+    def setCompiled(self, compiled=True):
+        """Toggle evaluation with a flat evaluation tape.
+
+        A compiled Equation evaluates its Literal tree as a linear sequence of
+        operations rather than through recursive calls of Operator.getValue.
+        The results are identical, only the call overhead is lower.  The tape
+        is rebuilt by setRoot and swap.  It must be rebuilt by calling this
+        method again if the tree is modified in any other way.
+
+        compiled    --  Flag for evaluating with the tape (default True).
+
+        Returns self so that mutators can be chained.
+        """
+        self._tape = None
+        if compiled and self.root is not None:
+            self._tape = EvaluationTape(self.root)
+        return self
+
+
     def _getArgs(self):
         return self.argdict.values()
 
@@ -172,6 +208,10 @@ class Equation(Operator):
         # Set Operator attributes
         self.nin = len(self.args)
 
+        # Recompile for the new tree
+        if self.compiled:
+            self.setCompiled(True)
+
         return
 
 
@@ -199,7 +239,10 @@ class Equation(Operator):
                 raise ValueError("No argument named '%s' here"%name)
             arg.setValue(val)
 
-        self._value = self.root.getValue()
+        if self._tape is None:
+            self._value = self.root.getValue()
+        else:
+            self._value = self._tape.evaluate()
         return self._value
 
     def swap(self, oldlit, newlit):
@@ -273,15 +273,29 @@ class NegationOperator(UnaryOperator):
 
 
 def _conv(v1, v2):
-    # Get the full convolution
+    """Convolve v1 with v2 and align the result with v1."""
     c = numpy.convolve(v1, v2, mode="full")
+    return _alignConvolution(v1, c)
+
+
+def _alignConvolution(v1, c, xc=None):
+    """Align the full convolution c with the centroid of the signal v1.
+
+    v1  --  The first convolved signal.
+    c   --  The full convolution of v1.
+    xc  --  Array of float indices of c, created when None.
+
+    Returns the convolution interpolated to the length of v1 and scaled to
+    its integrated amplitude.
+    """
     # Find the centroid of the first signal
-    s1 = sum(v1)
+    s1 = numpy.sum(v1)
     x1 = numpy.arange(len(v1), dtype=float)
-    c1idx = numpy.sum(v1 * x1)/s1
+    c1idx = numpy.dot(v1, x1)/s1
     # Find the centroid of the convolution
-    xc = numpy.arange(len(c), dtype=float)
-    ccidx = numpy.sum(c * xc)/sum(c)
+    if xc is None:
+        xc = numpy.arange(len(c), dtype=float)
+    ccidx = numpy.dot(c, xc)/numpy.sum(c)
     # Interpolate the convolution such that the centroids line up. This
     # uses linear interpolation.
     shift = ccidx - c1idx
@@ -289,13 +303,30 @@ def _conv(v1, v2):
     c = numpy.interp(x1, xc, c)
 
     # Normalize
-    sc = sum(c)
+    sc = numpy.sum(c)
     if sc > 0:
         c *= s1/sc
 
     return c
 
 
+def _fftLength(n):
+    """Return the smallest 2**a * 3**b * 5**c that is not less than n."""
+    rv = 2 ** int(numpy.ceil(numpy.log2(max(n, 1))))
+    p5 = 1
+    while p5 < rv:
+        p35 = p5
+        while p35 < rv:
+            # smallest power of 2 times p35 not less than n
+            m = p35
+            while m < n:
+                m *= 2
+            rv = min(rv, m)
+            p35 *= 3
+        p5 *= 5
+    return rv
+
+
 class ConvolutionOperator(BinaryOperator):
     """Convolve two signals.
 
@@ -306,12 +337,68 @@ class ConvolutionOperator(BinaryOperator):
 
     Note that this is only possible when the signals are computed over the same
     range.
+
+    Long real signals are convolved with FFT.  The transform of the second
+    signal, the kernel, is kept while the kernel does not change.
+
+    Attributes
+    fftthreshold    --  Use the FFT convolution when the product of the
+                        signal lengths exceeds this value.  Use direct
+                        convolution when None.
     """
 
     name = "convolve"
     symbol = "convolve"
-    operation = staticmethod(_conv)
-    pass
+    fftthreshold = 50000
+
+    # Private Attributes
+    # ------------------
+    # _kernel : numpy.ndarray or None
+    #     Copy of the kernel of the cached transform.
+    # _kernelfft : numpy.ndarray or None
+    #     The real FFT of the zero-padded kernel.
+    # _xc : numpy.ndarray or None
+    #     Float indices of the full convolution.
+
+    _kernel = None
+    _kernelfft = None
+    _xc = None
+
+
+    def operation(self, v1, v2):
+        """Convolve v1 with v2 and align the result with v1."""
+        v1 = numpy.asarray(v1)
+        v2 = numpy.asarray(v2)
+        usefft = (self.fftthreshold is not None and
+                  v1.ndim == v2.ndim == 1 and
+                  v1.size * v2.size > self.fftthreshold and
+                  not numpy.iscomplexobj(v1) and
+                  not numpy.iscomplexobj(v2))
+        if not usefft:
+            return _conv(v1, v2)
+        nc = v1.size + v2.size - 1
+        nfft = _fftLength(nc)
+        kernel = self._kernel
+        if (kernel is None or self._kernelfft.size != nfft // 2 + 1 or
+                not numpy.array_equal(kernel, v2)):
+            self._kernel = numpy.array(v2, dtype=float)
+            self._kernelfft = numpy.fft.rfft(self._kernel, nfft)
+        if self._xc is None or self._xc.size != nc:
+            self._xc = numpy.arange(nc, dtype=float)
+        f = numpy.fft.rfft(v1, nfft)
+        f *= self._kernelfft
+        c = numpy.fft.irfft(f, nfft)[:nc]
+        return _alignConvolution(v1, c, self._xc)
+
+
+    def __getstate__(self):
+        """Return the state for pickling without the cached transform."""
+        state = self.__dict__.copy()
+        for name in ("_kernel", "_kernelfft", "_xc"):
+            state.pop(name, None)
+        return state
+
+# End class ConvolutionOperator
 
 
 class SumOperator(UnaryOperator):
@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      Complex Modeling Initiative
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""Profiler for the evaluation of Literal trees.
+
+The EquationProfiler instruments Operator.getValue and Equation.__call__
+while it is enabled.  For every Operator node, including ProfileGenerators
+and Equations, it counts the evaluations, the cache hits, i.e., the getValue
+calls that return the cached value, and the invalidations of the cached
+value.  It also sums the wall time spent in the node, with and without the
+time of its Operator arguments.
+
+>>> profiler = EquationProfiler()
+>>> with profiler:
+...     recipe.residual()
+>>> profiler.report(recipe.contribution._eq)
+
+Compiled Equations are evaluated node by node while the profiler is enabled,
+so that every node is accounted for.  Only one profiler can be enabled at a
+time.
+"""
+
+from __future__ import print_function
+
+__all__ = ["EquationProfiler"]
+
+from timeit import default_timer as _clock
+
+from diffpy.srfit.equation.literals.operators import Operator
+from diffpy.srfit.equation.equationmod import Equation
+from diffpy.srfit.equation.visitors.printer import Printer
+from diffpy.srfit.exceptions import SrFitError
+
+# The enabled EquationProfiler or None.
+_active = None
+
+# The original methods replaced by the instrumentation.
+_originalGetValue = Operator.__dict__["getValue"]
+_originalCall = Equation.__dict__["__call__"]
+
+
+class EquationProfiler(object):
+    """Per-node evaluation statistics of Literal trees.
+
+    The statistics of a node are a list of the number of evaluations, cache
+    hits, invalidations, the total time and the time of the Operator
+    arguments in seconds.  The invalidations are counted only for the nodes
+    evaluated at least once since the profiler was enabled.
+
+    Attributes
+    enabled --  Flag for the active instrumentation (read only).
+    _stats  --  Dictionary of the statistics indexed by the node.
+    _counters   --  Dictionary of the invalidation observers of the nodes.
+    _stack  --  List of [node, argument time] frames of the evaluations
+                in progress.
+    """
+
+    enabled = property(lambda self: _active is self)
+
+    def __init__(self):
+        """Create a disabled profiler without any statistics."""
+        self._stats = {}
+        self._counters = {}
+        self._stack = []
+        return
+
+
+    def enable(self):
+        """Instrument the evaluation of the Literal trees.
+
+        Raises SrFitError if another profiler is enabled.
+        """
+        global _active
+        if _active is self:
+            return
+        if _active is not None:
+            raise SrFitError("Another EquationProfiler is enabled.")
+        _active = self
+        Operator.getValue = _profiledGetValue
+        Equation.__call__ = _profiledCall
+        for node, counter in self._counters.items():
+            node.addObserver(counter.onFlush)
+        return
+
+
+    def disable(self):
+        """Restore the original evaluation methods."""
+        global _active
+        if _active is not self:
+            return
+        Operator.getValue = _originalGetValue
+        Equation.__call__ = _originalCall
+        _active = None
+        for node, counter in self._counters.items():
+            if node.hasObserver(counter.onFlush):
+                node.removeObserver(counter.onFlush)
+        del self._stack[:]
+        return
+
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.disable()
+        return
+
+
+    def clear(self):
+        """Remove all statistics."""
+        enabled = self.enabled
+        self.disable()
+        self._stats.clear()
+        self._counters.clear()
+        if enabled:
+            self.enable()
+        return
+
+
+    def getStats(self, node):
+        """Get the statistics of an Operator node.
+
+        Returns a dictionary with the "evaluations", "hits", "invalidations",
+        "time" and "selftime" items or None when node was not profiled.
+        The time is in seconds, the selftime excludes the time spent in the
+        Operator arguments of the node.
+        """
+        st = self._stats.get(node)
+        if st is None:
+            return None
+        rv = dict(evaluations=st[0], hits=st[1], invalidations=st[2],
+                time=st[3], selftime=st[3] - st[4])
+        return rv
+
+
+    def format(self, literal, eqskip = None):
+        """Format the statistics as an annotated tree.
+
+        literal --  The root of the Literal tree.
+        eqskip  --  Regular expression pattern for the Equations that are
+                    not expanded, see Printer.eqskip.
+
+        Returns a string with one line per Operator node.  The times are in
+        milliseconds.
+        """
+        printer = _ProfilePrinter(self)
+        printer.eqskip = eqskip
+        literal.identify(printer)
+        header = "%8s %8s %8s %10s %10s  %s" % ("evals", "hits", "invalid",
+                "time", "self", "node")
+        return "\n".join([header] + printer.lines)
+
+
+    def report(self, literal, eqskip = None):
+        """Print the annotated tree of the statistics, see format."""
+        print(self.format(literal, eqskip))
+        return
+
+
+    def _getStats(self, node):
+        """Get the statistics list of a node, create when necessary."""
+        st = self._stats.get(node)
+        if st is None:
+            st = self._stats[node] = [0, 0, 0, 0.0, 0.0]
+            counter = self._counters[node] = _FlushCounter(st)
+            node.addObserver(counter.onFlush)
+        return st
+
+
+    def _evaluate(self, node, func, args, kw):
+        """Evaluate func(node, *args, **kw) and record its time."""
+        st = self._getStats(node)
+        st[0] += 1
+        stack = self._stack
+        frame = [node, 0.0]
+        stack.append(frame)
+        t0 = _clock()
+        try:
+            return func(node, *args, **kw)
+        finally:
+            dt = _clock() - t0
+            stack.pop()
+            st[3] += dt
+            st[4] += frame[1]
+            if stack:
+                stack[-1][1] += dt
+
+# End class EquationProfiler
+
+# Helper routines ------------------------------------------------------------
+
+def _profiledGetValue(self):
+    """Operator.getValue with the evaluation statistics."""
+    profiler = _active
+    if profiler is None:
+        return _originalGetValue(self)
+    if self._value is not None:
+        profiler._getStats(self)[1] += 1
+        return self._value
+    return profiler._evaluate(self, _originalGetValue, (), {})
+
+
+def _profiledCall(self, *args, **kw):
+    """Equation.__call__ with the evaluation statistics.
+
+    The tape of a compiled Equation is not used, so that the statistics of
+    its nodes are recorded.
+    """
+    profiler = _active
+    if profiler is None:
+        return _originalCall(self, *args, **kw)
+    tape = self._tape
+    self._tape = None
+    try:
+        # Equation node evaluated in getValue is already counted.
+        stack = profiler._stack
+        if stack and stack[-1][0] is self:
+            return _originalCall(self, *args, **kw)
+        return profiler._evaluate(self, _originalCall, args, kw)
+    finally:
+        self._tape = tape
+
+
+class _FlushCounter(object):
+    """Observer that counts the invalidations of a node.
+
+    Every node needs its own observer, because the batched notifications
+    call each observer only once.
+    """
+
+    __slots__ = ("stats", "__weakref__")
+
+    def __init__(self, stats):
+        self.stats = stats
+        return
+
+
+    def onFlush(self, semaphors):
+        self.stats[2] += 1
+        return
+
+# End class _FlushCounter
+
+
+class _ProfilePrinter(Printer):
+    """Printer of the Operator nodes with their statistics.
+
+    Attributes
+    lines   --  List of the output lines.
+    """
+
+    def __init__(self, profiler):
+        Printer.__init__(self)
+        self.lines = []
+        self._profiler = profiler
+        self._depth = 0
+        return
+
+
+    def onArgument(self, arg):
+        """Arguments are not printed."""
+        return self.output
+
+
+    def onOperator(self, op):
+        """Add a line for the Operator and process its arguments."""
+        label = op.identify(_LabelPrinter())
+        self._addLine(op, label)
+        self._depth += 1
+        for literal in op.args:
+            literal.identify(self)
+        self._depth -= 1
+        return self.output
+
+
+    def onEquation(self, eq):
+        """Add a line for the Equation and process its root."""
+        self._addLine(eq, "%s = " % eq.name + eq.root.identify(Printer()))
+        skipthis = (self._eqpat is not None and eq.name and
+                    self._eqpat.match(eq.name))
+        if not skipthis:
+            self._depth += 1
+            eq.root.identify(self)
+            self._depth -= 1
+        return self.output
+
+
+    def _addLine(self, node, label):
+        """Format the statistics of a node."""
+        st = self._profiler.getStats(node)
+        if st is None:
+            counts = 5 * ("-",)
+            fmt = "%8s %8s %8s %10s %10s  %s%s"
+        else:
+            counts = (st["evaluations"], st["hits"], st["invalidations"],
+                    1e3 * st["time"], 1e3 * st["selftime"])
+            fmt = "%8i %8i %8i %10.3f %10.3f  %s%s"
+        if len(label) > 60:
+            label = label[:57] + "..."
+        indent = "  " * self._depth
+        self.lines.append(fmt % (counts + (indent, label)))
+        return
+
+# End class _ProfilePrinter
+
+
+class _LabelPrinter(Printer):
+    """Printer of an Operator expression, which keeps Equations by name."""
+
+    def onEquation(self, eq):
+        return self.onArgument(eq)
+
+# End class _LabelPrinter
+
+# End of file
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      Complex Modeling Initiative
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""Flat evaluation tape for Literal trees.
+
+An EvaluationTape is a linear, topologically ordered list of the Operator
+nodes of a Literal tree.  Each entry of the tape holds the operation, the
+slots of its inputs and the slot of its output.  Evaluating the tape computes
+the Operators from the leaves up without the recursion of Operator.getValue.
+
+The tape does not store any values of its own.  The output slots are the
+Operators themselves, so the tape honors the cached values and the dirty flags
+set by Literal._flush.  Only the Operators that were invalidated since the
+last evaluation are recomputed.
+
+The tape is a snapshot of the tree structure.  It must be rebuilt when the
+tree is modified, e.g., by adding literals to one of its Operators.  This is
+handled automatically for Equation.setRoot and Equation.swap.
+"""
+
+__all__ = ["EvaluationTape"]
+
+from diffpy.srfit.equation.visitors.visitor import Visitor
+
+
+class EvaluationTape(object):
+    """Linear evaluation program of a Literal tree.
+
+    Attributes
+    root    --  The root Literal of the compiled tree.
+    slots   --  List of the distinct Literals in the tree.  Leaves come in the
+                order of their first appearance, Operators follow their
+                inputs.
+    steps   --  List of (operation, inputs, output) tuples in the order of
+                evaluation.  inputs is a tuple of indices into slots, output
+                is the index of the Operator computed by the step.
+    """
+
+    def __init__(self, root):
+        """Compile the tree starting at root.
+
+        root    --  The root Literal of the tree to be compiled.
+        """
+        self.root = root
+        builder = _TapeBuilder()
+        root.identify(builder)
+        self.slots = builder.slots
+        self.steps = builder.steps
+        # Prepare the bound objects that are used in evaluation.
+        self._program = [(self.slots[o], op,
+                          tuple(self.slots[i].getValue for i in inputs))
+                         for op, inputs, o in self.steps]
+        return
+
+
+    def __len__(self):
+        """Number of steps on the tape."""
+        return len(self.steps)
+
+
+    def evaluate(self):
+        """Evaluate the tape and return the value of the root.
+
+        Operators with a valid cached value are skipped.
+        """
+        root = self.root
+        # Nothing to do when the root Operator is current.
+        if self._program and root._value is not None:
+            return root._value
+        for node, operation, getters in self._program:
+            if node._value is None:
+                node._value = operation(*[g() for g in getters])
+        return root.getValue()
+
+# End class EvaluationTape
+
+
+def _identity(value):
+    """Value of an Equation node is the value of its root."""
+    return value
+
+
+class _TapeBuilder(Visitor):
+    """Visitor that arranges the Literals of a tree in evaluation order.
+
+    Attributes
+    slots   --  List of the distinct Literals in evaluation order.
+    steps   --  List of (operation, inputs, output) tuples.
+    """
+
+    def __init__(self):
+        self.slots = []
+        self.steps = []
+        self._index = {}
+        return
+
+
+    def onArgument(self, arg):
+        """Process an Argument node."""
+        return self._slot(arg)
+
+
+    def onOperator(self, op):
+        """Process an Operator node."""
+        idx = self._index.get(id(op))
+        if idx is None:
+            inputs = tuple(lit.identify(self) for lit in op.args)
+            idx = self._slot(op)
+            self.steps.append((op.operation, inputs, idx))
+        return idx
+
+
+    def onEquation(self, eq):
+        """Process an Equation node.
+
+        An embedded Equation is inlined; its value is that of its root.
+        """
+        idx = self._index.get(id(eq))
+        if idx is None:
+            inputs = (eq.root.identify(self),)
+            idx = self._slot(eq)
+            self.steps.append((_identity, inputs, idx))
+        return idx
+
+
+    def _slot(self, literal):
+        """Return the slot index of a literal, allocate if necessary."""
+        idx = self._index.get(id(literal))
+        if idx is None:
+            idx = len(self.slots)
+            self._index[id(literal)] = idx
+            self.slots.append(literal)
+        return idx
+
+# End class _TapeBuilder
+
+# End of file
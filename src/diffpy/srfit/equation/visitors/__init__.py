@@ -25,10 +25,16 @@ The Literal-Visitor relationship is that described by the Visitor pattern
 
 from __future__ import print_function
 
+import numpy
+
 from diffpy.srfit.equation.visitors.argfinder import ArgFinder
 from diffpy.srfit.equation.visitors.printer import Printer
 from diffpy.srfit.equation.visitors.validator import Validator
 from diffpy.srfit.equation.visitors.swapper import Swapper
+from diffpy.srfit.equation.visitors.differentiator import Differentiator
+from diffpy.srfit.equation.visitors.affinedecomposer import AffineDecomposer
+from diffpy.srfit.equation.visitors.linearitychecker import LinearityChecker
+from diffpy.srfit.equation.visitors.batchevaluator import BatchEvaluator
 
 
 def getArgs(literal, getconsts = True):
@@ -91,3 +97,23 @@ def swap(literal, oldlit, newlit):
     v = Swapper(oldlit, newlit)
     literal.identify(v)
     return literal
+
+
+def getDerivatives(literal, args, step = 1e-8):
+    """Get derivatives of a Literal tree with respect to Arguments.
+
+    The derivatives are evaluated in the forward mode, see Differentiator.
+
+    args    --  Sequence of the Arguments to differentiate with respect to.
+    step    --  The fractional step size for operations that are
+                differentiated numerically (default 1e-8).
+
+    Returns a list of derivatives in the order of args.  Derivatives have
+    the shape of the literal value.
+    """
+    seeds = dict((a, {i : 1.0}) for i, a in enumerate(args))
+    v = Differentiator(seeds, step)
+    value, ders = literal.identify(v)
+    zero = numpy.zeros_like(value, dtype=float)
+    rv = [ders.get(i, zero) for i in range(len(args))]
+    return rv
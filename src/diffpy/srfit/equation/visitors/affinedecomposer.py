@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      Complex Modeling Initiative
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""AffineDecomposer visitor for finding affine Literal trees.
+
+The AffineDecomposer expresses a scalar Literal tree as a linear combination
+of its Arguments plus a constant offset.  Trees that use other than the
+addition, subtraction, negation, multiplication or division by a constant
+are not affine and give None.
+
+The constant terms are summed in the offset and the division by a constant
+is expressed as a multiplication by its reciprocal, therefore the form
+reproduces the tree value only up to the rounding errors.
+"""
+
+__all__ = ["AffineDecomposer"]
+
+import numpy
+
+from diffpy.srfit.equation.visitors.visitor import Visitor
+from diffpy.srfit.equation.visitors.differentiator import _target, _key
+
+
+class AffineDecomposer(Visitor):
+    """Visitor that decomposes an affine Literal tree.
+
+    The visiting methods return a (coefficients, offset) tuple, where
+    coefficients is a dictionary of the Argument coefficients indexed by id of
+    the Argument, or None when the tree is not affine.  Arguments are matched
+    through ParameterProxy.  Arguments flagged as const are taken as numbers.
+
+    Attributes
+    forms   --  Dictionary of (coefficients, offset) tuples that replace the
+                Arguments of the same id, e.g., constrained Parameters.
+    exclude --  Set of ids of the Arguments that make the tree not affine.
+    inputs  --  Dictionary of the visited Arguments indexed by their id.
+    """
+
+    def __init__(self, forms = None, exclude = ()):
+        """Initialize.
+
+        forms   --  Dictionary of (coefficients, offset) tuples that replace
+                    the Arguments of the same id.
+        exclude --  Ids of the Arguments that make the tree not affine.
+        """
+        self.forms = dict(forms or {})
+        self.exclude = set(exclude)
+        self.inputs = {}
+        return
+
+
+    def onArgument(self, arg):
+        """Process an Argument node."""
+        target = _target(arg)
+        key = id(target)
+        if key in self.exclude:
+            return None
+        form = self.forms.get(key)
+        if form is not None:
+            return form
+        value = arg.getValue()
+        if value is None or numpy.ndim(value) != 0:
+            return None
+        if arg.const:
+            return ({}, value)
+        self.inputs[key] = target
+        return ({key : 1.0}, 0.0)
+
+
+    def onOperator(self, op):
+        """Process an Operator node."""
+        rule = _rules.get(_key(op.operation))
+        if rule is None:
+            return None
+        forms = []
+        for lit in op.args:
+            form = lit.identify(self)
+            if form is None:
+                return None
+            forms.append(form)
+        return rule(*forms)
+
+
+    def onEquation(self, eq):
+        """Process an Equation node.
+
+        The form of an Equation is that of its root.
+        """
+        return eq.root.identify(self)
+
+# End class AffineDecomposer
+
+# Helper routines ------------------------------------------------------------
+
+def _linear(a, b, ca, cb):
+    """Linear combination ca * a + cb * b of affine forms."""
+    coefs = dict((k, ca * c) for k, c in a[0].items())
+    for k, c in b[0].items():
+        coefs[k] = coefs.get(k, 0.0) + cb * c
+    return (coefs, ca * a[1] + cb * b[1])
+
+
+def _scale(a, c):
+    """Multiply affine form by a number."""
+    coefs = dict((k, c * ck) for k, ck in a[0].items())
+    return (coefs, c * a[1])
+
+
+def _multiply(a, b):
+    if not a[0]:
+        return _scale(b, a[1])
+    if not b[0]:
+        return _scale(a, b[1])
+    return None
+
+
+def _divider(divide):
+    """Make division rule that evaluates constants with divide."""
+    def rule(a, b):
+        if b[0] or b[1] == 0:
+            return None
+        if not a[0]:
+            return ({}, divide(a[1], b[1]))
+        return _scale(a, 1.0 / b[1])
+    return rule
+
+
+_rules = {
+    numpy.add : lambda a, b : _linear(a, b, 1, 1),
+    numpy.subtract : lambda a, b : _linear(a, b, 1, -1),
+    numpy.negative : lambda a : _scale(a, -1),
+    numpy.multiply : _multiply,
+    numpy.divide : _divider(numpy.divide),
+    numpy.true_divide : _divider(numpy.true_divide),
+}
+
+# End of file
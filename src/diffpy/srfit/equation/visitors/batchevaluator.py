@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      Complex Modeling Initiative
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""BatchEvaluator visitor for evaluating Literal trees at many points.
+
+The BatchEvaluator evaluates a Literal tree for a population of Argument
+values at once.  The batched values have an extra leading axis, which is
+broadcast through the numpy ufuncs of the tree.  Subtrees that do not depend
+on the batched Arguments keep their ordinary value.  Trees where batched
+values reach other operations, such as sums, ProfileGenerators or custom
+functions, cannot be broadcast and give None.
+"""
+
+__all__ = ["BatchEvaluator"]
+
+import numpy
+
+from diffpy.srfit.equation.visitors.visitor import Visitor
+from diffpy.srfit.equation.visitors.differentiator import _target
+
+
+class BatchEvaluator(Visitor):
+    """Visitor that evaluates a Literal tree for batched Argument values.
+
+    The visiting methods return a (value, batched) tuple, where batched is
+    True when the value has the leading population axis, or None when the
+    tree cannot be broadcast.  Arguments are matched through
+    ParameterProxy.  The tree is not modified.
+
+    Attributes
+    values  --  Dictionary of the batched Argument values indexed by id of
+                the Argument.  The values have the population as the first
+                axis, scalars use shape (npop, 1).
+    _memo   --  Dictionary of the visited Operators and their results.
+    """
+
+    def __init__(self, values = None):
+        """Initialize.
+
+        values  --  Dictionary of the batched Argument values indexed by
+                    Argument id.
+        """
+        self.values = dict(values or {})
+        self._memo = {}
+        return
+
+
+    def onArgument(self, arg):
+        """Process an Argument node."""
+        value = self.values.get(id(_target(arg)))
+        if value is not None:
+            return (value, True)
+        return (arg.getValue(), False)
+
+
+    def onOperator(self, op):
+        """Process an Operator node."""
+        if id(op) in self._memo:
+            return self._memo[id(op)][1]
+        rv = None
+        inputs = [lit.identify(self) for lit in op.args]
+        if None not in inputs and not self._hasHiddenBatched(op):
+            if not any(b for v, b in inputs):
+                rv = (op.getValue(), False)
+            elif isinstance(op.operation, numpy.ufunc):
+                rv = (op.operation(*[v for v, b in inputs]), True)
+        # Keep a reference to op so its id cannot be reused.
+        self._memo[id(op)] = (op, rv)
+        return rv
+
+
+    def onEquation(self, eq):
+        """Process an Equation node.
+
+        The value of an Equation is that of its root.
+        """
+        return eq.root.identify(self)
+
+
+    def _hasHiddenBatched(self, op):
+        """Check if op uses batched Parameters that are not its arguments."""
+        if not hasattr(op, "iterPars"):
+            return False
+        return any(id(_target(par)) in self.values for par in op.iterPars())
+
+# End class BatchEvaluator
+
+# End of file
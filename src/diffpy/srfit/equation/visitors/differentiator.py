@@ -0,0 +1,360 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      Complex Modeling Initiative
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""Differentiator visitor for forward-mode differentiation of Literal trees.
+
+The Differentiator propagates derivative seeds from the Arguments of a Literal
+tree to its root.  Each node is visited once and yields its value and a
+dictionary of its derivatives indexed by the seed keys.  Derivatives are exact
+for the arithmetic operators, common numpy ufuncs, sum, array and polyval.
+
+Operators without a known derivative, such as ConvolutionOperator, custom
+functions or ProfileGenerators, are differentiated with a local central
+difference along the tangent of their inputs.  This evaluates only the
+operation of such node, not the whole tree.  Operators that compute from
+hidden Parameters (they have the iterPars method) are differentiated by
+perturbing those Parameters, unless they supply the derivatives through the
+operationDerivatives method.
+"""
+
+__all__ = ["Differentiator"]
+
+import numpy
+
+from diffpy.srfit.equation.literals.abcs import ArgumentABC
+from diffpy.srfit.equation.literals.operators import ArrayOperator
+from diffpy.srfit.equation.visitors.visitor import Visitor
+
+
+class Differentiator(Visitor):
+    """Differentiator for forward-mode derivatives of a Literal tree.
+
+    Attributes
+    step    --  The fractional step size for the local finite differences
+                (default 1e-8).
+    _seeds  --  Dictionary of derivative seeds indexed by id of the seeded
+                Argument.
+    _memo   --  Dictionary of the visited Operators and their results.
+
+    The visiting methods return a (value, derivatives) tuple, where
+    derivatives is a dictionary of the nonzero derivatives of the node indexed
+    by the seed keys.
+    """
+
+    def __init__(self, seeds, step = 1e-8):
+        """Initialize.
+
+        seeds   --  Dictionary of derivative seeds indexed by Argument.  Each
+                    seed is a dictionary of the Argument derivatives indexed
+                    by keys, e.g., indices of the differentiation variables.
+                    Arguments are matched through ParameterProxy.
+        step    --  The fractional step size for local finite differences
+                    (default 1e-8).
+        """
+        self.step = step
+        self._seeds = {}
+        for arg, seed in seeds.items():
+            self._seeds[id(_target(arg))] = seed
+        self._memo = {}
+        return
+
+
+    def reset(self):
+        """Clear the derivatives of visited nodes."""
+        self._memo = {}
+        return
+
+
+    def onArgument(self, arg):
+        """Process an Argument node."""
+        seed = self._seeds.get(id(_target(arg)), {})
+        return (arg.getValue(), seed)
+
+
+    def onOperator(self, op):
+        """Process an Operator node."""
+        rv = self._memo.get(id(op))
+        if rv is not None:
+            return rv[1]
+        inputs = [lit.identify(self) for lit in op.args]
+        hidden = self._getHiddenParameters(op)
+        vals = [v for v, d in inputs]
+        ders = [d for v, d in inputs]
+        if not (hidden or any(ders)):
+            value, ders = op.getValue(), {}
+        elif hidden:
+            ders = self._differentiateHidden(op, vals, ders, hidden)
+            value = op.getValue()
+        else:
+            rule = _rules.get(_key(op.operation))
+            if rule is None:
+                ders = self._differentiateNumerically(op, vals, ders, hidden)
+                value = op.getValue()
+            else:
+                value = op.getValue()
+                ders = rule(vals, ders, value)
+        ders = _broadcast(ders, value)
+        rv = (value, ders)
+        # Keep a reference to op so its id cannot be reused.
+        self._memo[id(op)] = (op, rv)
+        return rv
+
+
+    def onEquation(self, eq):
+        """Process an Equation node.
+
+        The derivatives of an Equation are those of its root.
+        """
+        rv = self._memo.get(id(eq))
+        if rv is not None:
+            return rv[1]
+        rv = eq.root.identify(self)
+        self._memo[id(eq)] = (eq, rv)
+        return rv
+
+
+    def _getHiddenParameters(self, op):
+        """Get seeded Parameters that op uses but that are not its arguments.
+
+        Returns a list of (Parameter, seed) pairs.
+        """
+        if not hasattr(op, "iterPars") or not self._seeds:
+            return []
+        argids = set(id(_target(a)) for a in op.args)
+        rv = []
+        for par in op.iterPars():
+            tid = id(_target(par))
+            if tid in argids or tid not in self._seeds:
+                continue
+            argids.add(tid)
+            rv.append((par, self._seeds[tid]))
+        return rv
+
+
+    def _differentiateHidden(self, op, vals, ders, hidden):
+        """Differentiate op that depends on hidden Parameters.
+
+        The derivatives with respect to the hidden Parameters are obtained
+        from the operationDerivatives method of op, when it is defined and
+        does not return None.  Otherwise op is differentiated numerically.
+
+        Returns the derivative dictionary of op.
+        """
+        getders = getattr(op, "operationDerivatives", None)
+        pders = None
+        if getders is not None:
+            pders = getders([par for par, seed in hidden])
+        if pders is None:
+            return self._differentiateNumerically(op, vals, ders, hidden)
+        rv = {}
+        if any(ders):
+            rv = self._differentiateNumerically(op, vals, ders, [])
+        terms = [(dp, seed) for dp, (par, seed) in zip(pders, hidden)]
+        return _combine((1, rv), *terms)
+
+
+    def _differentiateNumerically(self, op, vals, ders, hidden):
+        """Differentiate op with a central difference along input tangents.
+
+        op      --  The Operator to differentiate.
+        vals    --  The values of op arguments.
+        ders    --  The derivative dictionaries of op arguments.
+        hidden  --  List of (Parameter, seed) pairs used by op.
+
+        Returns the derivative dictionary of op.
+        """
+        keys = set()
+        for d in ders:
+            keys.update(d)
+        for par, seed in hidden:
+            keys.update(seed)
+        hvals = [par.getValue() for par, seed in hidden]
+        # The operation may store its own result, keep the cached value.
+        cached = op._value
+        rv = {}
+        try:
+            for k in keys:
+                targs = [d.get(k) for d in ders]
+                thids = [seed.get(k) for par, seed in hidden]
+                h = self._getStepSize(vals + hvals, targs + thids)
+                if h is None:
+                    continue
+                yp = self._perturbedOperation(op, vals, targs,
+                        hidden, hvals, thids, h)
+                ym = self._perturbedOperation(op, vals, targs,
+                        hidden, hvals, thids, -h)
+                rv[k] = (numpy.asarray(yp) - ym) / (2 * h)
+        finally:
+            for (par, seed), v in zip(hidden, hvals):
+                par.setValue(v)
+            op._value = cached
+        return rv
+
+
+    @staticmethod
+    def _perturbedOperation(op, vals, targs, hidden, hvals, thids, h):
+        """Evaluate the operation of op with inputs shifted by h * tangent."""
+        for (par, seed), v, t in zip(hidden, hvals, thids):
+            if t is not None:
+                par.setValue(v + h * t)
+        pvals = [v if t is None else v + h * t for v, t in zip(vals, targs)]
+        return op.operation(*pvals)
+
+
+    def _getStepSize(self, vals, tangents):
+        """Get the step size along tangents for the central difference.
+
+        The step changes the inputs by a fraction of their magnitude.
+
+        Returns None when all tangents are zero.
+        """
+        tmax = 0.0
+        vmax = 0.0
+        for v, t in zip(vals, tangents):
+            if t is None:
+                continue
+            tmax = max(tmax, numpy.max(numpy.abs(t)))
+            vmax = max(vmax, numpy.max(numpy.abs(v)))
+        if tmax == 0:
+            return None
+        return self.step * (vmax or 1.0) / tmax
+
+# End class Differentiator
+
+# Helper routines ------------------------------------------------------------
+
+def _target(arg):
+    """Get the Argument at the end of a chain of ParameterProxy objects."""
+    par = getattr(arg, "par", None)
+    while isinstance(par, ArgumentABC):
+        arg = par
+        par = getattr(arg, "par", None)
+    return arg
+
+
+def _key(operation):
+    """Get hashable key for operation to be used in the rules lookup."""
+    try:
+        hash(operation)
+    except TypeError:
+        return None
+    return operation
+
+
+def _broadcast(ders, value):
+    """Make the derivatives conform to the shape of the value."""
+    shape = numpy.shape(value)
+    for k, dk in ders.items():
+        if numpy.shape(dk) != shape:
+            ders[k] = numpy.broadcast_to(dk, shape)
+    return ders
+
+
+def _combine(*terms):
+    """Linear combination of derivative dictionaries.
+
+    terms   --  (coefficient, derivatives) pairs.  The coefficient may be
+                a scalar or an array.
+
+    Returns the combined derivative dictionary.
+    """
+    rv = {}
+    for c, d in terms:
+        for k, dk in d.items():
+            t = c * dk
+            rv[k] = rv[k] + t if k in rv else t
+    return rv
+
+
+def _unary(fprime):
+    """Make a derivative rule for a unary function.
+
+    fprime  --  function of (x, y) that returns dy/dx, where y = f(x).
+    """
+    def rule(vals, ders, value):
+        return _combine((fprime(vals[0], value), ders[0]))
+    return rule
+
+
+def _dpower(vals, ders, value):
+    x, p = vals
+    rv = _combine((p * numpy.power(x, p - 1.0), ders[0]))
+    if ders[1]:
+        rv = _combine((1, rv), (value * numpy.log(x), ders[1]))
+    return rv
+
+
+def _ddivide(vals, ders, value):
+    return _combine((1.0 / vals[1], ders[0]), (-value / vals[1], ders[1]))
+
+
+def _dmod(vals, ders, value):
+    return _combine((1, ders[0]), (-numpy.floor_divide(*vals), ders[1]))
+
+
+def _dsum(vals, ders, value):
+    return dict((k, numpy.sum(dk)) for k, dk in ders[0].items())
+
+
+def _darray(vals, ders, value):
+    keys = set()
+    for d in ders:
+        keys.update(d)
+    rv = {}
+    for k in keys:
+        rv[k] = numpy.array([d.get(k, numpy.zeros_like(v))
+            for v, d in zip(vals, ders)], dtype=float)
+    return rv
+
+
+def _dpolyval(vals, ders, value):
+    p, x = vals
+    rv = dict((k, numpy.polyval(dk, x)) for k, dk in ders[0].items())
+    if ders[1]:
+        dpdx = numpy.polyval(numpy.polyder(p), x)
+        rv = _combine((1, rv), (dpdx, ders[1]))
+    return rv
+
+
+_rules = {
+    numpy.add : lambda v, d, y : _combine((1, d[0]), (1, d[1])),
+    numpy.subtract : lambda v, d, y : _combine((1, d[0]), (-1, d[1])),
+    numpy.multiply : lambda v, d, y : _combine((v[1], d[0]), (v[0], d[1])),
+    numpy.divide : _ddivide,
+    numpy.true_divide : _ddivide,
+    numpy.power : _dpower,
+    numpy.mod : _dmod,
+    numpy.negative : _unary(lambda x, y : -1),
+    numpy.sin : _unary(lambda x, y : numpy.cos(x)),
+    numpy.cos : _unary(lambda x, y : -numpy.sin(x)),
+    numpy.tan : _unary(lambda x, y : 1 + y**2),
+    numpy.arcsin : _unary(lambda x, y : 1 / numpy.sqrt(1 - x**2)),
+    numpy.arccos : _unary(lambda x, y : -1 / numpy.sqrt(1 - x**2)),
+    numpy.arctan : _unary(lambda x, y : 1 / (1 + x**2)),
+    numpy.sinh : _unary(lambda x, y : numpy.cosh(x)),
+    numpy.cosh : _unary(lambda x, y : numpy.sinh(x)),
+    numpy.tanh : _unary(lambda x, y : 1 - y**2),
+    numpy.exp : _unary(lambda x, y : y),
+    numpy.exp2 : _unary(lambda x, y : y * numpy.log(2)),
+    numpy.expm1 : _unary(lambda x, y : y + 1),
+    numpy.log : _unary(lambda x, y : 1.0 / x),
+    numpy.log2 : _unary(lambda x, y : 1.0 / (x * numpy.log(2))),
+    numpy.log10 : _unary(lambda x, y : 1.0 / (x * numpy.log(10))),
+    numpy.log1p : _unary(lambda x, y : 1.0 / (1 + x)),
+    numpy.sqrt : _unary(lambda x, y : 0.5 / y),
+    numpy.square : _unary(lambda x, y : 2 * x),
+    numpy.reciprocal : _unary(lambda x, y : -y**2),
+    numpy.absolute : _unary(lambda x, y : numpy.sign(x)),
+    numpy.sum : _dsum,
+    numpy.polyval : _dpolyval,
+    ArrayOperator.operation : _darray,
+}
+
+# End of file
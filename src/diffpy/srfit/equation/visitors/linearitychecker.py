@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      Complex Modeling Initiative
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""LinearityChecker visitor for the degree of Literal trees.
+
+The LinearityChecker finds if a Literal tree is independent of, linear in or
+non-linear in a set of its Arguments.  Linear trees are built from addition,
+subtraction, negation, sums, arrays, multiplication by independent factors,
+division by independent values and polynomials with independent abscissa.
+The ConvolutionOperator normalizes its result, therefore it is not linear.
+"""
+
+__all__ = ["LinearityChecker"]
+
+import numpy
+
+from diffpy.srfit.equation.literals.operators import ArrayOperator
+from diffpy.srfit.equation.visitors.visitor import Visitor
+from diffpy.srfit.equation.visitors.differentiator import _target, _key
+
+
+class LinearityChecker(Visitor):
+    """Visitor that finds the degree of a Literal tree in some Arguments.
+
+    The visiting methods return 0 when the tree does not depend on the
+    Arguments, 1 when it is linear in them and None otherwise.  Arguments are
+    matched through ParameterProxy.
+
+    Attributes
+    ids     --  Set of ids of the Arguments that are checked.
+    degrees --  Dictionary of the degrees of other Arguments indexed by
+                their id, e.g., of the constrained Parameters.
+    _memo   --  Dictionary of the visited Operators and their degrees.
+    """
+
+    def __init__(self, ids, degrees = None):
+        """Initialize.
+
+        ids     --  Ids of the Arguments that are checked.
+        degrees --  Dictionary of the degrees of other Arguments indexed by
+                    their id.
+        """
+        self.ids = set(ids)
+        self.degrees = dict(degrees or {})
+        self._memo = {}
+        return
+
+
+    def onArgument(self, arg):
+        """Process an Argument node."""
+        key = id(_target(arg))
+        if key in self.ids:
+            return 1
+        return self.degrees.get(key, 0)
+
+
+    def onOperator(self, op):
+        """Process an Operator node."""
+        if id(op) in self._memo:
+            return self._memo[id(op)][1]
+        degrees = [lit.identify(self) for lit in op.args]
+        if None in degrees:
+            rv = None
+        elif self._hasHiddenArguments(op):
+            rv = None
+        else:
+            rule = _rules.get(_key(op.operation))
+            if rule is not None:
+                rv = rule(*degrees)
+            else:
+                rv = 0 if not any(degrees) else None
+        # Keep a reference to op so its id cannot be reused.
+        self._memo[id(op)] = (op, rv)
+        return rv
+
+
+    def onEquation(self, eq):
+        """Process an Equation node.
+
+        The degree of an Equation is that of its root.
+        """
+        return eq.root.identify(self)
+
+
+    def _hasHiddenArguments(self, op):
+        """Check if op uses checked Parameters that are not its arguments."""
+        if not hasattr(op, "iterPars"):
+            return False
+        for par in op.iterPars():
+            key = id(_target(par))
+            if key in self.ids or self.degrees.get(key, 0) != 0:
+                return True
+        return False
+
+# End class LinearityChecker
+
+# Helper routines ------------------------------------------------------------
+
+def _max(*degrees):
+    return max(degrees) if degrees else 0
+
+
+def _product(*degrees):
+    d = sum(degrees)
+    return d if d <= 1 else None
+
+
+def _quotient(da, db):
+    return da if db == 0 else None
+
+
+def _polyval(dp, dx):
+    return dp if dx == 0 else None
+
+
+_rules = {
+    numpy.add : _max,
+    numpy.subtract : _max,
+    numpy.negative : _max,
+    numpy.sum : _max,
+    ArrayOperator.operation : _max,
+    numpy.multiply : _product,
+    numpy.divide : _quotient,
+    numpy.true_divide : _quotient,
+    numpy.polyval : _polyval,
+}
+
+# End of file
@@ -28,9 +28,11 @@ Various code and design taken from Paul Kienzle's PARK package.
 http://www.reflectometry.org/danse/park.html
 """
 
-__all__ = ['Calculator', 'FitContribution', 'FitHook', 'FitRecipe',
-           'FitResults', 'initializeRecipe', 'PlotFitHook', 'Profile',
-           'ProfileGenerator', 'SimpleRecipe']
+__all__ = ['Calculator', 'CheckpointFitHook', 'FitContribution', 'FitHook',
+           'FitRecipe', 'FitResults', 'FitService', 'initializeRecipe',
+           'multiStart', 'PlotFitHook', 'Profile', 'ProfileGenerator',
+           'RecipeSnapshot', 'restoreCheckpoint', 'SeriesRefinement',
+           'SimpleRecipe', 'TelemetryFitHook']
 
 from diffpy.srfit.fitbase.calculator import Calculator
 from diffpy.srfit.fitbase.fitcontribution import FitContribution
@@ -38,6 +40,13 @@ from diffpy.srfit.fitbase.fithook import FitHook, PlotFitHook
 from diffpy.srfit.fitbase.fitrecipe import FitRecipe
 from diffpy.srfit.fitbase.simplerecipe import SimpleRecipe
 from diffpy.srfit.fitbase.fitresults import FitResults, initializeRecipe
+from diffpy.srfit.fitbase.multistart import multiStart
+from diffpy.srfit.fitbase.series import SeriesRefinement
+from diffpy.srfit.fitbase.checkpoint import CheckpointFitHook
+from diffpy.srfit.fitbase.checkpoint import restoreCheckpoint
+from diffpy.srfit.fitbase.telemetry import TelemetryFitHook
+from diffpy.srfit.fitbase.snapshot import RecipeSnapshot
+from diffpy.srfit.fitbase.fitservice import FitService
 from diffpy.srfit.fitbase.profile import Profile
 from diffpy.srfit.fitbase.profilegenerator import ProfileGenerator
 
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      Complex Modeling Initiative
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""Evaluation of affine constraints as a sparse matrix transform.
+
+Constraints such as x_3 = 1 - x_1 or b = a are affine functions of their
+input Parameters.  The AffineConstraints class evaluates a group of them with
+a single product of a sparse matrix and the input values.  Affine constraints
+that use other affine constraints are expressed directly in their inputs, so
+the whole group is updated at once.  The findAffineConstraints function
+splits a list of Constraints into the affine group and the rest.  The
+affineTransform function builds the matrix transform for any affine forms.
+
+The matrix transform gives the values of the constraint Equations up to the
+rounding errors, but not bit for bit.  The constant terms are summed into
+the offset when the recipe is prepared, a division by a constant is applied
+as a multiplication by its reciprocal, and the products are summed in the
+order of the matrix columns.  For example, the constraint b = a / 3 gives
+a * (1.0 / 3), which can differ from a / 3 in the last digit.
+"""
+
+__all__ = ["AffineConstraints", "affineTransform", "findAffineConstraints"]
+
+import numpy
+
+from diffpy.srfit.equation.visitors import AffineDecomposer
+from diffpy.srfit.equation.visitors.differentiator import _target
+
+
+class AffineConstraints(object):
+    """Group of affine Constraints evaluated as a sparse matrix transform.
+
+    Attributes
+    constraints --  List of the affine Constraints.
+    inputs      --  List of the input Arguments of the constraints.
+    matrix      --  scipy.sparse.csr_matrix of the coefficients with a row
+                    for every constraint and a column for every input.
+    offset      --  Array of the constant terms of the constraints.
+    _columns    --  List of the row indices of the nonzero coefficients in
+                    every column of matrix.
+    _values     --  Array of the input values from the last update or None.
+    """
+
+    def __init__(self, constraints, forms, inputs):
+        """Initialize the matrix transform.
+
+        constraints --  List of the affine Constraints.
+        forms       --  List of the (coefficients, offset) tuples of the
+                        constraints from AffineDecomposer.
+        inputs      --  Dictionary of the input Arguments indexed by their
+                        id, as in AffineDecomposer.inputs.
+        """
+        self.constraints = list(constraints)
+        self.matrix, self.offset, self.inputs = affineTransform(forms, inputs)
+        csc = self.matrix.tocsc()
+        self._columns = [csc.indices[csc.indptr[j]:csc.indptr[j + 1]]
+                for j in range(self.matrix.shape[1])]
+        self._values = None
+        return
+
+
+    def update(self):
+        """Update the constraints with changed inputs.
+
+        The constraints are updated when their inputs change or when they
+        are stale, see Constraint.stale.
+
+        Returns the number of updated constraints.
+        """
+        values = numpy.array([a.getValue() for a in self.inputs],
+                dtype=float)
+        if self._values is None:
+            rows = set(range(len(self.constraints)))
+        else:
+            rows = set()
+            for j in numpy.flatnonzero(values != self._values):
+                rows.update(self._columns[j])
+        self._values = values
+        rows.update(i for i, con in enumerate(self.constraints) if con.stale)
+        if not rows:
+            return 0
+        if len(rows) == len(self.constraints):
+            rows = range(len(self.constraints))
+            y = self.matrix.dot(values) + self.offset
+        else:
+            rows = sorted(rows)
+            y = self.matrix[rows].dot(values) + self.offset[rows]
+        for i, yi in zip(rows, y):
+            con = self.constraints[i]
+            con.par.setValue(yi)
+            con.stale = False
+        return len(rows)
+
+# End class AffineConstraints
+
+
+def affineTransform(forms, inputs):
+    """Build the sparse matrix transform of affine forms.
+
+    forms   --  List of the (coefficients, offset) tuples from
+                AffineDecomposer.
+    inputs  --  Dictionary of the input Arguments indexed by their id, as in
+                AffineDecomposer.inputs.
+
+    Returns a (matrix, offset, arguments) tuple, where matrix is a
+    scipy.sparse.csr_matrix with a row for every form and a column for every
+    used input, offset is an array of the constant terms and arguments is
+    the list of the inputs in the column order.
+    """
+    from scipy.sparse import csr_matrix
+    columns = {}
+    arguments = []
+    rows, cols, data = [], [], []
+    for i, (coefs, offset) in enumerate(forms):
+        for key, c in coefs.items():
+            if key not in columns:
+                columns[key] = len(arguments)
+                arguments.append(inputs[key])
+            rows.append(i)
+            cols.append(columns[key])
+            data.append(c)
+    shape = (len(forms), len(arguments))
+    matrix = csr_matrix((data, (rows, cols)), shape=shape, dtype=float)
+    offset = numpy.array([offset for coefs, offset in forms], dtype=float)
+    return (matrix, offset, arguments)
+
+
+def findAffineConstraints(constraints):
+    """Find the affine Constraints that can be evaluated as a group.
+
+    constraints --  List of Constraints sorted in the dependency order.
+
+    A constraint is affine when its equation is affine and it does not use
+    constrained Parameters with non-affine constraints.
+
+    Returns an (affine, other) tuple, where affine is an AffineConstraints
+    instance or None when there are no affine constraints and other is the
+    list of the remaining constraints in the dependency order.
+    """
+    visitor = AffineDecomposer()
+    affine = []
+    forms = []
+    other = []
+    for con in constraints:
+        form = None
+        if numpy.ndim(con.par.getValue()) == 0:
+            form = con.eq.identify(visitor)
+        key = id(_target(con.par))
+        if form is None:
+            other.append(con)
+            visitor.exclude.add(key)
+        else:
+            affine.append(con)
+            forms.append(form)
+            visitor.forms[key] = form
+    if not affine:
+        return (None, other)
+    return (AffineConstraints(affine, forms, visitor.inputs), other)
+
+# End of file
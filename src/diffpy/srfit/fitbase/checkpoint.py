@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      Complex Modeling Initiative
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""Checkpoints of a FitRecipe refinement.
+
+The CheckpointFitHook saves the state of a refinement to a small JSON file at
+a configurable time interval.  The state consists of the variable values, the
+fixed and linear variables, the Constraints and Restraints defined in the
+FitRecipe and the progress of the refinement, i.e., the number of residual
+calls and the best variable values so far.  The restoreCheckpoint function
+puts a configured FitRecipe back in the saved state, so the refinement can
+continue.
+
+The checkpoint does not contain the data or the structure of the recipe.
+Constraints and Restraints of the FitContributions and ParameterSets, such as
+the space group constraints, are created by the script that configures the
+recipe and are not saved.
+"""
+
+__all__ = ["CheckpointFitHook", "getCheckpointState", "restoreCheckpoint"]
+
+import os
+import time
+import json
+
+import numpy
+
+from diffpy.srfit.fitbase.fithook import FitHook
+
+
+class CheckpointFitHook(FitHook):
+    """FitHook that saves checkpoints of a refinement.
+
+    The checkpoint is written after the residual calculation when at least
+    interval seconds passed since the last one.  It is written to a
+    temporary file, which then replaces the old one.  The replacement is
+    atomic on POSIX systems and with os.replace, when it is available.
+    Otherwise on Windows the old file is removed before the rename, so a
+    crash in between loses the checkpoint.  The cost of the writing does
+    not depend on the size of the data, it is proportional to the number
+    of variables, Constraints and Restraints.
+
+    Attributes
+    filename    --  The name of the checkpoint file.
+    interval    --  The minimum time in seconds between checkpoints
+                    (default 60).
+    count       --  The number of residual calls since the last reset.
+    nsaved      --  The number of written checkpoints.
+    bestchi2    --  The lowest chi2 since the last reset.
+    bestvalues  --  The values of all recipe variables at bestchi2.
+    _lastsave   --  The time of the last checkpoint.
+    """
+
+    def __init__(self, filename, interval = 60):
+        """Initialize the attributes.
+
+        filename    --  The name of the checkpoint file.
+        interval    --  The minimum time in seconds between checkpoints
+                        (default 60).
+        """
+        self.filename = filename
+        self.interval = interval
+        self.count = 0
+        self.nsaved = 0
+        self.bestchi2 = None
+        self.bestvalues = None
+        self._lastsave = time.time()
+        return
+
+
+    def reset(self, recipe):
+        """Reset the progress of the refinement.
+
+        This is called whenever the recipe configuration changes.
+        """
+        self.count = 0
+        self.bestchi2 = None
+        self.bestvalues = None
+        return
+
+
+    def postcall(self, recipe, chiv):
+        """Track the best values and save a checkpoint when it is due.
+
+        recipe  --  The FitRecipe instance
+        chiv    --  The residual vector
+        """
+        self.count += 1
+        chi2 = numpy.dot(chiv, chiv)
+        if self.bestchi2 is None or chi2 < self.bestchi2:
+            self.bestchi2 = chi2
+            self.bestvalues = [_jsonValue(v.value)
+                    for v in recipe._parameters.values()]
+        if time.time() - self._lastsave >= self.interval:
+            self.save(recipe, chi2)
+        return
+
+
+    def save(self, recipe, chi2 = None):
+        """Write the checkpoint of the recipe now.
+
+        recipe  --  The FitRecipe instance
+        chi2    --  The chi2 at the current values or None when unknown.
+        """
+        state = getCheckpointState(recipe)
+        state.update(count=self.count, chi2=chi2, bestchi2=self.bestchi2,
+                bestvalues=self.bestvalues, time=time.time())
+        tmpname = self.filename + ".tmp"
+        with open(tmpname, "w") as fp:
+            json.dump(state, fp)
+        replace = getattr(os, "replace", None)
+        if replace is None:
+            if os.name == "nt" and os.path.exists(self.filename):
+                os.remove(self.filename)
+            replace = os.rename
+        replace(tmpname, self.filename)
+        self.nsaved += 1
+        self._lastsave = time.time()
+        return
+
+# End class CheckpointFitHook
+
+
+def getCheckpointState(recipe):
+    """Get the restorable state of a FitRecipe.
+
+    Returns a dictionary with the "names", "values", "fixed" and "linear"
+    lists of the variables, "constraints" list of (path, equation) pairs and
+    "restraints" list of (equation, lb, ub, sig, scaled) tuples.  The path is
+    the dot-separated location of the constrained Parameter in the recipe.
+    Constraints of Parameters outside of the recipe and Constraints and
+    Restraints without the equation string are not included.
+    """
+    tm = recipe._tagmanager
+    variables = recipe._parameters.values()
+    constraints = []
+    for par, con in recipe._constraints.items():
+        key = _constraintKey(recipe, par, con)
+        if key is not None:
+            constraints.append(key)
+    constraints.sort()
+    restraints = sorted(_restraintKey(res) for res in recipe._restraints
+            if _restraintKey(res) is not None)
+    rv = dict(
+        names=[v.name for v in variables],
+        values=[_jsonValue(v.value) for v in variables],
+        fixed=[v.name for v in variables if tm.hasTags(v, recipe._fixedtag)],
+        linear=[v.name for v in variables
+            if tm.hasTags(v, recipe._lineartag)],
+        constraints=constraints,
+        restraints=restraints)
+    return rv
+
+
+def restoreCheckpoint(recipe, filename, best = False):
+    """Restore a FitRecipe to the state saved by CheckpointFitHook.
+
+    The recipe must be configured with the same variables as when the
+    checkpoint was written.  The Constraints and Restraints of the recipe are
+    made the same as in the checkpoint, then the variable values and the
+    fixed and linear variables are restored.
+
+    recipe      --  The configured FitRecipe.
+    filename    --  The name of the checkpoint file.
+    best        --  Restore the best values from the checkpoint instead of
+                    the last ones (default False).
+
+    Returns the dictionary of the checkpoint, see getCheckpointState.  The
+    progress of the refinement is in the "count", "chi2", "bestchi2",
+    "bestvalues" and "time" items.
+    Raises ValueError if the recipe variables do not match the checkpoint.
+    """
+    with open(filename) as fp:
+        state = json.load(fp)
+    names = recipe._parameters.keys()
+    if state["names"] != names:
+        emsg = "Variables in %r do not match the recipe." % filename
+        raise ValueError(emsg)
+    current = getCheckpointState(recipe)
+    # Constraints
+    saved = set(tuple(c) for c in state["constraints"])
+    for par, con in recipe._constraints.items():
+        key = _constraintKey(recipe, par, con)
+        if key is not None and key not in saved:
+            recipe.unconstrain(par)
+    for path, eqstr in saved.difference(map(tuple, current["constraints"])):
+        par = reduce(getattr, path.split("."), recipe)
+        recipe.constrain(par, eqstr)
+    # Restraints
+    saved = set(tuple(r) for r in state["restraints"])
+    for res in list(recipe._restraints):
+        key = _restraintKey(res)
+        if key is not None and key not in saved:
+            recipe.unrestrain(res)
+    for eqstr, lb, ub, sig, scaled in saved.difference(
+            map(tuple, current["restraints"])):
+        recipe.restrain(eqstr, lb, ub, sig, scaled)
+    # Variables
+    values = state["bestvalues"] if best and state.get("bestvalues") \
+            else state["values"]
+    with recipe.batchUpdate():
+        for var, value in zip(recipe._parameters.values(), values):
+            var.setValue(value)
+    recipe.free("all")
+    if state["fixed"]:
+        recipe.fix(*state["fixed"])
+    recipe.setNonlinear("all")
+    if state["linear"]:
+        recipe.setLinear(*state["linear"])
+    return state
+
+# Helper routines ------------------------------------------------------------
+
+def _jsonValue(value):
+    """Convert a Parameter value to a JSON compatible object."""
+    return numpy.asarray(value).tolist()
+
+
+def _constraintKey(recipe, par, con):
+    """Return the (path, equation) pair of a Constraint or None."""
+    eqstr = getattr(con, "eqstr", None)
+    loc = recipe._locateManagedObject(par)
+    if eqstr is None or not loc:
+        return None
+    return (".".join(obj.name for obj in loc[1:]), eqstr)
+
+
+def _restraintKey(res):
+    """Return the (equation, lb, ub, sig, scaled) tuple of a Restraint."""
+    eqstr = getattr(res, "eqstr", None)
+    if eqstr is None:
+        return None
+    return (eqstr, res.lb, res.ub, res.sig, res.scaled)
+
+# End of file
@@ -37,6 +37,8 @@ class Constraint(Validatable):
     par     --  A Parameter that is the subject of the constraint.
     eq      --  An equation whose evaluation is used to set the value of the
                 constraint.
+    stale   --  Flag for changes of eq or par since the last update.  The
+                Constraint observes both of them.
 
     """
 
@@ -44,6 +46,7 @@ class Constraint(Validatable):
         """Initialization. """
         self.par = None
         self.eq = None
+        self.stale = True
         return
 
     def constrain(self, par, eq):
@@ -66,14 +69,19 @@ class Constraint(Validatable):
 
         self.par = par
         self.eq = eq
+        par.addObserver(self._flush)
+        eq.addObserver(self._flush)
         self.update()
         return
 
     def unconstrain(self):
         """Clear the constraint."""
         self.par.constrained = False
+        self.par.removeObserver(self._flush)
+        self.eq.removeObserver(self._flush)
         self.par = None
         self.eq = None
+        self.stale = True
         return
 
     def update(self):
@@ -83,6 +91,12 @@ class Constraint(Validatable):
         # This will only change the Parameter if val is different from the
         # currently stored value.
         self.par.setValue(val)
+        self.stale = False
+        return
+
+    def _flush(self, other):
+        """Mark the constraint for update."""
+        self.stale = True
         return
 
     def _validate(self):
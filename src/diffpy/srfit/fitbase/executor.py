@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      Complex Modeling Initiative
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""Executors for evaluating the FitContributions of a FitRecipe.
+
+An executor is called by FitRecipe.residual to calculate the residual arrays
+of all FitContributions.  The executor is set with FitRecipe.setExecutor.
+The residual arrays are always returned in the order of the FitContributions
+in the recipe, so the assembled residual does not depend on the executor.
+
+SerialExecutor      --  Evaluate the FitContributions one after another.
+                        This is the default.
+ThreadExecutor      --  Evaluate the FitContributions in a pool of threads.
+                        This is useful when the calculation releases the GIL,
+                        as do most numpy and srreal calculators.
+ProcessExecutor     --  Evaluate the FitContributions in worker processes
+                        that keep replicas of the recipe.  Only the changed
+                        variable values are sent to the workers.
+"""
+
+__all__ = ["ContributionExecutor", "SerialExecutor", "ThreadExecutor",
+           "ProcessExecutor"]
+
+import time
+
+import numpy
+
+from diffpy.srfit.exceptions import SrFitError
+
+
+class ContributionExecutor(object):
+    """Base class for evaluating the FitContributions of a FitRecipe.
+
+    The methods of this class are called by the FitRecipe.  See the method
+    descriptions for their purpose.
+    """
+
+    def reset(self, recipe):
+        """Reset the executor for the current recipe configuration.
+
+        This is called from FitRecipe._prepare, which is whenever a
+        configurational change to the fit hierarchy takes place.
+
+        recipe  --  The FitRecipe instance
+        """
+        return
+
+
+    def residuals(self, recipe):
+        """Calculate the residual arrays of the FitContributions.
+
+        This is called within FitRecipe.residual after the variables and
+        the constraints have been updated.
+
+        recipe  --  The FitRecipe instance
+
+        Returns a list of residual arrays in the order of the
+        FitContributions.
+        """
+        raise NotImplementedError
+
+
+    def close(self):
+        """Release the threads or processes used by the executor."""
+        return
+
+# End class ContributionExecutor
+
+
+class SerialExecutor(ContributionExecutor):
+    """Evaluate the FitContributions one after another."""
+
+    def residuals(self, recipe):
+        """Calculate the residual arrays of the FitContributions.
+
+        recipe  --  The FitRecipe instance
+
+        Returns a list of residual arrays in the order of the
+        FitContributions.
+        """
+        return [con.residual() for con in recipe._contributions.values()]
+
+# End class SerialExecutor
+
+
+class ThreadExecutor(ContributionExecutor):
+    """Evaluate the FitContributions in a pool of threads.
+
+    The FitContributions should not share ProfileGenerators or Calculators,
+    because these would be evaluated concurrently.
+
+    Attributes
+    workers --  The number of threads.  Use the number of CPUs when None
+                (default).
+    _pool   --  The thread pool, created on demand.
+    """
+
+    def __init__(self, workers = None):
+        """Initialize the attributes.
+
+        workers --  The number of threads.  Use the number of CPUs when None
+                    (default).
+        """
+        self.workers = workers
+        self._pool = None
+        return
+
+
+    def residuals(self, recipe):
+        """Calculate the residual arrays of the FitContributions.
+
+        recipe  --  The FitRecipe instance
+
+        Returns a list of residual arrays in the order of the
+        FitContributions.
+        """
+        contributions = recipe._contributions.values()
+        if len(contributions) < 2:
+            return [con.residual() for con in contributions]
+        if self._pool is None:
+            from multiprocessing.pool import ThreadPool
+            self._pool = ThreadPool(self.workers)
+        return self._pool.map(_contributionResidual, contributions)
+
+
+    def close(self):
+        """Release the threads used by the executor."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        return
+
+
+    def __getstate__(self):
+        """Return the state for pickling, the threads are not copied."""
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        return state
+
+# End class ThreadExecutor
+
+
+class ProcessExecutor(ContributionExecutor):
+    """Evaluate the FitContributions in worker processes.
+
+    Each worker process receives a pickled replica of the recipe when the
+    executor is reset and evaluates a fixed subset of the FitContributions.
+    For every residual call only the recipe variables whose values changed
+    since the last call are sent to the workers.  Changes in the Parameters
+    that are not recipe variables reach the workers only after a
+    configuration change of the recipe.
+
+    The Profiles of the FitContributions in the calling process are not
+    updated with the calculated signal.  Use FitContribution.evaluate to
+    update them.
+
+    Attributes
+    workers --  The number of worker processes.  Use the number of CPUs
+                when None (default).
+    timeout --  The time in seconds that close waits for the workers to
+                stop.  The workers that are still running are terminated.
+    _procs  --  List of (process, connection) pairs for the workers.
+    _values --  Array of the variable values sent to the workers.
+    """
+
+    def __init__(self, workers = None, timeout = 5):
+        """Initialize the attributes.
+
+        workers --  The number of worker processes.  Use the number of CPUs
+                    when None (default).
+        timeout --  The time in seconds that close waits for the workers to
+                    stop (default 5).
+        """
+        self.workers = workers
+        self.timeout = timeout
+        self._procs = []
+        self._values = None
+        return
+
+
+    def reset(self, recipe):
+        """Start worker processes with replicas of the recipe.
+
+        recipe  --  The FitRecipe instance
+        """
+        import multiprocessing
+        from diffpy.srfit.fitbase.snapshot import RecipeSnapshot
+        self.close()
+        n = len(recipe._contributions)
+        nproc = self.workers or multiprocessing.cpu_count()
+        nproc = max(1, min(nproc, n))
+        snapshot = RecipeSnapshot(recipe)
+        for i in range(nproc):
+            indices = range(i, n, nproc)
+            conn, child = multiprocessing.Pipe()
+            proc = multiprocessing.Process(target=_replicaWorker,
+                    args=(child, snapshot, indices))
+            proc.daemon = True
+            proc.start()
+            child.close()
+            self._procs.append((proc, conn))
+        self._values = numpy.array([v.value
+            for v in recipe._parameters.values()], dtype=float)
+        return
+
+
+    def residuals(self, recipe):
+        """Calculate the residual arrays of the FitContributions.
+
+        recipe  --  The FitRecipe instance
+
+        Returns a list of residual arrays in the order of the
+        FitContributions.
+
+        Raises SrFitError if the calculation fails in a worker process.
+        """
+        if not self._procs:
+            self.reset(recipe)
+        values = numpy.array([v.value
+            for v in recipe._parameters.values()], dtype=float)
+        changed = numpy.flatnonzero(values != self._values)
+        message = (changed, values[changed])
+        rv = [None] * len(recipe._contributions)
+        errors = []
+        try:
+            for proc, conn in self._procs:
+                conn.send(message)
+            self._values = values
+            replies = [conn.recv() for proc, conn in self._procs]
+        except (IOError, EOFError):
+            # A worker process died, start over in the next call.
+            self.close()
+            emsg = "Residual calculation failed, worker process has died."
+            raise SrFitError(emsg)
+        for status, result in replies:
+            if status == "error":
+                errors.append(result)
+                continue
+            for i, res in result:
+                rv[i] = res
+        if errors:
+            # The worker state is unknown, start over in the next call.
+            self.close()
+            emsg = "Residual calculation failed in worker process.\n"
+            raise SrFitError(emsg + "\n".join(errors))
+        return rv
+
+
+    def close(self):
+        """Stop the worker processes.
+
+        The workers that do not stop within the timeout, e.g., in a long
+        calculation, are terminated.
+        """
+        for proc, conn in self._procs:
+            try:
+                conn.send(None)
+            except (IOError, EOFError):
+                pass
+        deadline = time.time() + self.timeout
+        for proc, conn in self._procs:
+            proc.join(max(0, deadline - time.time()))
+            if proc.is_alive():
+                proc.terminate()
+                proc.join()
+            conn.close()
+        self._procs = []
+        self._values = None
+        return
+
+
+    def __getstate__(self):
+        """Return the state for pickling, the workers are not copied."""
+        state = self.__dict__.copy()
+        state['_procs'] = []
+        state['_values'] = None
+        return state
+
+# End class ProcessExecutor
+
+# Helper routines ------------------------------------------------------------
+
+def _contributionResidual(con):
+    """Return the residual of FitContribution con."""
+    return con.residual()
+
+
+def _replicaWorker(conn, snapshot, indices):
+    """Evaluate FitContributions of a recipe replica in a worker process.
+
+    conn        --  Connection to the parent process.  Each message is a
+                    pair of arrays with the indices and the new values of
+                    the changed recipe variables.  None stops the worker.
+    snapshot    --  RecipeSnapshot of the FitRecipe.
+    indices     --  Indices of the FitContributions evaluated by the worker.
+    """
+    import traceback
+    recipe = snapshot.load()
+    recipe._executor = SerialExecutor()
+    variables = recipe._parameters.values()
+    contributions = recipe._contributions.values()
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        try:
+            for i, value in zip(*message):
+                variables[i].setValue(value)
+            recipe._updateConstraints()
+            result = [(i, contributions[i].residual()) for i in indices]
+            conn.send(("ok", result))
+        except Exception:
+            conn.send(("error", traceback.format_exc()))
+    conn.close()
+    return
+
+# End of file
@@ -25,6 +25,9 @@ See the examples in the documention for how to use a FitContribution.
 
 __all__ = ["FitContribution"]
 
+import numpy
+
+from diffpy.srfit.equation.visitors import Differentiator
 from diffpy.srfit.fitbase.parameterset import ParameterSet
 from diffpy.srfit.fitbase.recipeorganizer import equationFromString
 from diffpy.srfit.fitbase.parameter import ParameterProxy
@@ -307,6 +310,45 @@ class FitContribution(ParameterSet):
         return self._reseq()
 
 
+    def jacobian(self, seeds, n, step = 1e-8):
+        """Calculate the derivatives of the residual for this fitcontribution.
+
+        The derivatives are propagated in the forward mode through the
+        residual equation, see diffpy.srfit.equation.visitors.Differentiator.
+
+        seeds   --  Dictionary of derivative seeds indexed by Parameter.  Each
+                    seed is a dictionary of the Parameter derivatives indexed
+                    by the variable index in range(n).
+        n       --  The number of variables.
+        step    --  The fractional step size for operations and
+                    ProfileGenerators that are differentiated numerically
+                    (default 1e-8).
+
+        Returns a 2D array of shape (len(residual), n) with the derivatives of
+        the flattened residual array.
+        """
+        value, ders = self._residualDerivatives(seeds, step)
+        jac = numpy.zeros((numpy.size(value), n), dtype=float)
+        for k, dk in ders.items():
+            jac[:, k] = numpy.ravel(dk)
+        return jac
+
+
+    def _residualDerivatives(self, seeds, step = 1e-8):
+        """Calculate the residual and its nonzero derivatives.
+
+        seeds   --  Dictionary of derivative seeds, see jacobian.
+        step    --  The fractional step size for numeric derivatives
+                    (default 1e-8).
+
+        Returns a (value, ders) tuple of the residual array and a dictionary
+        of the derivatives indexed by the variable index.  Only the variables
+        that affect the residual are present in ders.
+        """
+        self.profile.ycalc = self._eq()
+        return self._reseq.identify(Differentiator(seeds, step))
+
+
     def evaluate(self):
         """Evaluate the contribution equation and update profile.ycalc.
         """
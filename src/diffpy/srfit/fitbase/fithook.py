@@ -39,8 +39,15 @@ class FitHook(object):
     FitRecipe for refinement, and during the residual call. See the class
     methods for a description of their purpose.
 
+    Attributes
+
+    stages  --  Class attribute, the stage method is called by the FitRecipe
+                only when this is True (default False).
+
     """
 
+    stages = False
+
     def reset(self, recipe):
         """Reset the hook data.
 
@@ -68,6 +75,22 @@ class FitHook(object):
         """
         return
 
+    def stage(self, recipe, name, index = -1):
+        """This is called within FitRecipe.residual after each stage.
+
+        The stages are "update" of the variables and constraints, then
+        "contribution" for each FitContribution or "contributions" when the
+        FitContributions are evaluated by a parallel executor, and
+        "restraints".  The contribution stages are skipped when the residual
+        is found in the cache.
+
+        recipe  --  The FitRecipe instance
+        name    --  The name of the finished stage
+        index   --  The index of the FitContribution or -1
+
+        """
+        return
+
 # End class FitHook
 
 class PrintFitHook(FitHook):
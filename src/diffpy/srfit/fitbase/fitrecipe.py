@@ -34,14 +34,26 @@ using FitRecipe.
 
 __all__ = ["FitRecipe"]
 
-from collections import OrderedDict
-from numpy import array, concatenate, sqrt, dot
-
+import time
+from collections import OrderedDict, deque
+from numpy import array, concatenate, sqrt, dot, zeros, nan
+from numpy import empty, multiply, ravel, size, broadcast_to
+from numpy import arange, full, flatnonzero
+from numpy.linalg import lstsq
+
+from diffpy.srfit.equation.visitors import Differentiator, getArgs
+from diffpy.srfit.equation.visitors import LinearityChecker, BatchEvaluator
+from diffpy.srfit.equation.visitors.differentiator import _target
 from diffpy.srfit.interface import _fitrecipe_interface
 from diffpy.srfit.util.tagmanager import TagManager
+from diffpy.srfit.util.lrucache import LRUCache
 from diffpy.srfit.fitbase.parameter import ParameterProxy
 from diffpy.srfit.fitbase.recipeorganizer import RecipeOrganizer
+from diffpy.srfit.fitbase.restraint import RestraintGroup
 from diffpy.srfit.fitbase.fithook import PrintFitHook
+from diffpy.srfit.fitbase.executor import SerialExecutor
+from diffpy.srfit.fitbase.affineconstraints import findAffineConstraints
+from diffpy.srfit.exceptions import SrFitError
 
 class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
     """FitRecipe class.
@@ -50,12 +62,28 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
     name            --  A name for this FitRecipe.
     fithooks        --  List of FitHook instances that can pass information out
                         of the system during a refinement. By default, the is
-                        populated by a PrintFitHook instance.
+                        populated by a PrintFitHook instance.  Use
+                        pushFitHook, popFitHook and clearFitHooks to change
+                        it.
+    copyresidual    --  Flag for returning a new array from the residual
+                        method (default True).  When False, residual returns
+                        the internal buffer, which is overwritten by the next
+                        residual call.
+    projectlinear   --  Flag for solving the linear variables by linear least
+                        squares in every residual call (default True).  When
+                        False, the linear variables are refined as the other
+                        free variables.  See setLinear.
     _constraints    --  A dictionary of Constraints, indexed by the constrained
                         Parameter. Constraints can be added using the
                         'constrain' method.
     _oconstraints   --  An ordered list of the constraints from this and all
                         sub-components.
+    _affine         --  AffineConstraints for the affine constraints in
+                        _oconstraints or None.
+    _nlconstraints  --  An ordered list of the constraints that are not
+                        in _affine.
+    _conupdates     --  The number of constraints updated in the last call
+                        of _updateConstraints.
     _calculators    --  A managed dictionary of Calculators.
     _contributions  --  A managed OrderedDict of FitContributions.
     _parameters     --  A managed OrderedDict of parameters (in this case the
@@ -65,16 +93,42 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
                         instance that is used to create constraints and
                         restraints from string
     _restraintlist  --  A list of restraints from this and all sub-components.
+                        The restraints in _restraintgroup come first.
+    _restraintgroup --  RestraintGroup of the plain restraints for the
+                        vectorized penalty calculation or None.  The bounds
+                        of the restraints are read in _prepare.
     _restraints     --  A set of Restraints. Restraints can be added using the
                         'restrain' or 'confine' methods.
     _ready          --  A flag indicating if all attributes are ready for the
                         calculation.
+    _executor       --  A ContributionExecutor that evaluates the residuals
+                        of the FitContributions.  See setExecutor.
+    _chivbuffer     --  The preallocated array of the vector residual.
+    _chivsizes      --  List of the residual sizes of the FitContributions
+                        that determine the layout of _chivbuffer or None
+                        when the buffer is allocated in the next residual
+                        call.
+    _chivviews      --  List of the _chivbuffer views for the weighted
+                        residuals of each FitContribution.
+    _chivbare       --  The _chivbuffer view for all FitContributions.
+    _chivpenalties  --  The _chivbuffer view for the restraint penalties.
+    _stagehooks     --  List of the FitHooks with the stages flag, which
+                        are called at the end of the residual stages.
+    _generation     --  Counter of the configuration and Profile changes.
+    _residualcache  --  LRUCache of the residual arrays and the lists of the
+                        calculated profiles indexed by the configuration
+                        generation and variable values or None when
+                        disabled.  See setResidualCache.
+    _depmap         --  A dictionary of the FitContributions and Restraints
+                        affected by each variable.  This is built on demand,
+                        see _getDependencies.
     _tagmanager     --  A TagManager instance for managing tags on Parameters.
     _weights        --  List of weighing factors for each FitContribution. The
                         weights are multiplied by the residual of the
                         FitContribution when determining the overall residual.
     _fixedtag       --  "__fixed", used for tagging variables as fixed. Don't
                         use this tag unless you want issues.
+    _lineartag      --  "__linear", used for tagging linear variables.
 
     Properties
     names           --  Variable names (read only). See getNames.
@@ -87,11 +141,13 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
 
     fixednames = property(lambda self:
             [v.name for v in self._parameters.values()
-                if not (self.isFree(v) or self.isConstrained(v))],
+                if self._tagmanager.hasTags(v, self._fixedtag)
+                and not self.isConstrained(v)],
             doc='names of the fixed refinable variables')
     fixedvalues = property(lambda self:
             array([v.value for v in self._parameters.values()
-                if not (self.isFree(v) or self.isConstrained(v))]),
+                if self._tagmanager.hasTags(v, self._fixedtag)
+                and not self.isConstrained(v)]),
             doc='values of the fixed refinable variables')
     bounds = property(lambda self: self.getBounds())
     bounds2 = property(lambda self: self.getBounds2())
@@ -99,12 +155,25 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
     def __init__(self, name = "fit"):
         """Initialization."""
         RecipeOrganizer.__init__(self, name)
+        self._generation = 0
+        self._residualcache = None
         self.fithooks = []
+        self._stagehooks = []
+        self.copyresidual = True
+        self.projectlinear = True
+        self._executor = SerialExecutor()
+        self._chivsizes = None
         self.pushFitHook(PrintFitHook())
         self._restraintlist = []
+        self._restraintgroup = None
         self._oconstraints = []
+        self._affine = None
+        self._nlconstraints = []
+        self._conupdates = 0
+        self._depmap = None
         self._ready = False
         self._fixedtag = "__fixed"
+        self._lineartag = "__linear"
 
         self._weights = []
         self._tagmanager = TagManager()
@@ -132,6 +201,7 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
         if index is None:
             index = len(self.fithooks)
         self.fithooks.insert(index, fithook)
+        self._updateStageHooks()
         # Make sure the added FitHook gets its reset method called.
         self._updateConfiguration()
         return
@@ -149,8 +219,9 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
         """
         if fithook is not None:
             self.fithooks.remove(fithook)
-            return
-        self.fithook.remove(index)
+        else:
+            self.fithooks.pop(index)
+        self._updateStageHooks()
         return
 
     def getFitHooks(self):
@@ -160,8 +231,50 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
     def clearFitHooks(self):
         """Clear the FitHook sequence."""
         del self.fithooks[:]
+        self._updateStageHooks()
+        return
+
+    def _updateStageHooks(self):
+        """Update the list of FitHooks that are called at residual stages.
+
+        This must be called after every change of the fithooks list.
+        """
+        self._stagehooks = [h for h in self.fithooks
+                if getattr(h, "stages", False)]
+        return
+
+    def setExecutor(self, executor):
+        """Set the executor for evaluating the FitContributions.
+
+        executor    --  A ContributionExecutor instance, see the
+                        diffpy.srfit.fitbase.executor module.  The
+                        FitContributions are evaluated serially when None.
+
+        The previous executor is closed.
+        """
+        if executor is None:
+            executor = SerialExecutor()
+        self._executor.close()
+        self._executor = executor
+        self._updateConfiguration()
         return
 
+    def getExecutor(self):
+        """Get the executor for evaluating the FitContributions."""
+        return self._executor
+
+    def clone(self):
+        """Create an independent copy of this FitRecipe.
+
+        The copy shares the observed arrays of the Profiles with this recipe
+        instead of copying them, see diffpy.srfit.fitbase.snapshot.  The
+        functions registered in the recipe must be picklable.
+
+        Returns the new FitRecipe.
+        """
+        from diffpy.srfit.fitbase.snapshot import RecipeSnapshot
+        return RecipeSnapshot(self).load()
+
     def addContribution(self, con, weight = 1.0):
         """Add a FitContribution to the FitRecipe.
 
@@ -176,9 +289,14 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
         return
 
     def setWeight(self, con, weight):
-        """Set the weight of a FitContribution."""
+        """Set the weight of a FitContribution.
+
+        The cached residuals are discarded, see setResidualCache.
+        """
         idx = self._contributions.values().index(con)
         self._weights[idx] = weight
+        self._generation += 1
+        self.clearResidualCache()
         return
 
     def addParameterSet(self, parset):
@@ -220,34 +338,188 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
         # Prepare, if necessary
         self._prepare()
 
+        stagehooks = self._stagehooks
         for fithook in self.fithooks:
             fithook.precall(self)
 
         # Update the variable parameters.
         self._applyValues(p)
 
-        # Update the constraints. These are ordered such that the list only
-        # needs to be cycled once.
-        for con in self._oconstraints:
-            con.update()
-
-        # Calculate the bare chiv
-        chiv = concatenate([
-            sqrt(self._weights[i])*\
-                    self._contributions.values()[i].residual().flatten() \
-                    for i in range(len(self._contributions))])
+        # Update the constraints with changed inputs.
+        self._updateConstraints()
+
+        # Look up the residual in the cache.  This is done before the
+        # projection, because the linear variables are solved from the
+        # others.  Their values are restored from the cache.
+        cache = self._residualcache
+        if cache is not None:
+            linvars = self._getLinearVars()
+            key = self.__residualCacheKey(linvars)
+            cached = cache.get(key)
+            if cached is not None:
+                chiv, ycalcs, linvalues = cached
+                self.__restoreLinear(linvars, linvalues)
+                if stagehooks:
+                    self.__markStage(stagehooks, "update")
+                for con, ycalc in zip(self._contributions.values(), ycalcs):
+                    con.profile.ycalc = ycalc
+                return self.__finishResidual(chiv)
+
+        # Solve for the linear variables.
+        self._projectLinear()
+        if stagehooks:
+            self.__markStage(stagehooks, "update")
+
+        # Calculate the bare chiv.  The weighted residuals are written to
+        # their views in the preallocated buffer.
+        if stagehooks and isinstance(self._executor, SerialExecutor):
+            residuals = []
+            for i, con in enumerate(self._contributions.values()):
+                residuals.append(con.residual())
+                self.__markStage(stagehooks, "contribution", i)
+        else:
+            residuals = self._executor.residuals(self)
+            if stagehooks:
+                self.__markStage(stagehooks, "contributions")
+        sizes = [size(res) for res in residuals]
+        if sizes != self._chivsizes:
+            self.__allocateResidualBuffer(sizes)
+        for weight, res, view in zip(self._weights, residuals,
+                self._chivviews):
+            multiply(ravel(res), sqrt(weight), out=view)
+        chiv = self._chivbuffer
 
         # Calculate the point-average chi^2
-        w = dot(chiv, chiv)/len(chiv)
+        bare = self._chivbare
+        w = dot(bare, bare)/len(bare)
         # Now we must append the restraints
-        penalties = [ sqrt(res.penalty(w)) for res in self._restraintlist ]
-        chiv = concatenate( [ chiv, penalties ] )
+        penalties = self._chivpenalties
+        n = 0
+        if self._restraintgroup is not None:
+            n = len(self._restraintgroup)
+            self._restraintgroup.residual(w, out=penalties[:n])
+        for i in xrange(n, len(penalties)):
+            penalties[i] = sqrt(self._restraintlist[i].penalty(w))
+        if stagehooks:
+            self.__markStage(stagehooks, "restraints")
+
+        if cache is not None:
+            ycalcs = [None if con.profile.ycalc is None
+                    else array(con.profile.ycalc, dtype=float)
+                    for con in self._contributions.values()]
+            linvalues = [v.value for v in linvars]
+            cache.put(key, (chiv.copy(), ycalcs, linvalues))
+
+        return self.__finishResidual(chiv)
+
+    def __markStage(self, hooks, name, index = -1):
+        """Report the end of a residual calculation stage to the FitHooks."""
+        for fithook in hooks:
+            fithook.stage(self, name, index)
+        return
+
+    def __finishResidual(self, chiv):
+        """Copy chiv to the buffer if necessary and call the FitHooks.
+
+        Returns the residual array.
+        """
+        if chiv is not self._chivbuffer:
+            self._chivbuffer[:] = chiv
+        chiv = self._chivbuffer
+        if self.copyresidual:
+            chiv = chiv.copy()
 
         for fithook in self.fithooks:
             fithook.postcall(self, chiv)
 
         return chiv
 
+    def setResidualCache(self, maxsize = 128):
+        """Enable or disable the cache of residual values.
+
+        The cache maps the values of the recipe variables to the residual
+        array and the calculated profiles of the FitContributions.  It saves
+        the calculation when the residual is requested again for the same
+        variable values, which is frequent in some optimizers.  The cached
+        profiles are restored to profile.ycalc of the FitContributions.
+        The cache is cleared when the recipe configuration, the Profile of a
+        FitContribution or a weight set by setWeight changes.  The linear
+        variables are not part of the key, their solved values are cached
+        with the residual.  Changes in the Parameters that are not recipe
+        variables or in the bounds of the restraints are not detected, call
+        clearResidualCache after such changes.
+
+        maxsize --  The maximum number of cached residuals (default 128).
+                    The cache is disabled when maxsize is 0 or None.
+        """
+        self._residualcache = LRUCache(maxsize) if maxsize else None
+        return
+
+    def clearResidualCache(self):
+        """Remove all items from the residual cache."""
+        if self._residualcache is not None:
+            self._residualcache.clear()
+        return
+
+    def getResidualCacheInfo(self):
+        """Return a dictionary with the statistics of the residual cache.
+
+        The dictionary has keys "hits", "misses", "size" and "maxsize".
+        Return None when the cache is disabled.
+        """
+        if self._residualcache is None:
+            return None
+        return self._residualcache.info()
+
+    def getConstraintUpdateCount(self):
+        """Get the number of constraints updated in the last residual call.
+
+        Only the constraints with changed inputs are updated.  This is for
+        verification and profiling.
+        """
+        return self._conupdates
+
+    def __residualCacheKey(self, linvars):
+        """Return the residual cache key for the current variable values.
+
+        linvars --  List of the linear variables solved by the projection.
+                    Their values are replaced with NaN in the key.
+
+        The key includes the configuration generation, so that no stale
+        residuals are returned after a configuration or Profile change.
+        """
+        values = array([v.value for v in self._parameters.values()],
+                dtype=float)
+        if linvars:
+            linids = set(map(id, linvars))
+            for i, var in enumerate(self._parameters.values()):
+                if id(var) in linids:
+                    values[i] = nan
+        return (self._generation, values.tobytes())
+
+    def __restoreLinear(self, linvars, linvalues):
+        """Restore the cached values of the linear variables."""
+        if not linvars:
+            return
+        with self.batchUpdate():
+            for var, value in zip(linvars, linvalues):
+                var.setValue(value)
+        n = self._conupdates
+        self._updateConstraints()
+        self._conupdates += n
+        return
+
+    def _profileChanged(self, other):
+        """Advance the generation when the Profile of a FitContribution
+        changes.
+
+        The residual size and values depend on the Profile, so the cached
+        residuals are discarded.
+        """
+        self._generation += 1
+        self.clearResidualCache()
+        return
+
     def scalarResidual(self, p = []):
         """Calculate the scalar residual to be optimized.
 
@@ -270,6 +542,479 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
         """Same as scalarResidual method."""
         return self.scalarResidual(p)
 
+    def residualBatch(self, P, workers = 1):
+        """Calculate the vector residual for many sets of variable values.
+
+        P       --  Array of shape (npop, nvar), where each row has the
+                    variable values as the p argument of residual.
+        workers --  The number of worker processes for the residuals that
+                    are calculated row by row (default 1).  When 1, the
+                    rows are calculated in the calling process.
+
+        The FitContributions, Constraints and Restraints that are built from
+        numpy ufuncs are evaluated for all rows at once, the rows are
+        broadcast along an extra leading axis.  Other FitContributions, e.g.,
+        those with ProfileGenerators, are calculated row by row, as are all
+        rows when there are projected linear variables.  The variable values
+        are restored on return and the FitHooks are not called.
+
+        Returns an array of shape (npop, nres) of the residual arrays.
+        Raises ValueError if P does not have a column for every variable.
+        """
+        self._prepare()
+        P = array(P, dtype=float, ndmin=2)
+        varlist = [v for v in self._parameters.values() if self.isFree(v)]
+        if P.ndim != 2 or P.shape[1] != len(varlist):
+            emsg = "P must have %i columns, one per variable" % len(varlist)
+            raise ValueError(emsg)
+        npop = len(P)
+        self._updateConstraints()
+        if self._chivsizes is None:
+            sizes = [size(con.residual())
+                    for con in self._contributions.values()]
+            self.__allocateResidualBuffer(sizes)
+        cblocks, values = self.__broadcastBlocks(P, varlist)
+        nres = len(self._restraintlist)
+        vectorized = (values is not None and (nres == 0 or
+            self._restraintgroup is not None and
+            len(self._restraintgroup) == nres))
+        # Calculate the other FitContributions row by row.
+        cidx = set(i for i, b in enumerate(cblocks) if b is None)
+        ridx = set() if vectorized else set(range(nres))
+        if cidx or ridx:
+            deps = (cidx, ridx)
+            tasks = [(P[r], [(b[r] if b is not None else None)
+                for b in cblocks] + [zeros(nres)]) for r in range(npop)]
+            rows = self.__calculateRows(tasks, deps, workers)
+            for i in cidx:
+                cblocks[i] = array([row[i] for row in rows]).reshape(npop, -1)
+            penalties = array([row[-1] for row in rows]).reshape(npop, nres)
+        rv = empty((npop, sum(self._chivsizes) + nres), dtype=float)
+        nbare = rv.shape[1] - nres
+        if cblocks:
+            concatenate(cblocks, axis=1, out=rv[:, :nbare])
+        if vectorized and nres:
+            bare = rv[:, :nbare]
+            w = (bare * bare).sum(axis=1)[:, None] / nbare
+            val = concatenate([broadcast_to(v, (npop, 1)) for v in values],
+                    axis=1)
+            self._restraintgroup.residualFromValues(val, w, out=rv[:, nbare:])
+        elif nres:
+            rv[:, nbare:] = penalties
+        return rv
+
+    def __broadcastBlocks(self, P, varlist):
+        """Evaluate the broadcastable residual blocks for residualBatch.
+
+        Returns a (blocks, values) tuple.  blocks is a list of the weighted
+        residual arrays of shape (npop, n) for each FitContribution or None
+        for those that cannot be broadcast.  values is a list of the restraint
+        values of shape (npop, 1) or None when these cannot be broadcast.
+        """
+        npop = len(P)
+        blocks = [None] * len(self._contributions)
+        if self._getLinearVars():
+            return (blocks, None)
+        evaluator = BatchEvaluator(dict((id(_target(v)), P[:, k:k + 1])
+            for k, v in enumerate(varlist)))
+        for con in self._oconstraints:
+            rv = con.eq.identify(evaluator)
+            if rv is None:
+                return (blocks, None)
+            if rv[1]:
+                evaluator.values[id(_target(con.par))] = rv[0]
+        items = zip(self._contributions.values(), self._weights,
+                self._chivsizes)
+        for i, (con, weight, n) in enumerate(items):
+            rv = con._reseq.identify(evaluator)
+            if rv is None:
+                continue
+            value = array(rv[0], dtype=float, ndmin=1)
+            value = value.reshape(npop, -1) if rv[1] else value.reshape(1, -1)
+            if value.shape[1] not in (1, n):
+                continue
+            blocks[i] = sqrt(weight) * broadcast_to(value, (npop, n))
+        values = []
+        for res in self._restraintlist:
+            rv = res.eq.identify(evaluator)
+            if rv is None or size(rv[0]) not in (1, npop):
+                return (blocks, None)
+            values.append(array(rv[0], dtype=float).reshape(-1, 1))
+        return (blocks, values)
+
+    def __calculateRows(self, tasks, deps, workers):
+        """Calculate the residual blocks row by row for residualBatch.
+
+        tasks   --  List of (p, blocks) pairs for the rows, see
+                    _residualBlocks.
+        deps    --  The (contributions, restraints) indices to calculate.
+        workers --  The number of worker processes.
+
+        Returns a list of the residual blocks for each row.
+        """
+        if workers > 1 and len(tasks) > 1:
+            import multiprocessing
+            from diffpy.srfit.fitbase.snapshot import RecipeSnapshot
+            snapshot = RecipeSnapshot(self)
+            pool = multiprocessing.Pool(min(workers, len(tasks)),
+                    _initBatchWorker, (snapshot, deps))
+            try:
+                return pool.map(_batchWorkerRow, tasks)
+            finally:
+                pool.close()
+                pool.join()
+        saved = [v.getValue() for v in self._parameters.values()]
+        try:
+            return [self._residualBlocks(p, deps, blocks)
+                    for p, blocks in tasks]
+        finally:
+            with self.batchUpdate():
+                for v, value in zip(self._parameters.values(), saved):
+                    v.setValue(value)
+            self._updateConstraints()
+
+    def jacobian(self, p = [], step = 1e-8, sparse = False):
+        """Calculate the Jacobian of the vector residual.
+
+        The derivatives are calculated in the forward mode from the
+        FitContribution residual equations, the Restraints and the chain rule
+        through the Constraint equations.  ProfileGenerators can supply their
+        own derivatives, otherwise they are differentiated numerically.  This
+        method can be passed as the Dfun argument to scipy.optimize.leastsq
+        or as the jac argument to scipy.optimize.least_squares.
+
+        Arguments
+        p       --  The list of current variable values, provided in the same
+                    order as the '_parameters' list. If p is an empty iterable
+                    (default), then it is assumed that the parameters have
+                    already been updated in some other way, and the explicit
+                    update within this function is skipped.
+        step    --  The fractional step size for numeric derivatives
+                    (default 1e-8).
+        sparse  --  Return the Jacobian as a scipy.sparse.csr_matrix when
+                    True (default False).  The matrix is assembled from the
+                    derivatives of the variables that affect each
+                    FitContribution, without the dense array.  With
+                    projected linear variables the rows are dense, then the
+                    dense array is converted and no memory is saved.
+
+        Returns a 2D array of the derivatives of the residual array with
+        respect to the free variables.  The shape of the array is
+        (len(residual), len(p)).  FitContributions that are not affected
+        by any free variable are not differentiated and their rows are zero.
+
+        When the linear variables are projected, the FitContribution rows
+        are the derivatives of the residual with the linear variables at
+        their least squares solution.  These are obtained by projecting out
+        the derivatives with respect to the linear variables (Kaufman
+        approximation).
+        """
+        self._prepare()
+        self._applyValues(p)
+        self._updateConstraints()
+        self._projectLinear(step)
+
+        varlist = [v for v in self._parameters.values() if self.isFree(v)]
+        nfree = len(varlist)
+        linvars = self._getLinearVars()
+        varlist += linvars
+        seeds = self._getDerivativeSeeds(step, varlist)
+        n = len(varlist)
+        affected = set()
+        for cidx, ridx in self._getDependencies():
+            affected.update(cidx)
+        for var in linvars:
+            affected.update(self._depmap[var][0])
+        if sparse and not linvars:
+            return self.__sparseJacobian(seeds, n, affected, step)
+        chivs = []
+        blocks = []
+        contributions = self._contributions.values()
+        for i, (con, weight) in enumerate(zip(contributions, self._weights)):
+            sw = sqrt(weight)
+            chivs.append(sw * con.residual().flatten())
+            if i in affected:
+                blocks.append(sw * con.jacobian(seeds, n, step))
+            else:
+                blocks.append(zeros((len(chivs[-1]), n)))
+        chiv = concatenate(chivs)
+        jac = concatenate(blocks)
+
+        # Derivatives of the point-average chi^2 are needed by scaled
+        # restraints.
+        rows = self.__restraintRows(seeds, n, nfree, chiv, dot(chiv, jac),
+                step)
+        if rows:
+            jac = concatenate([jac, rows])
+        if linvars:
+            nb = len(chiv)
+            jc = jac[:nb, nfree:]
+            jac = jac[:, :nfree]
+            jac[:nb] -= dot(jc, lstsq(jc, jac[:nb], rcond=None)[0])
+        if sparse:
+            from scipy.sparse import csr_matrix
+            jac = csr_matrix(jac)
+        return jac
+
+    def __sparseJacobian(self, seeds, n, affected, step):
+        """Assemble the Jacobian as a scipy.sparse.csr_matrix.
+
+        seeds       --  The derivative seeds of the free variables.
+        n           --  The number of free variables.
+        affected    --  Set of the indices of the FitContributions that
+                        depend on some free variable.
+        step        --  The fractional step size for numeric derivatives.
+
+        Only the columns of the variables that affect a FitContribution are
+        calculated and stored.
+        """
+        from scipy.sparse import coo_matrix
+        data = []
+        rowidx = []
+        colidx = []
+        chivs = []
+        chivjac = zeros(n)
+        offset = 0
+        contributions = self._contributions.values()
+        for i, (con, weight) in enumerate(zip(contributions, self._weights)):
+            sw = sqrt(weight)
+            chiv = sw * con.residual().flatten()
+            m = len(chiv)
+            if i in affected:
+                value, ders = con._residualDerivatives(seeds, step)
+                for k, dk in ders.items():
+                    col = sw * broadcast_to(ravel(dk), (m,))
+                    chivjac[k] += dot(chiv, col)
+                    data.append(col)
+                    rowidx.append(arange(offset, offset + m))
+                    colidx.append(full(m, k, dtype=int))
+            chivs.append(chiv)
+            offset += m
+        chiv = concatenate(chivs)
+        rows = self.__restraintRows(seeds, n, n, chiv, chivjac, step)
+        for j, du in enumerate(rows):
+            nz = flatnonzero(du)
+            data.append(du[nz])
+            rowidx.append(full(len(nz), offset + j, dtype=int))
+            colidx.append(nz)
+        shape = (offset + len(rows), n)
+        if not data:
+            return coo_matrix(shape).tocsr()
+        jac = coo_matrix((concatenate(data),
+            (concatenate(rowidx), concatenate(colidx))), shape=shape)
+        return jac.tocsr()
+
+    def __restraintRows(self, seeds, n, nfree, chiv, chivjac, step):
+        """Calculate the Jacobian rows of the restraints.
+
+        seeds   --  The derivative seeds of the variables.
+        n       --  The number of differentiated variables.
+        nfree   --  The number of free variables, the leading variables.
+        chiv    --  The concatenated FitContribution residuals.
+        chivjac --  The product of chiv and the FitContribution rows of the
+                    Jacobian, for the derivatives of the point-average chi^2.
+        step    --  The fractional step size for numeric derivatives.
+
+        Returns a list of the row arrays.
+        """
+        w = dot(chiv, chiv)/len(chiv)
+        dsqrtw = zeros(n)
+        if w > 0:
+            dsqrtw = chivjac / (len(chiv) * sqrt(w))
+        rows = []
+        for res in self._restraintlist:
+            u = sqrt(res.penalty(1.0))
+            getders = getattr(res, "residualDerivatives", None)
+            ders = getders(seeds, step) if getders else None
+            if ders is None:
+                du = zeros(n)
+                du[:nfree] = self.__restraintNumericDerivatives(res, step)
+            else:
+                du = zeros(n)
+                for k, dk in ders.items():
+                    du[k] = dk
+            if res.scaled:
+                du = du * sqrt(w) + u * dsqrtw
+            rows.append(du)
+        return rows
+
+    def getJacobianSparsity(self):
+        """Get the sparsity structure of the Jacobian.
+
+        The structure follows from the dependency of the FitContributions and
+        Restraints on the free variables, either directly or through
+        Constraints.  This can be passed as the jac_sparsity argument to
+        scipy.optimize.least_squares.
+
+        Returns a boolean array of shape (len(residual), number of free
+        variables), which is True for the elements that can be nonzero.
+        """
+        deps = self._getDependencies()
+        blocks = self._residualBlocks([])
+        offsets = [0]
+        for b in blocks:
+            offsets.append(offsets[-1] + len(b))
+        nres = len(blocks) - 1
+        rv = zeros((offsets[-1], len(deps)), dtype=bool)
+        for k, (cidx, ridx) in enumerate(deps):
+            for i in cidx:
+                rv[offsets[i]:offsets[i + 1], k] = True
+            for j in ridx:
+                rv[offsets[nres] + j, k] = True
+        return rv
+
+    def _getDependencies(self):
+        """Get the FitContributions and Restraints affected by free variables.
+
+        A variable affects a FitContribution or a Restraint when it is one of
+        their Parameters, possibly through a chain of Constraints.  Scaled
+        Restraints are affected by every variable that affects some
+        FitContribution.  Restraints that do not have an equation are
+        affected by all variables.
+
+        Returns a list of (contributions, restraints) pairs for each free
+        variable, where contributions and restraints are sets of indices into
+        the FitContributions and the '_restraintlist'.
+        """
+        self._prepare()
+        if self._depmap is None:
+            self._depmap = self.__buildDependencyMap()
+        rv = [self._depmap[v] for v in self._parameters.values()
+                if self.isFree(v)]
+        # The projection of linear variables couples the FitContributions
+        # that they affect.
+        coupled = set()
+        for var in self._getLinearVars():
+            coupled.update(self._depmap[var][0])
+        if coupled:
+            rv = [(cidx | coupled if cidx & coupled else cidx, ridx)
+                    for cidx, ridx in rv]
+        return rv
+
+    def __buildDependencyMap(self):
+        """Map each variable to the affected FitContributions and Restraints.
+
+        Returns a dictionary of (contributions, restraints) index sets
+        indexed by variable.  See _getDependencies.
+        """
+        def _targetids(pars):
+            return set(id(_target(p)) for p in pars)
+
+        condeps = []
+        for con in self._contributions.values():
+            ids = _targetids(con.iterPars())
+            ids.update(_targetids(getArgs(con._reseq)))
+            condeps.append(ids)
+        resdeps = []
+        for res in self._restraintlist:
+            eq = getattr(res, "eq", None)
+            resdeps.append(None if eq is None else _targetids(getArgs(eq)))
+        scaled = set(j for j, res in enumerate(self._restraintlist)
+                if res.scaled)
+        cons = [(id(_target(con.par)), _targetids(getArgs(con.eq)))
+                for con in self._oconstraints]
+
+        depmap = {}
+        for var in self._parameters.values():
+            reach = set([id(_target(var))])
+            # The constraints are ordered, so one pass is sufficient.
+            for parid, argids in cons:
+                if reach.intersection(argids):
+                    reach.add(parid)
+            cidx = set(i for i, ids in enumerate(condeps)
+                    if reach.intersection(ids))
+            ridx = set(j for j, ids in enumerate(resdeps)
+                    if ids is None or reach.intersection(ids))
+            if cidx:
+                ridx.update(scaled)
+            depmap[var] = (cidx, ridx)
+        return depmap
+
+    def _residualBlocks(self, p, deps = None, blocks = None):
+        """Calculate the residual split in blocks.
+
+        Arguments
+        p       --  The list of current variable values, see residual.
+        deps    --  A (contributions, restraints) pair of index sets for the
+                    blocks that have to be recalculated.  When None
+                    (default), all blocks are recalculated.
+        blocks  --  Blocks from the previous call to be used for the parts
+                    that are not recalculated.
+
+        Returns a list of the weighted residual arrays for each
+        FitContribution followed by the array of restraint residuals.
+        Their concatenation is the same as the residual array.
+        """
+        self._prepare()
+        self._applyValues(p)
+        self._updateConstraints()
+        self._projectLinear()
+        rv = []
+        contributions = self._contributions.values()
+        for i, (con, weight) in enumerate(zip(contributions, self._weights)):
+            if deps is None or i in deps[0]:
+                rv.append(sqrt(weight) * con.residual().flatten())
+            else:
+                rv.append(blocks[i])
+        chiv = concatenate(rv)
+        w = dot(chiv, chiv)/len(chiv)
+        if deps is None:
+            penalties = zeros(len(self._restraintlist))
+        else:
+            penalties = blocks[-1].copy()
+        for j, res in enumerate(self._restraintlist):
+            if deps is None or j in deps[1]:
+                penalties[j] = sqrt(res.penalty(w))
+        rv.append(penalties)
+        return rv
+
+    def _getDerivativeSeeds(self, step = 1e-8, varlist = None):
+        """Get derivative seeds of the variables and constrained parameters.
+
+        The variables are seeded with their indices.  The seeds of the
+        constrained Parameters are the derivatives of their Constraint
+        equations with respect to the variables.
+
+        step    --  The fractional step size for numeric derivatives
+                    (default 1e-8).
+        varlist --  List of the variables to differentiate with respect to.
+                    Use the free variables when None (default).
+
+        Returns a dictionary of the seeds indexed by Parameter.  Each seed is
+        a dictionary of the derivatives indexed by the variable index.
+        """
+        if varlist is None:
+            varlist = [v for v in self._parameters.values()
+                    if self.isFree(v)]
+        seeds = dict((v, {i : 1.0}) for i, v in enumerate(varlist))
+        for con in self._oconstraints:
+            value, ders = con.eq.identify(Differentiator(seeds, step))
+            seeds[con.par] = ders
+        return seeds
+
+    def __restraintNumericDerivatives(self, res, step):
+        """Differentiate the unscaled restraint residual numerically.
+
+        Returns an array of the derivatives with respect to free variables.
+        """
+        pvals = self.getValues()
+        rv = zeros(len(pvals))
+        try:
+            for k, v in enumerate(pvals):
+                h = step * abs(v) or step
+                u = []
+                for pk in (v + h, v - h):
+                    pvals[k] = pk
+                    self._applyValues(pvals)
+                    self._updateConstraints()
+                    u.append(sqrt(res.penalty(1.0)))
+                pvals[k] = v
+                rv[k] = (u[0] - u[1]) / (2 * h)
+        finally:
+            self._applyValues(pvals)
+            self._updateConstraints()
+        return rv
+
     def _prepare(self):
         """Prepare for the residual calculation, if necessary.
 
@@ -287,11 +1032,14 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
             return
 
         # Inform the fit hooks that we're updating things
+        self._updateStageHooks()
         for fithook in self.fithooks:
             fithook.reset(self)
 
-        # Check Profiles
+        # Check Profiles and watch them for the residual cache.
         self.__verifyProfiles()
+        for con in self._contributions.values():
+            con.profile.addObserver(self._profileChanged)
 
         # Check parameters
         self.__verifyParameters()
@@ -305,13 +1053,68 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
         for con in self._oconstraints:
             con.update()
 
+        # Group the affine constraints for evaluation as a matrix transform.
+        self._affine, self._nlconstraints = findAffineConstraints(
+                self._oconstraints)
+
         # Validate!
         self._validate()
 
+        # Group the plain restraints for the vectorized penalties.  These
+        # are placed at the start of the restraint list.
+        grouped = []
+        others = []
+        for res in self._restraintlist:
+            if RestraintGroup.isGroupable(res):
+                grouped.append(res)
+            else:
+                others.append(res)
+        self._restraintlist = grouped + others
+        self._restraintgroup = RestraintGroup(grouped) if grouped else None
+
+        # Prepare the executor for the current configuration.
+        self._executor.reset(self)
+
+        # The residual buffer is allocated in the next residual call, the
+        # number of restraints may have changed.
+        self._chivsizes = None
+
         self._ready = True
 
         return
 
+    def __allocateResidualBuffer(self, sizes):
+        """Allocate the residual buffer and its views.
+
+        sizes   --  List of the residual sizes of the FitContributions.
+
+        The buffer holds the weighted residuals of the FitContributions in
+        consecutive blocks followed by the restraint penalties.
+        """
+        nbare = sum(sizes)
+        buf = empty(nbare + len(self._restraintlist), dtype=float)
+        offsets = [0]
+        for n in sizes:
+            offsets.append(offsets[-1] + n)
+        self._chivbuffer = buf
+        self._chivsizes = list(sizes)
+        self._chivviews = [buf[lo:hi]
+                for lo, hi in zip(offsets[:-1], offsets[1:])]
+        self._chivbare = buf[:nbare]
+        self._chivpenalties = buf[nbare:]
+        return
+
+    def __setstate__(self, state):
+        """Restore the pickled state.
+
+        The residual buffer views do not survive pickling, they are created
+        again for the unpickled buffer.
+        """
+        self.__dict__.update(state)
+        if self._chivsizes is not None:
+            self.__allocateResidualBuffer(self._chivsizes)
+        return
+
     def __verifyProfiles(self):
         """Verify that each FitContribution has a Profile."""
         # Check for profile values
@@ -373,47 +1176,8 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
         self._restraintlist = list(rset)
 
         # Reorder the constraints. Constraints are ordered such that a given
-        # constraint is placed before its dependencies.
-        self._oconstraints = cdict.values()
-
-        # Create a depth-1 map of the constraint dependencies
-        depmap = {}
-        for con in self._oconstraints:
-            depmap[con] = set()
-            # Now check the constraint's equation for constrained arguments
-            for arg in con.eq.args:
-                if arg in cdict:
-                    depmap[con].add( cdict[arg] )
-
-        # Turn the dependency map into multi-level map.
-        def _extendDeps(con):
-            deps = set(depmap[con])
-            for dep in depmap[con]:
-                deps.update(_extendDeps(dep))
-
-            return deps
-
-        for con in depmap:
-            depmap[con] = _extendDeps(con)
-
-        # Now sort the constraints based on the dependency map.
-        def cmp(x, y):
-            # x == y if neither of them have dependencies
-            if not depmap[x] and not depmap[y]:
-                return 0
-            # x > y if y is a dependency of x
-            # x > y if y has no dependencies
-            if y in depmap[x] or not depmap[y]:
-                return 1
-            # x < y if x is a dependency of y
-            # x < y if x has no dependencies
-            if x in depmap[y] or not depmap[x]:
-                return -1
-            # If there are dependencies, but there is no relationship, the
-            # constraints are equivalent
-            return 0
-
-        self._oconstraints.sort(cmp)
+        # constraint is placed after its dependencies.
+        self._oconstraints = _orderConstraints(cdict.values())
 
         return
 
@@ -652,8 +1416,149 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
         return
 
     def isFree(self, var):
-        """Check if a variable is fixed."""
-        return (not self._tagmanager.hasTags(var, self._fixedtag))
+        """Check if a variable is refined by the optimizer.
+
+        Fixed variables are not free.  Linear variables are not free while
+        they are projected, see setLinear.
+        """
+        if self._tagmanager.hasTags(var, self._fixedtag):
+            return False
+        return not (self.projectlinear and
+                self._tagmanager.hasTags(var, self._lineartag))
+
+    def setLinear(self, *args):
+        """Mark variables as linear by reference, name or tag.
+
+        The residual must be a linear function of the linear variables, such
+        as a scale factor or the coefficients of a polynomial background.
+        When projectlinear is True, the free linear variables are not
+        refined by the optimizer.  Instead, they are solved by the weighted
+        linear least squares of the FitContribution residuals in every
+        residual call (variable projection).  Restraints are not included
+        in this solution.  The FitResults report the linear variables with
+        the other variables.
+
+        This method accepts string or variable arguments. An argument of "all"
+        selects all variables.  See findLinearVars for detecting the linear
+        variables.
+
+        Raises ValueError if an unknown Parameter, name or tag is passed.
+        """
+        varargs = self.__getVarsFromArgs(*args)
+        for var in varargs:
+            self._tagmanager.tag(var, self._lineartag)
+        return
+
+    def setNonlinear(self, *args):
+        """Clear the linear flag of variables by reference, name or tag.
+
+        This method accepts string or variable arguments. An argument of "all"
+        selects all variables.
+
+        Raises ValueError if an unknown Parameter, name or tag is passed.
+        """
+        varargs = self.__getVarsFromArgs(*args)
+        for var in varargs:
+            self._tagmanager.untag(var, self._lineartag)
+        return
+
+    def isLinear(self, var):
+        """Check if a variable is marked as linear."""
+        return self._tagmanager.hasTags(var, self._lineartag)
+
+    def findLinearVars(self):
+        """Find the variables that can be solved by linear least squares.
+
+        The variables are selected from the non-fixed variables one by one,
+        such that the residuals of the FitContributions stay linear in all
+        selected variables.  The linearity is determined from the residual
+        and Constraint equations.  Variables used by Restraints or that do not
+        affect any FitContribution are not selected.
+
+        Returns a list of the variable names.  Pass them to setLinear to
+        enable the variable projection.
+        """
+        self._getDependencies()
+        scaled = set(j for j, res in enumerate(self._restraintlist)
+                if res.scaled)
+        candidates = [v for v in self._parameters.values()
+                if not self._tagmanager.hasTags(v, self._fixedtag)
+                and self._depmap[v][0] and not (self._depmap[v][1] - scaled)]
+        ids = set()
+        rv = []
+        for var in candidates:
+            trial = ids.union([id(_target(var))])
+            if self.__isLinearIn(trial):
+                ids = trial
+                rv.append(var.name)
+        return rv
+
+    def __isLinearIn(self, ids):
+        """Check if the FitContribution residuals are linear in Parameters.
+
+        ids     --  Set of ids of the Parameters.
+        """
+        checker = LinearityChecker(ids)
+        for con in self._oconstraints:
+            checker.degrees[id(_target(con.par))] = con.eq.identify(checker)
+        for con in self._contributions.values():
+            if con._reseq.identify(checker) is None:
+                return False
+        return True
+
+    def _getLinearVars(self):
+        """Get the linear variables solved by the projection.
+
+        Returns a list of the linear variables that are not fixed or an
+        empty list when projectlinear is False.
+        """
+        if not self.projectlinear:
+            return []
+        tm = self._tagmanager
+        rv = [v for v in self._parameters.values()
+                if tm.hasTags(v, self._lineartag)
+                and not tm.hasTags(v, self._fixedtag)]
+        return rv
+
+    def _projectLinear(self, step = 1e-8):
+        """Solve for the linear variables at the current nonlinear values.
+
+        The linear variables are set to the least squares solution of the
+        weighted FitContribution residuals.  The derivatives with respect to
+        the linear variables are exact, so one linear solution is sufficient.
+
+        step    --  The fractional step size for numeric derivatives
+                    (default 1e-8).
+        """
+        linvars = self._getLinearVars()
+        if not linvars:
+            return
+        self._getDependencies()
+        affected = set()
+        for var in linvars:
+            affected.update(self._depmap[var][0])
+        seeds = self._getDerivativeSeeds(step, linvars)
+        m = len(linvars)
+        chivs = []
+        blocks = []
+        contributions = self._contributions.values()
+        for i, (con, weight) in enumerate(zip(contributions, self._weights)):
+            if i not in affected:
+                continue
+            sw = sqrt(weight)
+            chivs.append(sw * con.residual().flatten())
+            blocks.append(sw * con.jacobian(seeds, m, step))
+        if not blocks:
+            return
+        delta = lstsq(concatenate(blocks), -concatenate(chivs),
+                rcond=None)[0]
+        with self.batchUpdate():
+            for var, dv in zip(linvars, delta):
+                var.setValue(var.value + dv)
+        n = self._conupdates
+        self._updateConstraints()
+        self._conupdates += n
+        return
 
     def unconstrain(self, *pars):
         """Unconstrain a Parameter.
@@ -786,17 +1691,228 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
                     scaled = scaled)
         return
 
+    def refine(self, schedule = ("all",), optimizer = None, **kw):
+        """Refine the variables in a sequence of stages.
+
+        Every stage frees the selected variables and fixes all others, then
+        optimizes the residual.  This replaces the common loops of fix("all"),
+        free(...) and optimizer calls.  The configuration is not changed
+        between the stages, so the prepared state of the recipe is reused.
+        Only the variables that are free when refine is called can be freed
+        by a stage, the fixed variables are never refined.  The variables
+        selected in the last stage stay free.  The fixed and free state is
+        restored when a stage fails.
+
+        schedule    --  Sequence of stages.  A stage is a name, tag or
+                        variable or a list of them, as accepted by free,
+                        e.g., ["scale", "lat", "adp", "all"] (default
+                        ("all",)).
+        optimizer   --  Function optimizer(fun, x0, jac, **kw) that returns
+                        the optimized values.  The fun and jac arguments are
+                        the residual and jacobian functions of the free
+                        variables.  When None, use scipy.optimize.leastsq
+                        with the analytic Jacobian.
+        kw          --  Extra keyword arguments passed to the optimizer.
+
+        Returns a list of dictionaries, one for each stage, with the keys
+        "stage", "names" (refined variable names), "time" (wall time in
+        seconds), "nfev" (residual calls), "njev" (jacobian calls) and "chi2"
+        (scalar residual after the stage).
+
+        Raises ValueError if an unknown name, tag or variable is used.  The
+        stages are checked before any variable is fixed or freed.
+        """
+        if optimizer is None:
+            optimizer = _leastsqOptimizer
+        entryfree = self._getUnfixedVars()
+        stagevars = []
+        for stage in schedule:
+            args = [stage] if isinstance(stage, basestring) else stage
+            if not hasattr(args, "__iter__"):
+                args = [args]
+            stagevars.append(self.__getVarsFromArgs(*args) & entryfree)
+        self._prepare()
+        counts = {"nfev" : 0, "njev" : 0}
+        def fun(p):
+            counts["nfev"] += 1
+            return self.residual(p)
+        def jac(p):
+            counts["njev"] += 1
+            return self.jacobian(p)
+        rv = []
+        done = False
+        try:
+            for stage, selected in zip(schedule, stagevars):
+                self._setUnfixedVars(selected)
+                counts.update(nfev=0, njev=0)
+                t0 = time.time()
+                names = self.getNames()
+                if names:
+                    p = optimizer(fun, self.getValues(), jac, **kw)
+                    chi2 = self.scalarResidual(p)
+                else:
+                    chi2 = self.scalarResidual()
+                t1 = time.time()
+                rv.append(dict(stage=stage, names=names, time=t1 - t0,
+                    nfev=counts["nfev"], njev=counts["njev"], chi2=chi2))
+            done = True
+        finally:
+            if not done:
+                self._setUnfixedVars(entryfree)
+        return rv
+
+    def _getUnfixedVars(self):
+        """Get the set of variables that are not fixed.
+
+        This includes the constrained and linear variables, which are not
+        tagged as fixed.  See _setUnfixedVars.
+        """
+        tm = self._tagmanager
+        rv = set(v for v in self._parameters.values()
+                if not tm.hasTags(v, self._fixedtag))
+        return rv
+
+    def _setUnfixedVars(self, unfixed):
+        """Unfix the variables in unfixed and fix all other variables."""
+        tm = self._tagmanager
+        for var in self._parameters.values():
+            if var in unfixed:
+                tm.untag(var, self._fixedtag)
+            else:
+                tm.tag(var, self._fixedtag)
+        return
+
     def _applyValues(self, p):
-        """Apply variable values to the variables."""
+        """Apply variable values to the variables.
+
+        The variables are updated in a batch, so that their common
+        dependencies are invalidated only once.
+        """
         if len(p) == 0: return
         vargen = (v for v in self._parameters.values() if self.isFree(v))
-        for var, pval in zip(vargen, p):
-            var.setValue(pval)
+        with self.batchUpdate():
+            for var, pval in zip(vargen, p):
+                var.setValue(pval)
+        return
+
+    def _updateConstraints(self):
+        """Update the constraints that are affected by changed values.
+
+        A Constraint is marked stale when its equation or its Parameter
+        changes.  The stale constraints are updated in the dependency order,
+        so the changes propagate in a single pass.  The affine constraints
+        are updated first as a sparse matrix transform of their inputs.  See
+        getConstraintUpdateCount.
+        """
+        n = 0
+        if self._affine is not None:
+            n += self._affine.update()
+        for con in self._nlconstraints:
+            if con.stale:
+                con.update()
+                n += 1
+        self._conupdates = n
         return
 
     def _updateConfiguration(self):
         """Notify RecipeContainers in hierarchy of configuration change."""
         self._ready = False
+        self._depmap = None
+        self._generation += 1
+        self.clearResidualCache()
         return
 
+# End class FitRecipe
+
+# Helper routines ------------------------------------------------------------
+
+def _leastsqOptimizer(fun, x0, jac, **kw):
+    """Optimize with scipy.optimize.leastsq, return the optimized values."""
+    from scipy.optimize import leastsq
+    return leastsq(fun, x0, Dfun=jac, **kw)[0]
+
+
+# Data of the worker process, these are set in _initBatchWorker.
+_batchworker = {}
+
+def _initBatchWorker(snapshot, deps):
+    """Initialize worker process for FitRecipe.residualBatch."""
+    recipe = snapshot.load()
+    recipe._executor = SerialExecutor()
+    _batchworker.update(recipe=recipe, deps=deps)
+    return
+
+
+def _batchWorkerRow(task):
+    """Calculate the residual blocks of one row in the worker process."""
+    p, blocks = task
+    w = _batchworker
+    return w['recipe']._residualBlocks(p, w['deps'], blocks)
+
+
+def _orderConstraints(constraints):
+    """Sort constraints so that each one follows the constraints it uses.
+
+    This is a topological sort by Kahn's algorithm, it takes time linear in
+    the number of constraints and their dependencies.
+
+    constraints --  List of Constraint objects.
+
+    Returns the sorted list of constraints.
+    Raises SrFitError if there are circular dependencies.
+    """
+    owners = dict((id(_target(con.par)), con) for con in constraints)
+    # dependents of each constraint and the count of its dependencies
+    users = dict((id(con), []) for con in constraints)
+    indegree = {}
+    for con in constraints:
+        deps = set(id(owners[id(_target(arg))]) for arg in con.eq.args
+                if id(_target(arg)) in owners)
+        for k in deps:
+            users[k].append(con)
+        indegree[id(con)] = len(deps)
+    queue = deque(con for con in constraints if not indegree[id(con)])
+    rv = []
+    while queue:
+        con = queue.popleft()
+        rv.append(con)
+        for user in users[id(con)]:
+            indegree[id(user)] -= 1
+            if not indegree[id(user)]:
+                queue.append(user)
+    if len(rv) < len(constraints):
+        cycle = _findConstraintCycle(owners, indegree)
+        names = " -> ".join(con.par.name for con in cycle)
+        raise SrFitError("Circular constraint dependency: %s" % names)
+    return rv
+
+
+def _findConstraintCycle(owners, indegree):
+    """Find a dependency cycle among the constraints left by Kahn's sort.
+
+    owners      --  Dictionary of constraints indexed by id of their target
+                    Parameters.
+    indegree    --  Dictionary of the remaining dependency counts indexed
+                    by id of constraints.
+
+    Returns a list of constraints that starts and ends with the same one.
+    """
+    left = [con for con in owners.values() if indegree[id(con)]]
+    # Every remaining constraint depends on some other remaining constraint,
+    # follow the dependencies until a constraint is visited again.
+    con = left[0]
+    path = []
+    position = {}
+    while id(con) not in position:
+        position[id(con)] = len(path)
+        path.append(con)
+        for arg in con.eq.args:
+            dep = owners.get(id(_target(arg)))
+            if dep is not None and indegree[id(dep)]:
+                con = dep
+                break
+    cycle = path[position[id(con)]:]
+    cycle.append(con)
+    return cycle
+
 # End of file
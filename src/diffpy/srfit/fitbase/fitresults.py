@@ -43,6 +43,12 @@ class FitResults(object):
                     FitContribution, indexed by the FitContribution name.
     derivstep   --  The fractional step size for calculating numeric
                     derivatives. Default 1e-8.
+    derivmethod --  The method for calculating the Jacobian.  "analytic"
+                    (default) uses FitRecipe.jacobian, "numeric" uses central
+                    differences of the recipe residual.
+    workers     --  The number of worker processes for the "numeric"
+                    Jacobian.  The columns are calculated in a
+                    multiprocessing pool when larger than 1 (default 1).
     varnames    --  Names of the variables in the recipe.
     varvals     --  Values of the variables in the recipe.
     varunc      --  Uncertainties in the variable values.
@@ -84,6 +90,8 @@ class FitResults(object):
         self.recipe = recipe
         self.conresults = OrderedDict()
         self.derivstep = 1e-8
+        self.derivmethod = "analytic"
+        self.workers = 1
         self.varnames = []
         self.varvals = []
         self.varunc = []
@@ -110,7 +118,22 @@ class FitResults(object):
         return
 
     def update(self):
-        """Update the results according to the current state of the recipe."""
+        """Update the results according to the current state of the recipe.
+
+        The linear variables of the recipe are reported as the other
+        variables, see FitRecipe.setLinear.
+        """
+        recipe = self.recipe
+        projectlinear = recipe.projectlinear
+        recipe.projectlinear = False
+        try:
+            self._update()
+        finally:
+            recipe.projectlinear = projectlinear
+        return
+
+    def _update(self):
+        """Update the results with linear variables included."""
         ## Note that the order of these operations are chosen to reduce
         ## computation time.
 
@@ -145,6 +168,18 @@ class FitResults(object):
             # Get the constraint uncertainties
             self._calculateConstraintUncertainties()
 
+        self._updateMetrics()
+        return
+
+    def _updateMetrics(self):
+        """Update the FitContribution results and the fit metrics.
+
+        This calculates the residual, chi2 and Rw metrics and the penalty
+        without the covariance.  The recipe must be prepared and convals
+        must be current.  This is called by update.
+        """
+        recipe = self.recipe
+
         # Store the fitting arrays and metrics for each FitContribution.
         self.conresults = OrderedDict()
         for con, weight in zip(recipe._contributions.values(), recipe._weights):
@@ -181,6 +216,40 @@ class FitResults(object):
     def _calculateJacobian(self):
         """Calculate the Jacobian for the fitting.
 
+        Returns the derivative wrt the fit variables at point p.
+
+        This also calculates the derivatives of the constrained parameters
+        while we're at it.
+
+        The derivatives are calculated according to the derivmethod
+        attribute.
+
+        Raises ValueError for unknown derivmethod.
+        """
+        if self.derivmethod == "numeric":
+            return self._calculateNumericJacobian()
+        if self.derivmethod != "analytic":
+            emsg = "Unknown derivmethod %r." % (self.derivmethod,)
+            raise ValueError(emsg)
+        recipe = self.recipe
+        step = self.derivstep
+        jac = recipe.jacobian(self.varvals, step)
+        seeds = recipe._getDerivativeSeeds(step)
+        n = len(self.varvals)
+        conr = []
+        # FIXME - constraints are used for vectors as well!
+        for con in recipe._oconstraints:
+            cond = numpy.zeros(n, dtype=float)
+            if numpy.isscalar(con.par.getValue()):
+                for k, dk in seeds[con.par].items():
+                    cond[k] = dk
+            conr.append(cond)
+        self._dcon = numpy.array(conr).reshape(len(conr), n)
+        return jac
+
+    def _calculateNumericJacobian(self):
+        """Calculate the Jacobian for the fitting by central differences.
+
         Adapted from PARK.
         Returns the derivative wrt the fit variables at point p.
 
@@ -199,46 +268,27 @@ class FitResults(object):
         # Compute the numeric derivative using the center point formula.
         delta = step * pvals
 
-        # Center point formula:
-        #     df/dv = lim_{h->0} ( f(v+h)-f(v-h) ) / ( 2h )
-        #
+        # Only the FitContributions and Restraints that depend on a variable
+        # are recalculated, the other residual blocks are reused.
+        deps = recipe._getDependencies()
+        blocks = recipe._residualBlocks(pvals)
 
-        r = []
-        # The list of constraint derivatives with respect to variables
         # The forward difference would be faster, but perhaps not as accurate.
-        conr = []
-        for k,v in enumerate(pvals):
-            h = delta[k]
-            pvals[k] = v + h
-            rk = self.recipe.residual(pvals)
-
-            # The constraints derivatives
-            cond = []
-            for con in recipe._oconstraints:
-                con.update()
-                cond.append(con.par.getValue())
-
-            pvals[k] = v - h
-            rk -= self.recipe.residual(pvals)
-
-            # FIXME - constraints are used for vectors as well!
-            for i, con in enumerate(recipe._oconstraints):
-                con.update()
-                val = con.par.getValue()
-                if numpy.isscalar(val):
-                    cond[i] -= con.par.getValue()
-                    cond[i] /= 2*h
-                else:
-                    cond[i] = 0.0
-
-            conr.append(cond)
+        columns = range(len(pvals))
+        if self.workers > 1 and len(pvals) > 1:
+            results = self.__mapJacobianColumns(columns, pvals, delta,
+                    deps, blocks)
+        else:
+            results = [_jacobianColumn(recipe, pvals, k, delta[k],
+                deps[k], blocks) for k in columns]
+        r = [rk for rk, cond in results]
+        # The list of constraint derivatives with respect to variables
+        conr = [cond for rk, cond in results]
 
-            pvals[k] = v
-            r.append(rk/(2*h))
-
-        # Reset the constrained parameters to their original values
-        for con in recipe._oconstraints:
-            con.update()
+        # Reset the variables and constrained parameters to their original
+        # values
+        recipe._applyValues(pvals)
+        recipe._updateConstraints()
 
         self._dcon = numpy.vstack(conr).T
 
@@ -246,6 +296,27 @@ class FitResults(object):
         jac = numpy.vstack(r).T
         return jac
 
+    def __mapJacobianColumns(self, columns, pvals, delta, deps, blocks):
+        """Calculate the Jacobian columns in a pool of worker processes.
+
+        Each worker process loads a RecipeSnapshot of the recipe and
+        evaluates the columns with the same code as the serial calculation.
+
+        Returns a list of (column, constraint derivatives) pairs.
+        """
+        import multiprocessing
+        from diffpy.srfit.fitbase.snapshot import RecipeSnapshot
+        snapshot = RecipeSnapshot(self.recipe)
+        nproc = min(self.workers, len(columns))
+        pool = multiprocessing.Pool(nproc, _initJacobianWorker,
+                (snapshot, pvals, delta, deps, blocks))
+        try:
+            rv = pool.map(_jacobianWorkerColumn, columns)
+        finally:
+            pool.close()
+            pool.join()
+        return rv
+
     def _calculateMetrics(self):
         """Calculate chi2, cumchi2, rchi2, rw and cumrw for the recipe."""
         cumchi2 = numpy.array([], dtype=float)
@@ -256,7 +327,7 @@ class FitResults(object):
             cc2w = con.weight * con.cumchi2
             c2last = cumchi2[-1:].sum()
             cumchi2 = numpy.concatenate([cumchi2, c2last + cc2w])
-            yw2tot += con.weight * (con.chi2 / con.rw**2)
+            yw2tot += con.weight * con._yw2tot
             numpoints += len(con.x)
 
         chi2 = cumchi2[-1:].sum()
@@ -536,6 +607,7 @@ class ContributionResults(object):
     rw          --  The Rw of the FitContribution.
     cumrw       --  The cumulative Rw of the FitContribution.
     weight      --  The weight of the FitContribution in the recipe.
+    _yw2tot     --  The denominator of the Rw formula.
     conlocs     --  The location of the constrained parameters in the
                     FitContribution (see the
                     RecipeContainer._locateManagedObject method).
@@ -560,6 +632,7 @@ class ContributionResults(object):
         self.chi2 = 0
         self.rw = 0
         self.weight = 0
+        self._yw2tot = 0.0
         self.conlocs = []
         self.convals = []
         self.conunc = []
@@ -599,7 +672,9 @@ class ContributionResults(object):
             if loc:
                 self.conlocs.append(loc)
                 self.convals.append(fitres.convals[i])
-                self.conunc.append(fitres.conunc[i])
+                # conunc is empty when the uncertainties are not calculated
+                if fitres.conunc:
+                    self.conunc.append(fitres.conunc[i])
 
         return
 
@@ -616,6 +691,7 @@ class ContributionResults(object):
         yw = y / self.dy
         yw2tot = numpy.dot(yw, yw)
         if yw2tot == 0.0:  yw2tot = 1.0
+        self._yw2tot = yw2tot
         self.cumrw = numpy.sqrt(self.cumchi2 / yw2tot)
         # avoid index error for empty array
         self.rw = self.cumrw[-1:].sum()
@@ -624,6 +700,86 @@ class ContributionResults(object):
 
 # End class ContributionResults
 
+def _recipeRw(recipe):
+    """Return the Rw of the recipe at the current variable values.
+
+    This is the rw of FitResults without the Jacobian and covariance
+    calculation, for ranking many refinements.
+    """
+    if not recipe._contributions:
+        return 0
+    fitres = FitResults(recipe, update = False)
+    projectlinear = recipe.projectlinear
+    recipe.projectlinear = False
+    try:
+        recipe._prepare()
+        fitres.convals = [con.par.getValue() for con in recipe._oconstraints]
+        fitres._updateMetrics()
+    finally:
+        recipe.projectlinear = projectlinear
+    return fitres.rw
+
+# Helper routines for the numeric Jacobian ----------------------------------
+
+def _jacobianColumn(recipe, pvals, k, h, dep, blocks):
+    """Calculate one column of the numeric Jacobian by central differences.
+
+    recipe  --  The FitRecipe to differentiate.
+    pvals   --  Array of the variable values.
+    k       --  Index of the variable to differentiate by.
+    h       --  The step size of the k-th variable.
+    dep     --  The (contributions, restraints) indices affected by the
+                k-th variable, see FitRecipe._getDependencies.
+    blocks  --  The residual blocks at pvals, see FitRecipe._residualBlocks.
+
+    Returns a tuple of the Jacobian column and a list of the derivatives of
+    the constrained parameters.
+    """
+    # Center point formula:
+    #     df/dv = lim_{h->0} ( f(v+h)-f(v-h) ) / ( 2h )
+    #
+    pvals = numpy.array(pvals, dtype=float)
+    v = pvals[k]
+    pvals[k] = v + h
+    rk = numpy.concatenate(recipe._residualBlocks(pvals, dep, blocks))
+
+    # The constraints derivatives
+    cond = []
+    for con in recipe._oconstraints:
+        cond.append(con.par.getValue())
+
+    pvals[k] = v - h
+    rk -= numpy.concatenate(recipe._residualBlocks(pvals, dep, blocks))
+
+    # FIXME - constraints are used for vectors as well!
+    for i, con in enumerate(recipe._oconstraints):
+        val = con.par.getValue()
+        if numpy.isscalar(val):
+            cond[i] -= con.par.getValue()
+            cond[i] /= 2*h
+        else:
+            cond[i] = 0.0
+    return (rk/(2*h), cond)
+
+
+# Data of the worker process, these are set in _initJacobianWorker.
+_jacobianworker = {}
+
+def _initJacobianWorker(snapshot, pvals, delta, deps, blocks):
+    """Initialize worker process for the numeric Jacobian."""
+    _jacobianworker.update(recipe=snapshot.load(), pvals=pvals,
+            delta=delta, deps=deps, blocks=blocks)
+    return
+
+
+def _jacobianWorkerColumn(k):
+    """Calculate k-th Jacobian column in the worker process."""
+    w = _jacobianworker
+    return _jacobianColumn(w['recipe'], w['pvals'], k, w['delta'][k],
+            w['deps'][k], w['blocks'])
+
+# End of numeric Jacobian helpers
+
 def resultsDictionary(results):
     """Get dictionary of results from file.
 
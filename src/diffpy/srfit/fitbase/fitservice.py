@@ -0,0 +1,468 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      Complex Modeling Initiative
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""Local service for running FitRecipe refinements in the background.
+
+The FitService keeps a priority queue of submitted recipes and refines them
+in a fixed number of worker processes on the local machine.  The recipes
+are sent to the workers through pipes, there is no external broker.  The
+submit method returns a FitJob right away.  The FitJob reports the status
+and progress of the refinement, which is streamed from the worker by a
+FitHook, and it gives access to the result when the refinement finishes.
+
+The callbacks of a FitJob are called from a thread of the service.  An
+event loop can be notified from the callbacks to wait for the jobs without
+blocking.
+
+The functions registered in the submitted recipes must be picklable.
+"""
+
+__all__ = ["FitService", "FitJob"]
+
+import time
+import heapq
+import threading
+
+from diffpy.srfit.exceptions import SrFitError
+from diffpy.srfit.fitbase.fithook import FitHook
+
+
+class FitJob(object):
+    """Refinement of a FitRecipe submitted to a FitService.
+
+    The status of the job is one of "queued", "running", "done", "failed",
+    "cancelled" and "timeout".
+
+    Attributes
+    id          --  The sequential number of the job in the service.
+    recipe      --  The submitted FitRecipe.  It is not changed by the
+                    refinement, see the apply method.
+    priority    --  Jobs with higher priority are started first.
+    timeout     --  The maximum time in seconds for the refinement or None.
+    status      --  The status of the job.
+    progress    --  Dictionary with the "count" of the residual calls and
+                    the last "chi2" reported by the worker.
+    _result     --  The result dictionary of a finished refinement.
+    _error      --  The error message of a failed refinement.
+    _kwargs     --  The arguments for FitRecipe.refine in the worker.
+    _snapshot   --  The pickled recipe.
+    _started    --  The start time of the refinement.
+    _finished   --  threading.Event that is set when the job finishes.
+    _lock       --  Lock for the status changes and callbacks.
+    _progresscallbacks  --  List of the progress callbacks.
+    _donecallbacks      --  List of the done callbacks.
+    """
+
+    def __init__(self, id, recipe, priority, timeout, kwargs):
+        """Create a queued job.  This is called by FitService.submit."""
+        import cPickle
+        self.id = id
+        self.recipe = recipe
+        self.priority = priority
+        self.timeout = timeout
+        self.status = "queued"
+        self.progress = dict(count=0, chi2=None)
+        self._result = None
+        self._error = None
+        self._kwargs = kwargs
+        self._snapshot = cPickle.dumps(recipe, cPickle.HIGHEST_PROTOCOL)
+        self._started = None
+        self._finished = threading.Event()
+        self._lock = threading.RLock()
+        self._progresscallbacks = []
+        self._donecallbacks = []
+        return
+
+
+    def done(self):
+        """Return True if the job has finished for any reason."""
+        return self._finished.is_set()
+
+
+    def wait(self, timeout = None):
+        """Wait until the job finishes.
+
+        timeout --  The maximum time to wait in seconds.  Wait forever
+                    when None.
+
+        Returns True if the job has finished.
+        """
+        # Event.wait without a timeout cannot be interrupted in Python 2.
+        end = None if timeout is None else time.time() + timeout
+        while not self._finished.is_set():
+            dt = 1.0 if end is None else min(1.0, end - time.time())
+            if dt <= 0:
+                break
+            self._finished.wait(dt)
+        return self._finished.is_set()
+
+
+    def result(self, timeout = None):
+        """Get the result of the refinement.
+
+        timeout --  The maximum time to wait in seconds.  Wait forever
+                    when None.
+
+        Returns a dictionary with the "names" and "values" of all recipe
+        variables, the "fixed" variable names, the "chi2" and the list of
+        "stages" returned by FitRecipe.refine.
+
+        Raises SrFitError if the job did not finish in time or if it failed,
+        was cancelled or timed out.
+        """
+        if not self.wait(timeout):
+            raise SrFitError("Job %i has not finished." % self.id)
+        if self.status != "done":
+            emsg = "Job %i %s." % (self.id, self.status)
+            if self._error:
+                emsg += "\n" + self._error
+            raise SrFitError(emsg)
+        return self._result
+
+
+    def apply(self):
+        """Set the refined values to the variables of the submitted recipe.
+
+        Raises SrFitError if the job has not finished successfully.
+        """
+        rv = self.result(timeout=0)
+        variables = self.recipe._parameters
+        with self.recipe.batchUpdate():
+            for name, value in zip(rv["names"], rv["values"]):
+                variables[name].setValue(value)
+        return
+
+
+    def cancel(self):
+        """Cancel the job.  A running refinement is stopped.
+
+        Returns True if the job was cancelled, False if it already finished.
+        """
+        return self._finish("cancelled")
+
+
+    def addProgressCallback(self, func):
+        """Call func(job) whenever the worker reports progress."""
+        with self._lock:
+            self._progresscallbacks.append(func)
+        return
+
+
+    def addDoneCallback(self, func):
+        """Call func(job) when the job finishes.
+
+        The function is called right away if the job has finished already.
+        """
+        with self._lock:
+            if not self.done():
+                self._donecallbacks.append(func)
+                return
+        func(self)
+        return
+
+
+    def _setProgress(self, count, chi2):
+        """Update the progress and call the progress callbacks."""
+        with self._lock:
+            if self.done():
+                return
+            self.progress = dict(count=count, chi2=chi2)
+            callbacks = self._progresscallbacks[:]
+        for func in callbacks:
+            func(self)
+        return
+
+
+    def _finish(self, status, result = None, error = None):
+        """Set the final status of the job and call the done callbacks.
+
+        Returns True if the status changed, False if the job was done.
+        """
+        with self._lock:
+            if self.done():
+                return False
+            self.status = status
+            self._result = result
+            self._error = error
+            self._snapshot = None
+            self._finished.set()
+            callbacks = self._donecallbacks
+            self._donecallbacks = []
+        for func in callbacks:
+            func(self)
+        return True
+
+# End class FitJob
+
+
+class FitService(object):
+    """Priority queue of refinements served by local worker processes.
+
+    Every worker process is managed by a thread of the service, which takes
+    the next job from the queue, sends it to the process and relays the
+    progress messages.  A cancelled or timed out refinement is stopped by
+    terminating the worker process, which is then started again.
+
+    Attributes
+    workers     --  The number of worker processes.
+    interval    --  The minimum time in seconds between the progress
+                    reports of a refinement.
+    _queue      --  Heap of (-priority, id, job) entries of queued jobs.
+    _count      --  The number of submitted jobs.
+    _cond       --  threading.Condition for the queue.
+    _running    --  Set of the running jobs.
+    _threads    --  List of the threads serving the workers.
+    _closed     --  Flag for stopping the service.
+    """
+
+    def __init__(self, workers = 1, interval = 0.5):
+        """Start the service.
+
+        workers     --  The number of worker processes (default 1).
+        interval    --  The minimum time in seconds between the progress
+                        reports of a refinement (default 0.5).
+        """
+        self.workers = workers
+        self.interval = interval
+        self._queue = []
+        self._count = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._running = set()
+        self._threads = []
+        for i in range(workers):
+            t = threading.Thread(target=self._serve,
+                    name="FitService-%i" % i)
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+        return
+
+
+    def submit(self, recipe, priority = 0, timeout = None,
+            schedule = ("all",), optimizer = None, **kw):
+        """Queue a refinement of a FitRecipe.
+
+        The recipe is pickled at once, so the later changes of the recipe do
+        not affect the job.  The FitHooks of the recipe are not used in the
+        worker.
+
+        recipe      --  The FitRecipe to refine.
+        priority    --  Jobs with higher priority are started first, jobs
+                        with the same priority in the order of submission
+                        (default 0).
+        timeout     --  The maximum time in seconds for the refinement,
+                        counted from its start.  No limit when None.
+        schedule    --  The refinement stages, see FitRecipe.refine.  The
+                        variables fixed in the recipe are not refined.
+        optimizer   --  The optimizer function, see FitRecipe.refine.  It
+                        must be picklable.
+        kw          --  Extra keyword arguments passed to the optimizer.
+
+        Returns a FitJob.
+        Raises SrFitError if the service is closed.
+        """
+        with self._cond:
+            if self._closed:
+                raise SrFitError("The FitService is closed.")
+            self._count += 1
+            kwargs = dict(schedule=schedule, optimizer=optimizer, **kw)
+            job = FitJob(self._count, recipe, priority, timeout, kwargs)
+            heapq.heappush(self._queue, (-priority, job.id, job))
+            self._cond.notify()
+        return job
+
+
+    def close(self, cancel = False):
+        """Stop the service after the queued jobs are finished.
+
+        cancel  --  Cancel the queued and running jobs when True.
+        """
+        with self._cond:
+            self._closed = True
+            jobs = [job for p, i, job in self._queue]
+            jobs += list(self._running)
+            self._cond.notify_all()
+        if cancel:
+            for job in jobs:
+                job.cancel()
+        for t in self._threads:
+            t.join()
+        self._threads = []
+        return
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(cancel=exc_type is not None)
+        return
+
+
+    def _nextJob(self):
+        """Wait for the next queued job.
+
+        Returns the job or None when the service is closed and the queue is
+        empty.
+        """
+        with self._cond:
+            while True:
+                while self._queue:
+                    job = heapq.heappop(self._queue)[2]
+                    if not job.done():
+                        self._running.add(job)
+                        return job
+                if self._closed:
+                    return None
+                self._cond.wait(1.0)
+
+
+    def _serve(self):
+        """Run the queued jobs in a worker process.
+
+        This is the main function of the service threads.
+        """
+        import multiprocessing
+        proc = conn = None
+        while True:
+            job = self._nextJob()
+            if job is None:
+                break
+            if proc is None:
+                conn, child = multiprocessing.Pipe()
+                proc = multiprocessing.Process(target=_serviceWorker,
+                        args=(child, self.interval))
+                proc.daemon = True
+                proc.start()
+                child.close()
+            with job._lock:
+                if job.done():
+                    with self._cond:
+                        self._running.discard(job)
+                    continue
+                job.status = "running"
+                job._started = time.time()
+                try:
+                    conn.send((job._snapshot, job._kwargs))
+                    sent = True
+                except (IOError, EOFError):
+                    sent = False
+            if not sent:
+                job._finish("failed", error="The worker process died.")
+            if not (sent and self._relay(job, conn)):
+                proc.terminate()
+                proc.join()
+                conn.close()
+                proc = conn = None
+            with self._cond:
+                self._running.discard(job)
+        if proc is not None:
+            try:
+                conn.send(None)
+            except (IOError, EOFError):
+                pass
+            conn.close()
+            proc.join()
+        return
+
+
+    def _relay(self, job, conn):
+        """Pass the messages of the worker process to a running job.
+
+        Returns True if the worker process can be used for the next job.
+        """
+        while True:
+            if job.done():
+                return False
+            if job.timeout is not None and \
+                    time.time() - job._started > job.timeout:
+                job._finish("timeout")
+                return False
+            if not conn.poll(0.05):
+                continue
+            try:
+                message = conn.recv()
+            except (IOError, EOFError):
+                job._finish("failed", error="The worker process died.")
+                return False
+            kind = message[0]
+            if kind == "progress":
+                job._setProgress(*message[1:])
+            elif kind == "done":
+                job._finish("done", result=message[1])
+                return True
+            else:
+                job._finish("failed", error=message[1])
+                return True
+
+# End class FitService
+
+# Helper routines ------------------------------------------------------------
+
+class _ProgressFitHook(FitHook):
+    """FitHook that reports the progress to the FitService."""
+
+    def __init__(self, conn, interval):
+        self.conn = conn
+        self.interval = interval
+        self.count = 0
+        self._lastsent = 0
+        return
+
+
+    def postcall(self, recipe, chiv):
+        import numpy
+        self.count += 1
+        now = time.time()
+        if now - self._lastsent >= self.interval:
+            self.conn.send(("progress", self.count, numpy.dot(chiv, chiv)))
+            self._lastsent = now
+        return
+
+# End class _ProgressFitHook
+
+
+def _serviceWorker(conn, interval):
+    """Refine the recipes received from the FitService.
+
+    conn        --  Connection to the service.  Each message is a pair of
+                    the pickled recipe and the keyword arguments for
+                    FitRecipe.refine.  None stops the worker.
+    interval    --  The minimum time in seconds between progress reports.
+    """
+    import cPickle
+    import traceback
+    from diffpy.srfit.fitbase.executor import SerialExecutor
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        snapshot, kwargs = message
+        try:
+            recipe = cPickle.loads(snapshot)
+            recipe._executor = SerialExecutor()
+            recipe.clearFitHooks()
+            recipe.pushFitHook(_ProgressFitHook(conn, interval))
+            stages = recipe.refine(**kwargs)
+            variables = recipe._parameters.values()
+            rv = dict(names=[v.name for v in variables],
+                    values=[v.value for v in variables],
+                    fixed=recipe.fixednames,
+                    chi2=stages[-1]["chi2"] if stages else None,
+                    stages=stages)
+            conn.send(("done", rv))
+        except Exception:
+            conn.send(("error", traceback.format_exc()))
+    conn.close()
+    return
+
+# End of file
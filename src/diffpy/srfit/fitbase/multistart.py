@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      Complex Modeling Initiative
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""Multi-start global search for the minimum of a FitRecipe.
+
+Recipes with many local minima, such as nanoparticle fits, are commonly
+refined from many random starting points.  The multiStart function samples
+the starting points within the variable bounds, runs the local refinements
+in a pool of processes with replicas of the recipe and returns FitResults of
+the distinct solutions ranked by their chi2.
+"""
+
+__all__ = ["multiStart"]
+
+import numpy
+
+from diffpy.srfit.fitbase.executor import SerialExecutor
+from diffpy.srfit.fitbase.fitresults import FitResults, _recipeRw
+
+
+def multiStart(recipe, nstarts = 20, seed = 0, workers = 1, targetrw = None,
+        tolerance = 1e-4, optimizer = None, **kw):
+    """Refine a FitRecipe from multiple starting points.
+
+    The first starting point is given by the current variable values.  The
+    other points are drawn uniformly within the bounds of the free
+    variables, the variables without finite bounds keep their current
+    values.  The local refinements run on replicas of the recipe, the recipe
+    is set to the best solution on return.
+
+    recipe      --  The FitRecipe to refine.
+    nstarts     --  The number of starting points (default 20).
+    seed        --  Seed of the random starting points (default 0).  The
+                    same seed gives the same starting points.
+    workers     --  The number of worker processes for the local
+                    refinements (default 1).  The refinements run in the
+                    calling process when 1.
+    targetrw    --  Stop when a solution with Rw at or below targetrw is
+                    found (default None).  With several workers the set of
+                    completed refinements depends on their timing.
+    tolerance   --  The relative tolerance for the duplicate solutions
+                    (default 1e-4).  The variable differences are relative
+                    to the bounds range, or absolute for unbounded
+                    variables.
+    optimizer   --  Function optimizer(fun, x0, jac, **kw) that returns the
+                    optimized values, see FitRecipe.refine.  It must be
+                    picklable when workers is larger than 1.  Use
+                    scipy.optimize.leastsq when None.
+    kw          --  Extra keyword arguments passed to the optimizer.
+
+    Returns a list of FitResults of the distinct solutions sorted by chi2.
+    """
+    from diffpy.srfit.fitbase.snapshot import RecipeSnapshot
+    recipe._prepare()
+    starts = _sampleStarts(recipe, nstarts, seed)
+    snapshot = RecipeSnapshot(recipe)
+    tasks = list(enumerate(starts))
+    solutions = []
+    if workers > 1 and len(tasks) > 1:
+        import multiprocessing
+        nproc = min(workers, len(tasks))
+        pool = multiprocessing.Pool(nproc, _initSearchWorker,
+                (snapshot, optimizer, kw))
+        try:
+            for sol in pool.imap_unordered(_searchWorkerRefine, tasks):
+                solutions.append(sol)
+                if _reachedTarget(sol, targetrw):
+                    break
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        _initSearchWorker(snapshot, optimizer, kw)
+        try:
+            for task in tasks:
+                sol = _searchWorkerRefine(task)
+                solutions.append(sol)
+                if _reachedTarget(sol, targetrw):
+                    break
+        finally:
+            _searchworker.clear()
+    # Rank the solutions and drop the duplicates.
+    lb, ub = recipe.getBounds2()
+    span = ub - lb
+    scale = numpy.where(numpy.isfinite(span) & (span > 0), span, 1.0)
+    solutions.sort(key = lambda sol : (sol[2], sol[0]))
+    unique = []
+    for sol in solutions:
+        if not any(numpy.all(numpy.abs(sol[1] - u[1]) <= tolerance * scale)
+                for u in unique):
+            unique.append(sol)
+    # The FitHooks are not called for the evaluation of the results.  The
+    # full FitResults are calculated only for the returned solutions.
+    fithooks = recipe.getFitHooks()
+    recipe.clearFitHooks()
+    rv = []
+    try:
+        for i, x, chi2, rw in unique:
+            recipe.residual(x)
+            rv.append(FitResults(recipe))
+        if unique:
+            recipe.residual(unique[0][1])
+    finally:
+        recipe.fithooks[:] = fithooks
+        recipe._updateStageHooks()
+    return rv
+
+# Helper routines ------------------------------------------------------------
+
+def _sampleStarts(recipe, nstarts, seed):
+    """Return an array of the starting points for multiStart.
+
+    The first row holds the current values of the free variables.
+    """
+    x0 = numpy.asarray(recipe.getValues(), dtype=float)
+    lb, ub = recipe.getBounds2()
+    lb = numpy.asarray(lb, dtype=float)
+    ub = numpy.asarray(ub, dtype=float)
+    bounded = numpy.isfinite(lb) & numpy.isfinite(ub)
+    rng = numpy.random.RandomState(seed)
+    u = rng.random_sample((max(nstarts - 1, 0), len(x0)))
+    starts = numpy.tile(x0, (max(nstarts - 1, 0), 1))
+    starts[:, bounded] = lb[bounded] + u[:, bounded] * (ub - lb)[bounded]
+    return numpy.vstack([x0[numpy.newaxis, :], starts])[:nstarts]
+
+
+def _reachedTarget(sol, targetrw):
+    """Check if solution sol has Rw at or below targetrw."""
+    return targetrw is not None and sol[3] <= targetrw
+
+
+# Data of the worker process, these are set in _initSearchWorker.
+_searchworker = {}
+
+def _initSearchWorker(snapshot, optimizer, kw):
+    """Initialize a recipe replica for the local refinements."""
+    from diffpy.srfit.fitbase.fitrecipe import _leastsqOptimizer
+    recipe = snapshot.load()
+    recipe._executor = SerialExecutor()
+    recipe.clearFitHooks()
+    _searchworker.update(recipe=recipe,
+            optimizer=optimizer or _leastsqOptimizer, kw=kw)
+    return
+
+
+def _searchWorkerRefine(task):
+    """Refine the recipe replica from a starting point.
+
+    task    --  Pair of the start index and the starting values.
+
+    Returns a tuple of the start index, the optimized values, chi2 and Rw.
+    """
+    i, x0 = task
+    w = _searchworker
+    recipe = w['recipe']
+    x = w['optimizer'](recipe.residual, x0, recipe.jacobian, **w['kw'])
+    x = numpy.array(x, dtype=float)
+    chi2 = recipe.scalarResidual(x)
+    rw = _recipeRw(recipe)
+    return (i, x, chi2, rw)
+
+# End of file
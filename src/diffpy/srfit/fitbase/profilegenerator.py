@@ -121,6 +121,20 @@ class ProfileGenerator(Operator, ParameterSet):
         """
         return x
 
+    def derivatives(self, x, pars):
+        """Calculate the derivatives of the profile.
+
+        This method can be overloaded to supply analytical derivatives, the
+        default implementation returns None.
+
+        x       --  The independent variable to calculate over.
+        pars    --  List of Parameters of this ProfileGenerator.
+
+        Return a list of the profile derivatives with respect to pars, or None
+        when the derivatives should be calculated numerically.
+        """
+        return None
+
     ## No need to overload anything below here
 
     def operation(self):
@@ -132,6 +146,14 @@ class ProfileGenerator(Operator, ParameterSet):
         return y
 
 
+    def operationDerivatives(self, pars):
+        """Calculate the derivatives of the profile.
+
+        Return the result of derivatives(profile.x, pars).
+        """
+        return self.derivatives(self.profile.x, pars)
+
+
     def setProfile(self, profile):
         """Assign the profile.
 
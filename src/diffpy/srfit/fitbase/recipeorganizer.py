@@ -34,7 +34,7 @@ from diffpy.srfit.fitbase.parameter import Parameter
 from diffpy.srfit.fitbase.configurable import Configurable
 from diffpy.srfit.fitbase.validatable import Validatable
 
-from diffpy.srfit.util.observable import Observable
+from diffpy.srfit.util.observable import Observable, notificationBatch
 from diffpy.srfit.equation import Equation
 from diffpy.srfit.equation.builder import EquationFactory
 from diffpy.srfit.util.nameutils import validateName
@@ -385,6 +385,23 @@ class RecipeOrganizer(_recipeorganizer_interface, RecipeContainer):
 
     # Parameter management
 
+    def batchUpdate(self):
+        """Context manager for changing many Parameter values at once.
+
+        The change notifications within the context are postponed.  When the
+        context exits, they are propagated in a single wave, where each
+        dependent object is invalidated only once.  Equations that depend on
+        the changed Parameters must not be evaluated within the context.
+
+        Example:
+        > with recipe.batchUpdate():
+        >     for par, value in zip(pars, values):
+        >         par.setValue(value)
+
+        Returns a context manager.
+        """
+        return notificationBatch()
+
     def _newParameter(self, name, value, check=True):
         """Add a new Parameter to the container.
 
@@ -21,15 +21,17 @@ function for breaking a restraint. This penalty is added to the residual
 equation calculated by a FitRecipe.
 """
 
-__all__ = ["Restraint"]
+__all__ = ["Restraint", "RestraintGroup"]
 
+import numpy
 from numpy import inf
 
 from diffpy.srfit.fitbase.validatable import Validatable
+from diffpy.srfit.util.observable import Observable
 from diffpy.srfit.exceptions import SrFitError
 
 
-class Restraint(Validatable):
+class Restraint(Observable, Validatable):
     """Restraint class.
 
     Attributes
@@ -47,8 +49,23 @@ class Restraint(Validatable):
     and val is the value of the calculated equation.  This is multipled by the
     average chi^2 if scaled is True.
 
+    The observers are notified when lb, ub, sig or scaled change.
+
     """
 
+    # Restraints of the derived classes that do not call Restraint.__init__
+    # have no observers until addObserver creates their set.
+    _observers = frozenset()
+
+    lb = property(lambda self : self._lb,
+            lambda self, val : self._setOption("_lb", float(val)))
+    ub = property(lambda self : self._ub,
+            lambda self, val : self._setOption("_ub", float(val)))
+    sig = property(lambda self : self._sig,
+            lambda self, val : self._setOption("_sig", float(val)))
+    scaled = property(lambda self : self._scaled,
+            lambda self, val : self._setOption("_scaled", bool(val)))
+
     def __init__(self, eq, lb = -inf, ub = inf, sig = 1, scaled = False):
         """Restrain an equation to specified bounds.
 
@@ -64,6 +81,7 @@ class Restraint(Validatable):
                     (bool, default False).
 
         """
+        Observable.__init__(self)
         self.eq = eq
         self.lb = float(lb)
         self.ub = float(ub)
@@ -88,6 +106,48 @@ class Restraint(Validatable):
 
         return penalty
 
+    def addObserver(self, callable):
+        """Add callable to the set of observers.
+
+        The set of observers is created here for the derived classes that do
+        not call Restraint.__init__.
+        """
+        if "_observers" not in self.__dict__:
+            self._observers = set()
+        Observable.addObserver(self, callable)
+        return
+
+    def _setOption(self, name, value):
+        """Set the attribute of a bound option and notify the observers."""
+        self.__dict__[name] = value
+        self.notify()
+        return
+
+    def residualDerivatives(self, seeds, step = 1e-8):
+        """Calculate the derivatives of the unscaled restraint residual.
+
+        The restraint residual is sqrt(penalty(1)), which is equal to
+        max(0, lb - val, val - ub)/sig.
+
+        seeds   --  Dictionary of derivative seeds indexed by Parameter, see
+                    diffpy.srfit.equation.visitors.Differentiator.
+        step    --  The fractional step size for operations that are
+                    differentiated numerically (default 1e-8).
+
+        Returns a dictionary of the derivatives indexed by the seed keys or
+        None if the derivatives cannot be evaluated.
+        """
+        from diffpy.srfit.equation.visitors import Differentiator
+        val, ders = self.eq.identify(Differentiator(seeds, step))
+        if self.lb - val > 0:
+            sgn = -1.0
+        elif val - self.ub > 0:
+            sgn = 1.0
+        else:
+            return {}
+        rv = dict((k, sgn * dk / self.sig) for k, dk in ders.items())
+        return rv
+
     def _validate(self):
         """Validate my state.
 
@@ -117,4 +177,139 @@ class Restraint(Validatable):
 
 # End class Restraint
 
+
+class RestraintGroup(object):
+    """Restraints evaluated together with array operations.
+
+    The values of the restraints with affine equations, such as bounds on a
+    single Parameter, are calculated as one sparse matrix transform of their
+    input Arguments, see diffpy.srfit.fitbase.affineconstraints.  The other
+    restraint equations are evaluated one by one.  The bound arrays are
+    updated when the bounds of the Restraints change.  Only the Restraints
+    that use the penalty method of the Restraint class can be grouped, see
+    isGroupable.
+
+    Attributes
+    restraints  --  List of the grouped Restraints.
+    lb          --  Array of the lower bounds.
+    ub          --  Array of the upper bounds.
+    sig         --  Array of the uncertainties on the bounds.
+    scaled      --  Boolean array of the scaled flags.
+    _stale      --  Flag for the bound arrays that need an update.
+    _rows       --  Indices of the restraints with affine equations.
+    _others     --  Indices of the other restraints.
+    _matrix     --  Sparse matrix of the affine restraints, see
+                    affineTransform.
+    _offset     --  Array of the constant terms of the affine restraints.
+    _inputs     --  List of the input Arguments of the affine restraints.
+    """
+
+    def __init__(self, restraints):
+        """Group the Restraints.
+
+        restraints  --  List of Restraints, see isGroupable.
+        """
+        from diffpy.srfit.equation.visitors import AffineDecomposer
+        from diffpy.srfit.fitbase.affineconstraints import affineTransform
+        self.restraints = list(restraints)
+        visitor = AffineDecomposer()
+        forms = [res.eq.identify(visitor) for res in self.restraints]
+        self._rows = [i for i, f in enumerate(forms) if f is not None]
+        self._others = [(i, self.restraints[i])
+                for i, f in enumerate(forms) if f is None]
+        self._matrix, self._offset, self._inputs = affineTransform(
+                [forms[i] for i in self._rows], visitor.inputs)
+        self._updateBounds()
+        for res in self.restraints:
+            res.addObserver(self._flush)
+        return
+
+
+    def __len__(self):
+        """Number of the grouped Restraints."""
+        return len(self.restraints)
+
+
+    @staticmethod
+    def isGroupable(res):
+        """Check if Restraint res can be evaluated in a group.
+
+        This is True for Restraints with a scalar value that do not override
+        the penalty method.
+        """
+        penalty = getattr(type(res).penalty, "__func__", None)
+        if penalty is not Restraint.penalty.__func__:
+            return False
+        return numpy.ndim(res.eq()) == 0
+
+
+    def values(self):
+        """Calculate the values of the restraint equations.
+
+        Returns an array of the values.
+        """
+        val = numpy.empty(len(self.restraints), dtype=float)
+        if self._rows:
+            x = numpy.array([a.getValue() for a in self._inputs],
+                    dtype=float)
+            val[self._rows] = self._matrix.dot(x) + self._offset
+        for i, res in self._others:
+            val[i] = res.eq()
+        return val
+
+
+    def residual(self, w = 1.0, out = None):
+        """Calculate the residual terms of the restraints.
+
+        These are the square roots of the Restraint penalties.
+
+        w   --  The point-average chi^2 which is optionally used to scale the
+                penalties (default 1.0).
+        out --  Optional array where the results are stored.
+
+        Returns an array of the residual terms.
+        """
+        return self.residualFromValues(self.values(), w, out)
+
+
+    def residualFromValues(self, val, w = 1.0, out = None):
+        """Calculate the residual terms for given values of the restraints.
+
+        val --  Array of the restraint values.  The last axis indexes the
+                restraints, the leading axes are broadcast with w.
+        w   --  The point-average chi^2 for the scaled penalties
+                (default 1.0).
+        out --  Optional array where the results are stored.
+
+        Returns an array of the residual terms of the same shape as val.
+        """
+        if self._stale:
+            self._updateBounds()
+        penalty = numpy.maximum(self.lb - val, val - self.ub)
+        numpy.maximum(penalty, 0, out=penalty)
+        penalty /= self.sig
+        penalty **= 2
+        penalty[..., self.scaled] *= w
+        return numpy.sqrt(penalty, out=out)
+
+
+    def _updateBounds(self):
+        """Copy the bounds of the Restraints to the bound arrays."""
+        self.lb = numpy.array([res.lb for res in self.restraints], dtype=float)
+        self.ub = numpy.array([res.ub for res in self.restraints], dtype=float)
+        self.sig = numpy.array([res.sig for res in self.restraints],
+                dtype=float)
+        self.scaled = numpy.array([res.scaled for res in self.restraints],
+                dtype=bool)
+        self._stale = False
+        return
+
+
+    def _flush(self, other):
+        """Mark the bound arrays for update."""
+        self._stale = True
+        return
+
+# End class RestraintGroup
+
 # End of file
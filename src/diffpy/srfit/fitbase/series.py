@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      Complex Modeling Initiative
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""Sequential refinement of a FitRecipe for a series of datasets.
+
+Temperature, doping or time series are refined with the same recipe, one
+dataset after another.  Each refinement starts from the result of the
+previous point, or from a linear extrapolation of the two previous points.
+The SeriesRefinement class streams the datasets through the recipe and
+records the refined variables of every point in a SeriesStore.  The store is
+saved after each point as a compact columnar npz file, so an interrupted
+series resumes from the last saved point.  Independent series, or chains,
+can be refined in parallel processes.
+"""
+
+__all__ = ["SeriesRefinement", "SeriesStore"]
+
+import os
+import time
+
+import numpy
+
+from diffpy.srfit.fitbase.executor import SerialExecutor
+from diffpy.srfit.fitbase.fitresults import _recipeRw
+
+
+class SeriesStore(object):
+    """Columnar store of the results of a series refinement.
+
+    Attributes
+    names   --  List of the variable names, the columns of values.
+    labels  --  List of the dataset labels, one for each point.
+    _rows   --  List of the (values, chi2, rw, time) tuples of the points.
+                The rows are stacked into arrays on demand.
+
+    Properties
+    values  --  Array of the variable values of shape (npoints, nvars).
+    chi2    --  Array of the chi2 of the points.
+    rw      --  Array of the Rw of the points.
+    time    --  Array of the refinement times of the points in seconds.
+    """
+
+    values = property(lambda self: numpy.array(
+        [r[0] for r in self._rows], dtype=float).reshape(-1, len(self.names)),
+        doc='array of the variable values of shape (npoints, nvars)')
+    chi2 = property(lambda self: self._column(1),
+        doc='array of the chi2 of the points')
+    rw = property(lambda self: self._column(2),
+        doc='array of the Rw of the points')
+    time = property(lambda self: self._column(3),
+        doc='array of the refinement times of the points in seconds')
+
+    def __init__(self, names = ()):
+        """Create an empty store.
+
+        names   --  List of the variable names.
+        """
+        self.names = list(names)
+        self.labels = []
+        self._rows = []
+        return
+
+
+    def __len__(self):
+        """Number of stored points."""
+        return len(self.labels)
+
+
+    def append(self, label, values, chi2, rw, time):
+        """Add the results of a point.
+
+        label   --  The dataset label.
+        values  --  The variable values in the order of names.
+        chi2    --  The chi2 of the point.
+        rw      --  The Rw of the point.
+        time    --  The refinement time in seconds.
+        """
+        self.labels.append(str(label))
+        row = numpy.array(values, dtype=float).reshape(-1)
+        self._rows.append((row, float(chi2), float(rw), float(time)))
+        return
+
+
+    def column(self, name):
+        """Get the values of variable name for all points."""
+        return self.values[:, self.names.index(name)]
+
+
+    def _column(self, index):
+        """Stack the scalar results at index of the rows into an array."""
+        return numpy.array([r[index] for r in self._rows], dtype=float)
+
+
+    def save(self, filename):
+        """Save the store to an npz file.
+
+        The store is written to a temporary file, which is then renamed to
+        filename.  The rename is atomic on POSIX systems, so the file stays
+        valid if the saving is interrupted.  On Windows the old file is
+        removed before the rename, unless os.replace is available.
+        """
+        tmpname = filename + ".tmp"
+        with open(tmpname, "wb") as fp:
+            numpy.savez(fp, names=numpy.array(self.names, dtype=str),
+                    labels=numpy.array(self.labels, dtype=str),
+                    values=self.values, chi2=self.chi2, rw=self.rw,
+                    time=self.time)
+        replace = getattr(os, "replace", None)
+        if replace is None:
+            if os.name == "nt" and os.path.exists(filename):
+                os.remove(filename)
+            replace = os.rename
+        replace(tmpname, filename)
+        return
+
+
+    @classmethod
+    def load(cls, filename):
+        """Load a store from an npz file created by save."""
+        with numpy.load(filename) as data:
+            store = cls(data["names"].tolist())
+            store.labels = data["labels"].tolist()
+            values = data["values"].reshape(-1, len(store.names))
+            store._rows = zip(values, data["chi2"].tolist(),
+                    data["rw"].tolist(), data["time"].tolist())
+        return store
+
+# End class SeriesStore
+
+
+class SeriesRefinement(object):
+    """Refine a FitRecipe for a series of datasets with warm starts.
+
+    Attributes
+    recipe      --  The FitRecipe to refine.
+    loader      --  Function loader(recipe, item) that loads the dataset item
+                    into the recipe, e.g., with FitContribution.loadData.
+                    It must be picklable for the parallel chains.
+    schedule    --  The refinement stages for every point, see
+                    FitRecipe.refine (default ("all",)).
+    extrapolate --  Flag for starting from the linear extrapolation of the
+                    two previous points instead of the previous point
+                    (default False).
+    optimizer   --  The optimizer for FitRecipe.refine or None for the
+                    default.
+    kw          --  Dictionary of the extra optimizer arguments.
+    """
+
+    def __init__(self, recipe, loader, schedule = ("all",),
+            extrapolate = False, optimizer = None, **kw):
+        """Initialize the attributes, see the class documentation."""
+        self.recipe = recipe
+        self.loader = loader
+        self.schedule = schedule
+        self.extrapolate = extrapolate
+        self.optimizer = optimizer
+        self.kw = kw
+        return
+
+
+    def run(self, items, filename = None, labels = None):
+        """Refine the recipe for a series of datasets.
+
+        items       --  Sequence of the datasets passed to the loader, e.g.,
+                        file names.
+        filename    --  The npz file of the SeriesStore, which is saved
+                        after every point.  When the file exists, the points
+                        stored in it are skipped and the series resumes from
+                        the last stored values.  No file is written when
+                        None (default).
+        labels      --  Labels of the items in the store.  Use str of the
+                        items when None (default).
+
+        Returns the SeriesStore with the results of all points.
+        Raises ValueError if the stored labels do not match the series.
+        """
+        items = list(items)
+        labels = map(str, items) if labels is None else map(str, labels)
+        recipe = self.recipe
+        names = recipe._parameters.keys()
+        if filename is not None and os.path.exists(filename):
+            store = SeriesStore.load(filename)
+            if (store.names != names or
+                    store.labels != labels[:len(store)]):
+                emsg = "Results in %r do not match the series" % filename
+                raise ValueError(emsg)
+        else:
+            store = SeriesStore(names)
+        # Every point is refined from the fixed and free variables of the
+        # call, refine leaves only the variables of its last stage free.
+        unfixed = recipe._getUnfixedVars()
+        for i in range(len(store), len(items)):
+            self._setStart(store)
+            self.loader(recipe, items[i])
+            t0 = time.time()
+            stages = recipe.refine(self.schedule, self.optimizer, **self.kw)
+            recipe._setUnfixedVars(unfixed)
+            chi2 = stages[-1]["chi2"] if stages else recipe.scalarResidual()
+            values = [v.value for v in recipe._parameters.values()]
+            rw = _recipeRw(recipe)
+            store.append(labels[i], values, chi2, rw, time.time() - t0)
+            if filename is not None:
+                store.save(filename)
+        return store
+
+
+    def runChains(self, chains, filenames = None, workers = 1):
+        """Refine several independent series.
+
+        Every chain is refined from the current recipe values with a replica
+        of this object, which is loaded from a RecipeSnapshot that shares
+        the Profile arrays of the recipe.
+
+        chains      --  List of the item sequences, see run.
+        filenames   --  List of the store files of the chains, or None.
+        workers     --  The number of worker processes (default 1).  The
+                        chains are refined in the calling process when 1.
+
+        Returns a list of the SeriesStore results of the chains.
+        """
+        from diffpy.srfit.fitbase.snapshot import RecipeSnapshot
+        from diffpy.srfit.fitbase.snapshot import _profileArrays
+        chains = [list(c) for c in chains]
+        if filenames is None:
+            filenames = [None] * len(chains)
+        snapshot = RecipeSnapshot(self, _profileArrays(self.recipe))
+        tasks = zip(chains, filenames)
+        if workers > 1 and len(tasks) > 1:
+            import multiprocessing
+            pool = multiprocessing.Pool(min(workers, len(tasks)),
+                    _initSeriesWorker, (snapshot,))
+            try:
+                return pool.map(_seriesWorkerRun, tasks)
+            finally:
+                pool.close()
+                pool.join()
+        return [snapshot.load().run(items, filename)
+                for items, filename in tasks]
+
+
+    def _setStart(self, store):
+        """Set the recipe variables to the start of the next point.
+
+        The start is the last stored point or the extrapolation of the two
+        last points.  The recipe is not changed for an empty store.
+        """
+        if not len(store):
+            return
+        start = store._rows[-1][0]
+        if self.extrapolate and len(store) > 1:
+            start = 2 * start - store._rows[-2][0]
+        recipe = self.recipe
+        with recipe.batchUpdate():
+            for var, value in zip(recipe._parameters.values(), start):
+                var.setValue(value)
+        return
+
+# End class SeriesRefinement
+
+# Helper routines ------------------------------------------------------------
+
+# Data of the worker process, these are set in _initSeriesWorker.
+_seriesworker = {}
+
+def _initSeriesWorker(snapshot):
+    """Initialize worker process for SeriesRefinement.runChains."""
+    _seriesworker.update(snapshot=snapshot)
+    return
+
+
+def _seriesWorkerRun(task):
+    """Refine one chain with a fresh replica in the worker process."""
+    items, filename = task
+    series = _seriesworker['snapshot'].load()
+    series.recipe._executor = SerialExecutor()
+    return series.run(items, filename)
+
+# End of file
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      Complex Modeling Initiative
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""Snapshots of FitRecipes for cloning and worker processes.
+
+A RecipeSnapshot splits a pickled object into a skeleton and data buffers.
+The skeleton is the pickle of the object without the observed arrays of its
+Profiles, which are kept as a list of numpy arrays.  Loading the snapshot
+creates a copy of the object that shares the buffers instead of copying them.
+Worker processes started by fork inherit the buffers without pickling, and a
+snapshot saved to a directory loads the buffers as memory-mapped files.
+
+The Profile arrays must not be modified in place, which is the case for all
+Profile methods.
+"""
+
+__all__ = ["RecipeSnapshot"]
+
+import os
+import cPickle
+from cStringIO import StringIO
+
+import numpy
+
+
+class RecipeSnapshot(object):
+    """Pickled skeleton of an object with separate data buffers.
+
+    Attributes
+    skeleton    --  The pickle string of the object without the buffers.
+    buffers     --  List of the shared numpy arrays.
+    """
+
+    def __init__(self, obj = None, shared = ()):
+        """Create the snapshot of obj.
+
+        obj     --  The object to snapshot, typically a FitRecipe.  The
+                    snapshot is empty when None.
+        shared  --  Extra arrays to be stored as buffers.  The arrays of the
+                    Profiles in obj are always stored as buffers.
+        """
+        self.skeleton = None
+        self.buffers = []
+        if obj is None:
+            return
+        arrays = _profileArrays(obj) + list(shared)
+        keys = dict((id(a), None) for a in arrays
+                if isinstance(a, numpy.ndarray))
+        buffers = self.buffers
+        def persistent_id(o):
+            k = id(o)
+            if k not in keys:
+                return None
+            if keys[k] is None:
+                keys[k] = str(len(buffers))
+                buffers.append(o)
+            return keys[k]
+        fp = StringIO()
+        pickler = cPickle.Pickler(fp, cPickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = persistent_id
+        pickler.dump(obj)
+        self.skeleton = fp.getvalue()
+        return
+
+
+    def load(self):
+        """Create a new copy of the object that uses the buffers."""
+        buffers = self.buffers
+        unpickler = cPickle.Unpickler(StringIO(self.skeleton))
+        unpickler.persistent_load = lambda k : buffers[int(k)]
+        return unpickler.load()
+
+
+    def save(self, dirname):
+        """Save the snapshot to a directory.
+
+        The skeleton is saved in the "skeleton.pkl" file and the buffers in
+        the "bufferN.npy" files.  The directory is created if necessary.
+        """
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        for i, a in enumerate(self.buffers):
+            numpy.save(os.path.join(dirname, "buffer%i.npy" % i), a)
+        with open(os.path.join(dirname, "skeleton.pkl"), "wb") as fp:
+            cPickle.dump((len(self.buffers), self.skeleton), fp,
+                    cPickle.HIGHEST_PROTOCOL)
+        return
+
+
+    @classmethod
+    def open(cls, dirname, mmap_mode = "r"):
+        """Open a snapshot saved to a directory.
+
+        dirname     --  The directory of the saved snapshot.
+        mmap_mode   --  The memory-map mode of the buffers, see numpy.load.
+                        The buffers are read in memory when None.  The
+                        default "r" shares the read-only buffers between
+                        all processes that open the snapshot.
+
+        Returns a RecipeSnapshot.
+        """
+        with open(os.path.join(dirname, "skeleton.pkl"), "rb") as fp:
+            n, skeleton = cPickle.load(fp)
+        rv = cls()
+        rv.skeleton = skeleton
+        rv.buffers = [numpy.load(os.path.join(dirname, "buffer%i.npy" % i),
+            mmap_mode=mmap_mode) for i in range(n)]
+        return rv
+
+# End class RecipeSnapshot
+
+# Helper routines ------------------------------------------------------------
+
+def _profileArrays(obj):
+    """Get the arrays of the Profiles in a FitRecipe or FitContribution."""
+    from diffpy.srfit.fitbase.profile import Profile
+    if isinstance(obj, Profile):
+        profiles = [obj]
+    else:
+        contributions = getattr(obj, "_contributions", None)
+        if contributions is not None:
+            contributions = contributions.values()
+        else:
+            contributions = [obj]
+        profiles = [getattr(c, "profile", None) for c in contributions]
+    rv = []
+    for p in profiles:
+        if isinstance(p, Profile):
+            rv += [p._xobs, p._yobs, p._dyobs, p.x, p.y, p.dy]
+    return rv
+
+# End of file
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      Complex Modeling Initiative
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""Low overhead recording of the residual calculation timings.
+
+The TelemetryFitHook records a timestamp at the start of every residual call,
+after each stage of the calculation and at its end.  The records are kept in
+preallocated numpy arrays that are used as a ring buffer, so the oldest
+records are overwritten and no memory is allocated during the refinement.
+The records can be saved to a npz file or to a JSON file in the Chrome trace
+event format, which can be viewed in chrome://tracing or Perfetto.
+"""
+
+__all__ = ["TelemetryFitHook"]
+
+import os
+import time
+import json
+
+import numpy
+
+from diffpy.srfit.fitbase.fithook import FitHook
+
+
+# Use a monotonic clock when available.
+_clock = getattr(time, "monotonic", None)
+if _clock is None:
+    from timeit import default_timer as _clock
+
+# Names of the recorded events, the record codes are their indices.
+STAGES = ("precall", "update", "contribution", "contributions",
+        "restraints", "postcall")
+
+
+class TelemetryFitHook(FitHook):
+    """FitHook that records the timings of the residual calculation.
+
+    Every record has the residual call number, the event code, the index of
+    the FitContribution and the time.  The event codes are the indices in
+    STAGES.  The "precall" event marks the start of a residual call, the
+    other events the end of a stage, see FitHook.stage.
+
+    Attributes
+    size    --  The capacity of the ring buffer.
+    count   --  The number of residual calls since the last clear.
+    _n      --  The number of records since the last clear.
+    _calls  --  Array of the residual call numbers.
+    _codes  --  Array of the event codes.
+    _index  --  Array of the FitContribution indices, -1 for other events.
+    _times  --  Array of the event times in seconds.
+    """
+
+    stages = True
+
+    def __init__(self, size = 100000):
+        """Allocate the ring buffer.
+
+        size    --  The maximum number of kept records (default 100000).
+        """
+        self.size = size
+        self._calls = numpy.zeros(size, dtype=numpy.int64)
+        self._codes = numpy.zeros(size, dtype=numpy.int8)
+        self._index = numpy.zeros(size, dtype=numpy.int32)
+        self._times = numpy.zeros(size, dtype=float)
+        self.clear()
+        return
+
+
+    def clear(self):
+        """Remove all records."""
+        self.count = 0
+        self._n = 0
+        return
+
+
+    def precall(self, recipe):
+        """Record the start of a residual call."""
+        self.count += 1
+        self._record(0, -1)
+        return
+
+
+    def stage(self, recipe, name, index = -1):
+        """Record the end of a stage of the residual calculation."""
+        self._record(_stagecodes[name], index)
+        return
+
+
+    def postcall(self, recipe, chiv):
+        """Record the end of a residual call."""
+        self._record(5, -1)
+        return
+
+
+    def _record(self, code, index):
+        """Store one record in the ring buffer."""
+        i = self._n % self.size
+        self._calls[i] = self.count
+        self._codes[i] = code
+        self._index[i] = index
+        self._times[i] = _clock()
+        self._n += 1
+        return
+
+
+    def getRecords(self):
+        """Get the kept records in the chronological order.
+
+        Returns a dictionary of the "calls", "codes", "index" and "times"
+        arrays.
+        """
+        n = min(self._n, self.size)
+        order = numpy.arange(self._n - n, self._n) % self.size
+        rv = dict(calls=self._calls[order], codes=self._codes[order],
+                index=self._index[order], times=self._times[order])
+        return rv
+
+
+    def getDurations(self):
+        """Get the durations of the calculation stages.
+
+        The duration of a stage is the time since the previous event of the
+        same residual call.  Stages at the start of the ring buffer with
+        an overwritten previous event are skipped.
+
+        Returns a dictionary of duration arrays in seconds indexed by the
+        stage names.  The "residual" item has the durations of the complete
+        residual calls.
+        """
+        rec = self.getRecords()
+        calls, codes, times = rec["calls"], rec["codes"], rec["times"]
+        same = calls[1:] == calls[:-1]
+        dt = numpy.diff(times)
+        rv = {}
+        for code, name in enumerate(STAGES[1:], 1):
+            rv[name] = dt[same & (codes[1:] == code)]
+        # complete calls have both precall and postcall records
+        start = dict(zip(calls[codes == 0], times[codes == 0]))
+        ends = [(c, t) for c, t in zip(calls[codes == 5], times[codes == 5])
+                if c in start]
+        rv["residual"] = numpy.array([t - start[c] for c, t in ends])
+        return rv
+
+
+    def save(self, filename):
+        """Save the records and the stage names to a npz file."""
+        rec = self.getRecords()
+        numpy.savez(filename, stages=numpy.array(STAGES), **rec)
+        return
+
+
+    def saveChromeTrace(self, filename):
+        """Save the records to a JSON file in the Chrome trace format.
+
+        Every residual call and every stage is saved as a complete event
+        with the times in microseconds.
+        """
+        rec = self.getRecords()
+        pid = os.getpid()
+        events = []
+        start = prev = None
+        for call, code, index, t in zip(rec["calls"], rec["codes"],
+                rec["index"], rec["times"]):
+            call, code, index = int(call), int(code), int(index)
+            t = t * 1e6
+            if code == 0:
+                start = prev = (call, t)
+                continue
+            if prev is None or prev[0] != call:
+                continue
+            name = STAGES[code]
+            args = dict(call=call)
+            if index >= 0:
+                name += "[%i]" % index
+                args.update(index=index)
+            if code == 5:
+                events.append(dict(name="residual", cat="srfit", ph="X",
+                    ts=start[1], dur=t - start[1], pid=pid, tid=0,
+                    args=dict(call=call)))
+            else:
+                events.append(dict(name=name, cat="srfit", ph="X",
+                    ts=prev[1], dur=t - prev[1], pid=pid, tid=0, args=args))
+            prev = (call, t)
+        with open(filename, "w") as fp:
+            json.dump(dict(traceEvents=events, displayTimeUnit="ms"), fp)
+        return
+
+# End class TelemetryFitHook
+
+# Helper routines ------------------------------------------------------------
+
+_stagecodes = dict((name, i) for i, name in enumerate(STAGES))
+
+# End of file
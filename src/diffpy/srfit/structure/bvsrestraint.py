@@ -79,6 +79,13 @@ class BVSRestraint(Restraint):
 
         return penalty
 
+    def residualDerivatives(self, seeds, step = 1e-8):
+        """The BVS derivatives are not available, return None.
+
+        FitRecipe differentiates this restraint numerically.
+        """
+        return None
+
     def _validate(self):
         """This evaluates the calculator.
 
@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      Complex Modeling Initiative
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""Benchmarks of the FitRecipe hot paths.
+
+The benchmarks use synthetic recipes with pure numpy ProfileGenerators, which
+are scaled in the number of variables, constraints, restraints,
+FitContributions and profile points.  For every benchmark case it times the
+FitRecipe._prepare, residual and jacobian methods, FitResults.update,
+EquationFactory.makeEquation and the ordering of the constraints.  The
+constraints cases use chains of 100 to 1600 constraints, where the times of
+the preparation and ordering should grow linearly with the chain length.
+The results can be written to a JSON file and compared to a baseline file
+from an earlier run.
+
+Usage:
+
+    python -m diffpy.srfit.tests.benchmark -o results.json
+    python -m diffpy.srfit.tests.benchmark -b results.json
+
+The exit code is 1 when a benchmark is slower than the baseline by more than
+the tolerance.
+"""
+
+from __future__ import print_function
+
+import re
+import sys
+import json
+import platform
+import time
+from timeit import default_timer
+
+import numpy
+
+from diffpy.srfit.fitbase import FitContribution, FitRecipe, FitResults
+from diffpy.srfit.fitbase import Profile, ProfileGenerator
+from diffpy.srfit.equation.builder import EquationFactory
+
+# Benchmark cases, the keyword arguments of makeRecipe.
+CASES = [
+    ("base", dict()),
+    ("compiled", dict(compiled=True)),
+    ("points", dict(npoints=100000)),
+    ("peaks", dict(npeaks=30)),
+    ("contributions", dict(ncontributions=10)),
+    ("constraints100", dict(nconstraints=100)),
+    ("constraints400", dict(nconstraints=400)),
+    ("constraints1600", dict(nconstraints=1600)),
+    ("restraints", dict(nrestraints=200)),
+]
+
+# Timed operations, see the _bench functions below.
+OPERATIONS = ("prepare", "residual", "jacobian", "fitresults",
+        "makeequation", "order")
+
+
+class PeaksGenerator(ProfileGenerator):
+    """Sum of Gaussian peaks calculated with numpy.
+
+    The peak i has the amplitude a<i>, position c<i> and width w<i>.
+    """
+
+    def __init__(self, name, npeaks):
+        """Create the peak Parameters.
+
+        npeaks  --  The number of peaks.
+        """
+        ProfileGenerator.__init__(self, name)
+        self.npeaks = npeaks
+        for i in range(npeaks):
+            self._newParameter("a%i" % i, 1.0)
+            self._newParameter("c%i" % i, 10.0 * (i + 0.5) / npeaks)
+            self._newParameter("w%i" % i, 2.0 / npeaks)
+        return
+
+
+    def __call__(self, x):
+        """Calculate the profile at x."""
+        values = numpy.array([p.value for p in self._parameters.values()])
+        a, c, w = values.reshape(-1, 3).T
+        y = numpy.zeros_like(x)
+        for ai, ci, wi in zip(a, c, w):
+            y += ai * numpy.exp(-0.5 * ((x - ci) / wi) ** 2)
+        return y
+
+# End class PeaksGenerator
+
+
+def makeRecipe(npeaks = 3, ncontributions = 1, npoints = 1000,
+        nconstraints = 0, nrestraints = 0, compiled = False):
+    """Create a synthetic recipe for the benchmarks.
+
+    Every FitContribution has the equation "scale * peaks + bkg" with a
+    PeaksGenerator.  The peak parameters and the scale of every
+    FitContribution are the recipe variables.  The constraints are a chain
+    of new variables d<i> = d<i-1> + 0.001 starting from the variable d0,
+    which are constrained in a random order.  The last one sets the
+    background of all FitContributions.  The restraints are put on the
+    variables in turn.
+
+    npeaks          --  The number of peaks in each FitContribution.
+    ncontributions  --  The number of FitContributions.
+    npoints         --  The number of points in each profile.
+    nconstraints    --  The number of constraints.
+    nrestraints     --  The number of restraints.
+    compiled        --  Flag for evaluating the equations of the
+                        FitContributions with compiled evaluation tapes.
+
+    Returns the FitRecipe.
+    """
+    recipe = FitRecipe("benchmark")
+    recipe.clearFitHooks()
+    x = numpy.linspace(0, 10, npoints)
+    rng = numpy.random.RandomState(0)
+    for j in range(ncontributions):
+        gen = PeaksGenerator("peaks", npeaks)
+        y = gen(x) + 0.01 * rng.randn(npoints)
+        profile = Profile()
+        profile.setObservedProfile(x, y)
+        con = FitContribution("c%i" % j)
+        con.setProfile(profile)
+        con.addProfileGenerator(gen)
+        con.setEquation("scale * peaks + bkg")
+        if compiled:
+            con._eq.setCompiled()
+            con._reseq.setCompiled()
+        recipe.addContribution(con)
+        recipe.addVar(con.scale, 1.0, name="scale%i" % j)
+        for par in gen:
+            recipe.addVar(par, par.value * (1 + 0.01 * rng.randn()),
+                    name="%s_%i" % (par.name, j))
+    if nconstraints:
+        for i in range(nconstraints + 1):
+            recipe.newVar("d%i" % i, 0.0)
+        for i in rng.permutation(nconstraints) + 1:
+            recipe.constrain("d%i" % i, "d%i + 0.001" % (i - 1))
+        last = "d%i" % nconstraints
+        for con in recipe._contributions.values():
+            recipe.constrain(con.bkg, last)
+    else:
+        for con in recipe._contributions.values():
+            con.bkg.value = 0.0
+    variables = recipe._parameters.values()
+    for i in range(nrestraints):
+        var = variables[i % len(variables)]
+        recipe.restrain(var, lb = 0, ub = 20, sig = 1)
+    return recipe
+
+
+def timeCall(f, mintime = 0.2, repeat = 3):
+    """Return the shortest average time of a function call in seconds.
+
+    The function is called in loops that take at least mintime seconds.
+    The shortest average of the repeat loops is returned.
+    """
+    best = None
+    for _i in range(repeat):
+        n = 0
+        t0 = default_timer()
+        while True:
+            f()
+            n += 1
+            t = default_timer() - t0
+            if t >= mintime:
+                break
+        best = t / n if best is None else min(best, t / n)
+    return best
+
+
+def runBenchmarks(select = None, mintime = 0.2, repeat = 3, cases = CASES):
+    """Run the benchmarks.
+
+    select  --  Regular expression for the "case/operation" keys of the
+                benchmarks to run.  Run all when None.
+    mintime --  The minimum time in seconds of a timing loop.
+    repeat  --  The number of timing loops.
+    cases   --  List of (name, keyword arguments) of the benchmark cases.
+
+    Returns a dictionary with the "meta" information about the platform and
+    the "results" dictionary of the times per call in seconds indexed by
+    the "case/operation" keys.
+    """
+    pattern = re.compile(select or "")
+    results = {}
+    for name, kwargs in cases:
+        recipe = None
+        for op in OPERATIONS:
+            key = "%s/%s" % (name, op)
+            if not pattern.search(key):
+                continue
+            if recipe is None:
+                recipe = makeRecipe(**kwargs)
+            f = _benchmarks[op](recipe, kwargs)
+            results[key] = timeCall(f, mintime, repeat)
+    meta = dict(python=platform.python_version(),
+            numpy=numpy.__version__, platform=platform.platform(),
+            time=time.strftime("%Y-%m-%d %H:%M:%S"))
+    return dict(meta=meta, results=results)
+
+
+def compareResults(results, baseline, tolerance = 0.2):
+    """Compare the benchmark results to a baseline.
+
+    results     --  The results dictionary from runBenchmarks.
+    baseline    --  The results dictionary of the baseline.
+    tolerance   --  The allowed relative slowdown.
+
+    Returns a list of (key, baseline time, time, ratio, regressed) tuples
+    for the benchmarks in both results.
+    """
+    rv = []
+    base = baseline["results"]
+    for key, t in sorted(results["results"].items()):
+        if key not in base:
+            continue
+        ratio = t / base[key]
+        rv.append((key, base[key], t, ratio, ratio > 1 + tolerance))
+    return rv
+
+
+def main(argv = None):
+    """Run the benchmarks from the command line.
+
+    Returns the exit code, which is 1 for a regression from the baseline.
+    """
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("-o", "--output",
+            help="write the results to a JSON file")
+    parser.add_argument("-b", "--baseline",
+            help="compare to the results in a JSON file")
+    parser.add_argument("-t", "--tolerance", type=float, default=0.2,
+            help="allowed relative slowdown (default 0.2)")
+    parser.add_argument("-k", "--select",
+            help="regular expression for the case/operation to run")
+    parser.add_argument("--mintime", type=float, default=0.2,
+            help="minimum time of a timing loop in seconds (default 0.2)")
+    parser.add_argument("--repeat", type=int, default=3,
+            help="number of timing loops (default 3)")
+    args = parser.parse_args(argv)
+    results = runBenchmarks(args.select, args.mintime, args.repeat)
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+    if not args.baseline:
+        for key, t in sorted(results["results"].items()):
+            print("%-28s %12.4f ms" % (key, 1e3 * t))
+        return 0
+    with open(args.baseline) as fp:
+        baseline = json.load(fp)
+    regressed = False
+    for key, tb, t, ratio, slow in compareResults(results, baseline,
+            args.tolerance):
+        flag = "SLOWER" if slow else ""
+        print("%-28s %12.4f ms %12.4f ms %8.2f %s" %
+                (key, 1e3 * tb, 1e3 * t, ratio, flag))
+        regressed = regressed or slow
+    return int(regressed)
+
+# Helper routines ------------------------------------------------------------
+
+def _benchPrepare(recipe, kwargs):
+    """Prepare the recipe after a configuration change."""
+    def f():
+        recipe._updateConfiguration()
+        recipe._prepare()
+    return f
+
+
+def _benchResidual(recipe, kwargs):
+    """Residual with all variables changed, as in optimizer steps."""
+    p = recipe.getValues()
+    def f():
+        p[:] *= 1.0000001
+        recipe.residual(p)
+    return f
+
+
+def _benchJacobian(recipe, kwargs):
+    """Jacobian at changing variable values."""
+    p = recipe.getValues()
+    def f():
+        p[:] *= 1.0000001
+        recipe.jacobian(p)
+    return f
+
+
+def _benchFitResults(recipe, kwargs):
+    """Update of the FitResults with the uncertainties."""
+    res = FitResults(recipe, update=False)
+    return res.update
+
+
+def _benchMakeEquation(recipe, kwargs):
+    """Build and discard the equation of the Gaussian peaks."""
+    npeaks = kwargs.get("npeaks", 3)
+    terms = ["a%i * exp(-0.5 * ((x - c%i) / w%i)**2)" % (i, i, i)
+            for i in range(npeaks)]
+    eqstr = "scale * (" + " + ".join(terms) + ") + bkg"
+    factory = EquationFactory()
+    def f():
+        factory.wipeout(factory.makeEquation(eqstr))
+    return f
+
+
+def _benchOrder(recipe, kwargs):
+    """Topological sort of the constraints."""
+    from diffpy.srfit.fitbase.fitrecipe import _orderConstraints
+    constraints = recipe._constraints.values()
+    def f():
+        _orderConstraints(constraints)
+    return f
+
+
+_benchmarks = dict(prepare=_benchPrepare, residual=_benchResidual,
+        jacobian=_benchJacobian, fitresults=_benchFitResults,
+        makeequation=_benchMakeEquation, order=_benchOrder)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# End of file
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      Complex Modeling Initiative
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""Tests for the benchmark module."""
+
+import unittest
+
+import numpy
+
+from diffpy.srfit.tests.benchmark import makeRecipe, runBenchmarks
+from diffpy.srfit.tests.benchmark import compareResults
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def testMakeRecipe(self):
+        """check the synthetic benchmark recipe"""
+        recipe = makeRecipe(npeaks = 2, ncontributions = 2, npoints = 50,
+                nconstraints = 3, nrestraints = 4, compiled = True)
+        self.assertEqual(2 * (1 + 3 * 2) + 1, len(recipe.getNames()))
+        self.assertEqual(3 + 2, len(recipe._constraints))
+        self.assertEqual(4, len(recipe._restraints))
+        chiv = recipe.residual()
+        self.assertEqual(2 * 50 + 4, len(chiv))
+        self.assertTrue(numpy.all(numpy.isfinite(chiv)))
+        self.assertAlmostEqual(0.003, recipe.c1.bkg.value)
+        return
+
+
+    def testRunAndCompare(self):
+        """check running and comparing of the benchmarks"""
+        results = runBenchmarks("^base/(residual|makeequation)$",
+                mintime = 0.001, repeat = 1)
+        self.assertEqual(["base/makeequation", "base/residual"],
+                sorted(results["results"]))
+        baseline = dict(results=dict(results["results"]))
+        baseline["results"]["base/residual"] /= 2
+        baseline["results"]["other/residual"] = 1.0
+        cmp = compareResults(results, baseline, tolerance = 0.5)
+        self.assertEqual(["base/makeequation", "base/residual"],
+                [c[0] for c in cmp])
+        self.assertEqual([False, True], [c[4] for c in cmp])
+        self.assertAlmostEqual(2, cmp[1][3])
+        return
+
+# End of class TestBenchmark
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      Complex Modeling Initiative
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""Tests for the checkpoint module."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from diffpy.srfit.fitbase import FitContribution, FitRecipe, Profile
+from diffpy.srfit.fitbase.checkpoint import CheckpointFitHook
+from diffpy.srfit.fitbase.checkpoint import restoreCheckpoint
+
+
+def _makeRecipe():
+    """Create a configured recipe without constraints and restraints."""
+    recipe = FitRecipe("recipe")
+    recipe.clearFitHooks()
+    x = numpy.linspace(0, 5, 30)
+    profile = Profile()
+    profile.setObservedProfile(x, 2 * numpy.exp(-0.5 * x) + 0.1)
+    con = FitContribution("decay")
+    con.setProfile(profile)
+    con.setEquation("A * exp(-k * x) + c")
+    recipe.addContribution(con)
+    recipe.addVar(con.A, 1.0)
+    recipe.addVar(con.k, 0.3)
+    recipe.newVar("B", 0.2)
+    return recipe
+
+
+class TestCheckpointFitHook(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "fit.chk")
+        return
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        return
+
+
+    def testCheckpoint(self):
+        """check saving and restoring of a checkpoint"""
+        recipe = _makeRecipe()
+        recipe.constrain(recipe.decay.c, "B / 2")
+        recipe.restrain("k", lb = 0, ub = 1, sig = 0.1)
+        recipe.fix("B")
+        recipe.setLinear("A")
+        hook = CheckpointFitHook(self.filename, interval = 0)
+        recipe.pushFitHook(hook)
+        recipe.residual([0.5])
+        recipe.residual([0.4])
+        self.assertEqual(2, hook.nsaved)
+        self.assertEqual(2, hook.count)
+        self.assertTrue(os.path.exists(self.filename))
+        self.assertFalse(os.path.exists(self.filename + ".tmp"))
+        # restore to a freshly configured recipe
+        recipe2 = _makeRecipe()
+        rb = recipe2.restrain("A", lb = 0, ub = 10)
+        state = restoreCheckpoint(recipe2, self.filename)
+        self.assertEqual(2, state["count"])
+        self.assertEqual(recipe.getNames(), recipe2.getNames())
+        self.assertEqual(recipe.fixednames, recipe2.fixednames)
+        self.assertTrue(recipe2.isLinear(recipe2.A))
+        self.assertEqual([0.4], list(recipe2.getValues()))
+        self.assertTrue(recipe2.isConstrained(recipe2.decay.c))
+        self.assertFalse(rb in recipe2._restraints)
+        self.assertEqual(1, len(recipe2._restraints))
+        self.assertTrue(numpy.allclose(recipe.residual(),
+            recipe2.residual()))
+        # restore the best values
+        recipe2.residual([0.5])
+        state = restoreCheckpoint(recipe2, self.filename, best = True)
+        self.assertEqual(state["bestvalues"],
+                [v.value for v in recipe2._parameters.values()])
+        recipe2.newVar("D", 1)
+        self.assertRaises(ValueError, restoreCheckpoint, recipe2,
+                self.filename)
+        return
+
+
+    def testInterval(self):
+        """check the interval of the checkpoints"""
+        recipe = _makeRecipe()
+        recipe.decay.c.value = 0.1
+        hook = CheckpointFitHook(self.filename, interval = 3600)
+        recipe.pushFitHook(hook)
+        for k in (0.4, 0.5, 0.6):
+            recipe.residual([2, k, 0.2])
+        self.assertEqual(0, hook.nsaved)
+        self.assertEqual(3, hook.count)
+        self.assertEqual(0.5, hook.bestvalues[1])
+        hook.save(recipe)
+        self.assertEqual(1, hook.nsaved)
+        self.assertTrue(os.path.exists(self.filename))
+        return
+
+# End of class TestCheckpointFitHook
+
+if __name__ == '__main__':
+    unittest.main()
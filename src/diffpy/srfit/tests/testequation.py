@@ -190,5 +190,56 @@ class TestEquation(unittest.TestCase):
         return
 
 
+    def testCompiledEquation(self):
+        """Test evaluation with a flat evaluation tape."""
+        v1, v2, v3, v4, c = _makeArgs(5)
+        c.name = "c"
+        c.const = True
+        c.setValue(2.5)
+
+        # Create the equation c*(v1+v3)*(v4-v2) with an embedded equation
+        plus = literals.AdditionOperator()
+        minus = literals.SubtractionOperator()
+        mult = literals.MultiplicationOperator()
+        mult2 = literals.MultiplicationOperator()
+        plus.addLiteral(v1)
+        plus.addLiteral(v3)
+        minus.addLiteral(v4)
+        minus.addLiteral(v2)
+        mult.addLiteral(plus)
+        mult.addLiteral(minus)
+        mult2.addLiteral(Equation("inner", mult))
+        mult2.addLiteral(c)
+
+        eq = Equation("eq", mult2)
+        self.assertFalse(eq.compiled)
+        self.assertTrue(eq is eq.setCompiled())
+        self.assertTrue(eq.compiled)
+        # plus, minus, mult, inner and mult2
+        self.assertEqual(5, len(eq._tape))
+        self.assertEqual(20, eq())
+        self.assertEqual(25, eq(v1=2))
+        # Only the stale operators are recomputed.
+        self.assertTrue(plus._value is not None)
+        v4.setValue(0)
+        self.assertTrue(minus._value is None)
+        self.assertTrue(plus._value is not None)
+        self.assertEqual(-25, eq())
+        self.assertEqual(-25, eq.value)
+
+        # Swapping recompiles the equation.
+        eq.swap(v4, v1)
+        self.assertTrue(eq.compiled)
+        self.assertEqual(0, eq())
+        eq.swap(eq.root, v1)
+        self.assertEqual(0, len(eq._tape))
+        self.assertEqual(v1.value, eq())
+
+        eq.setCompiled(False)
+        self.assertFalse(eq.compiled)
+        self.assertEqual(v1.value, eq())
+        return
+
+
 if __name__ == "__main__":
     unittest.main()
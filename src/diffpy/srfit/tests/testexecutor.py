@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      Complex Modeling Initiative
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""Tests for the executor module."""
+
+import time
+import unittest
+
+import numpy
+
+from diffpy.srfit.fitbase import FitContribution, FitRecipe, Profile
+from diffpy.srfit.fitbase.executor import SerialExecutor
+from diffpy.srfit.fitbase.executor import ThreadExecutor, ProcessExecutor
+from diffpy.srfit.exceptions import SrFitError
+
+
+class TestExecutors(unittest.TestCase):
+
+    def setUp(self):
+        self.recipe = recipe = FitRecipe("recipe")
+        recipe.clearFitHooks()
+        recipe.newVar("w", 0.8)
+        recipe.newVar("x0", 0.1)
+        for i in range(3):
+            x = numpy.linspace(-3, 3, 20 + i)
+            profile = Profile()
+            profile.setObservedProfile(x, numpy.exp(-0.5 * x**2))
+            con = FitContribution("g%i" % i)
+            con.setProfile(profile)
+            con.setEquation("A * exp(-0.5 * (x - x0)**2 / sig**2)")
+            recipe.addContribution(con, weight = i + 1)
+            recipe.addVar(con.A, 1.1, name = "A%i" % i)
+            recipe.constrain(con.sig, "w**2")
+            recipe.constrain(con.x0, "x0")
+        recipe.restrain("x0", -0.05, 0.05, scaled = True)
+        return
+
+
+    def tearDown(self):
+        self.recipe.getExecutor().close()
+        return
+
+
+    def _checkExecutor(self, executor):
+        recipe = self.recipe
+        p0 = recipe.getValues()
+        p1 = p0 * 1.1
+        r0 = recipe.residual(p0)
+        r1 = recipe.residual(p1)
+        recipe.setExecutor(executor)
+        self.assertTrue(executor is recipe.getExecutor())
+        self.assertTrue(numpy.array_equal(r0, recipe.residual(p0)))
+        self.assertTrue(numpy.array_equal(r1, recipe.residual(p1)))
+        self.assertTrue(numpy.array_equal(r1, recipe.residual()))
+        # changes made outside of residual
+        recipe.A1.value = 3
+        r2 = recipe.residual()
+        recipe.setExecutor(None)
+        self.assertTrue(isinstance(recipe.getExecutor(), SerialExecutor))
+        self.assertTrue(numpy.array_equal(r2, recipe.residual()))
+        self.assertFalse(numpy.array_equal(r1, r2))
+        return
+
+
+    def testSerialExecutor(self):
+        """Check the serial evaluation."""
+        self._checkExecutor(SerialExecutor())
+        return
+
+
+    def testThreadExecutor(self):
+        """Check evaluation in a thread pool."""
+        self._checkExecutor(ThreadExecutor(2))
+        return
+
+
+    def testProcessExecutor(self):
+        """Check evaluation in worker processes."""
+        executor = ProcessExecutor(2)
+        self._checkExecutor(executor)
+        self.assertEqual([], executor._procs)
+        # configuration change restarts the workers
+        recipe = self.recipe
+        recipe.setExecutor(executor)
+        recipe.residual()
+        procs = executor._procs[:]
+        self.assertEqual(2, len(procs))
+        recipe.fix("A0")
+        recipe.residual()
+        self.assertEqual(procs, executor._procs)
+        recipe.restrain("A0", 0, 1)
+        r0 = recipe.residual()
+        self.assertNotEqual(procs, executor._procs)
+        # error in the worker process
+        conn = executor._procs[0][1]
+        ia0 = recipe._parameters.keys().index("A0")
+        conn.send(([ia0], ["invalid"]))
+        status, msg = conn.recv()
+        self.assertEqual("error", status)
+        w = recipe.w.value
+        recipe.w.value = 0.9
+        self.assertRaises(SrFitError, recipe.residual)
+        self.assertEqual([], executor._procs)
+        # workers are restarted in the next call
+        recipe.w.value = w
+        self.assertTrue(numpy.array_equal(r0, recipe.residual()))
+        # worker process has died
+        proc = executor._procs[1][0]
+        proc.terminate()
+        proc.join()
+        recipe.w.value = 0.9
+        self.assertRaises(SrFitError, recipe.residual)
+        self.assertEqual([], executor._procs)
+        recipe.w.value = w
+        self.assertTrue(numpy.array_equal(r0, recipe.residual()))
+        return
+
+
+    def testProcessExecutorCloseBusy(self):
+        """Check that close terminates a busy worker process."""
+        import multiprocessing
+        executor = ProcessExecutor(1, timeout = 0.1)
+        conn, child = multiprocessing.Pipe()
+        proc = multiprocessing.Process(target=time.sleep, args=(60,))
+        proc.daemon = True
+        proc.start()
+        executor._procs.append((proc, conn))
+        t0 = time.time()
+        executor.close()
+        self.assertTrue(time.time() - t0 < 30)
+        self.assertFalse(proc.is_alive())
+        self.assertEqual([], executor._procs)
+        return
+
+# End of class TestExecutors
+
+if __name__ == "__main__":
+    unittest.main()
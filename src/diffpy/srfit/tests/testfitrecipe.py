@@ -17,12 +17,15 @@
 
 import unittest
 
-from numpy import linspace, array_equal, pi, sin, dot
+import numpy
+from numpy import linspace, array_equal, pi, sin, cos, dot
 
 from diffpy.srfit.fitbase.fitrecipe import FitRecipe
 from diffpy.srfit.fitbase.fitcontribution import FitContribution
 from diffpy.srfit.fitbase.profile import Profile
 from diffpy.srfit.fitbase.parameter import Parameter
+from diffpy.srfit.fitbase.profilegenerator import ProfileGenerator
+from diffpy.srfit.exceptions import SrFitError
 
 class TestFitRecipe(unittest.TestCase):
 
@@ -238,5 +241,579 @@ class TestFitRecipe(unittest.TestCase):
         return
 
 
+    def testResidualBuffer(self):
+        """Check the preallocated residual buffer."""
+        recipe = self.recipe
+        recipe.addVar(self.fitcontribution.c, 0.1)
+        recipe.restrain("c", 0.2, 1)
+        r0 = recipe.residual()
+        self.assertEqual(11, len(r0))
+        self.assertFalse(r0 is recipe._chivbuffer)
+        self.assertTrue(r0 is not recipe.residual())
+        recipe.copyresidual = False
+        r1 = recipe.residual()
+        self.assertTrue(r1 is recipe._chivbuffer)
+        self.assertTrue(array_equal(r0, r1))
+        r2 = recipe.residual([0.5])
+        self.assertTrue(r1 is r2)
+        self.assertAlmostEqual(0, r2[-1])
+        # the buffer is reallocated when the residual size changes
+        self.profile.setCalculationRange(xmax = 2)
+        r3 = recipe.residual()
+        self.assertEqual(7, len(r3))
+        self.assertFalse(r3 is r2)
+        self.assertEqual([6], recipe._chivsizes)
+        self.assertTrue(r3 is recipe.residual())
+        # the buffer is allocated in residual, not in _prepare
+        recipe.restrain("c", 0.2, 1)
+        recipe._prepare()
+        self.assertTrue(recipe._chivsizes is None)
+        self.assertEqual(8, len(recipe.residual()))
+        self.assertEqual([6], recipe._chivsizes)
+        return
+
+
+    def testResidualBufferPickle(self):
+        """Check the residual buffer of an unpickled recipe."""
+        import cPickle
+        recipe = self.recipe
+        recipe.addVar(self.fitcontribution.c, 0.1)
+        recipe.restrain("c", 0.2, 1)
+        recipe.residual()
+        recipe2 = cPickle.loads(cPickle.dumps(recipe, 2))
+        for p in ([0.1], [0.5], [1.5]):
+            r = recipe.residual(p)
+            r2 = recipe2.residual(p)
+            self.assertTrue(array_equal(r, r2))
+        recipe2.copyresidual = False
+        self.assertTrue(recipe2.residual() is recipe2._chivbuffer)
+        return
+
+
+    def testResidualCache(self):
+        """Check the cache of residual values."""
+        recipe = self.recipe
+        recipe.addVar(self.fitcontribution.c, 0.1)
+        self.assertTrue(recipe.getResidualCacheInfo() is None)
+        recipe.setResidualCache(2)
+        info = recipe.getResidualCacheInfo()
+        self.assertEqual(dict(hits=0, misses=0, size=0, maxsize=2), info)
+        r0 = recipe.residual([0.1])
+        r1 = recipe.residual([0.2])
+        self.assertEqual(2, recipe.getResidualCacheInfo()["misses"])
+        recipe.copyresidual = False
+        self.assertTrue(array_equal(r0, recipe.residual([0.1])))
+        self.assertEqual(0.1, recipe.c.value)
+        self.assertTrue(array_equal(r1, recipe.residual([0.2])))
+        self.assertEqual(0.2, self.fitcontribution.c.value)
+        info = recipe.getResidualCacheInfo()
+        self.assertEqual(2, info["hits"])
+        self.assertEqual(2, info["size"])
+        # least recently used item is discarded
+        recipe.residual([0.3])
+        recipe.residual([0.1])
+        self.assertEqual(4, recipe.getResidualCacheInfo()["misses"])
+        # configuration change clears the cache
+        recipe.restrain("c", 0.5, 1)
+        self.assertEqual(0, recipe.getResidualCacheInfo()["size"])
+        r2 = recipe.residual([0.1])
+        self.assertEqual(len(r0) + 1, len(r2))
+        recipe.setResidualCache(None)
+        self.assertTrue(recipe.getResidualCacheInfo() is None)
+        self.assertTrue(array_equal(r2, recipe.residual()))
+        # the calculated profile follows the cached residual
+        recipe.setResidualCache(None)
+        recipe.residual([0.1])
+        y0 = self.profile.ycalc.copy()
+        recipe.setResidualCache(2)
+        recipe.residual([0.1])
+        recipe.residual([0.2])
+        recipe.residual([0.1])
+        self.assertEqual(1, recipe.getResidualCacheInfo()["hits"])
+        self.assertTrue(array_equal(y0, self.profile.ycalc))
+        # Profile change clears the cache
+        npts = len(self.profile.x)
+        self.profile.setCalculationRange(0, self.profile.x[npts // 2])
+        self.assertEqual(0, recipe.getResidualCacheInfo()["size"])
+        r3 = recipe.residual([0.1])
+        self.assertEqual(len(self.profile.x), len(r3) - 1)
+        self.assertTrue(len(r3) < len(r2))
+        self.assertEqual(len(self.profile.x), len(self.profile.ycalc))
+        # weight change clears the cache
+        r3 = recipe.residual([0.1]).copy()
+        recipe.setWeight(self.fitcontribution, 4.0)
+        self.assertEqual(0, recipe.getResidualCacheInfo()["size"])
+        r4 = recipe.residual([0.1]).copy()
+        self.assertTrue(numpy.allclose(2 * r3[:-1], r4[:-1]))
+        recipe.setResidualCache(None)
+        self.assertTrue(array_equal(recipe.residual([0.1]), r4))
+        return
+
+
+    def testResidualCacheLinear(self):
+        """Check the residual cache with linear variables."""
+        recipe = self.recipe
+        con = self.fitcontribution
+        recipe.addVar(con.A, 1)
+        recipe.setLinear("A")
+        recipe.addVar(con.k, 1.1)
+        recipe.setResidualCache(4)
+        r0 = recipe.residual([1.1])
+        A0 = recipe.A.value
+        recipe.residual([1.2])
+        self.assertNotEqual(A0, recipe.A.value)
+        # cache hit skips the projection and restores the linear variable
+        calls = []
+        jacobian = con.jacobian
+        con.jacobian = lambda *args: calls.append(args) or jacobian(*args)
+        self.assertTrue(array_equal(r0, recipe.residual([1.1])))
+        self.assertEqual([], calls)
+        self.assertEqual(A0, recipe.A.value)
+        self.assertEqual(1, recipe.getResidualCacheInfo()["hits"])
+        return
+
+
+    def testConstraintOrder(self):
+        """Check the dependency order of the constraints."""
+        recipe = self.recipe
+        names = ["a%i" % i for i in range(6)]
+        for n in names:
+            recipe.newVar(n, 0)
+        for i in [3, 1, 5, 2, 4]:
+            recipe.constrain(names[i], "%s + 1" % names[i - 1])
+        recipe.constrain(self.fitcontribution.c, "a5 + a2")
+        recipe.a0.value = 0.5
+        recipe._prepare()
+        order = [con.par.name for con in recipe._oconstraints]
+        self.assertEqual(6, len(order))
+        self.assertEqual(names[1:], [n for n in order if n != "c"])
+        self.assertEqual("c", order[-1])
+        self.assertEqual(5.5, recipe.a5.value)
+        self.assertEqual(8, self.fitcontribution.c.value)
+        # circular dependency is reported
+        recipe.unconstrain("a1")
+        recipe.constrain("a1", "a4 - a0")
+        try:
+            recipe._prepare()
+        except SrFitError as e:
+            emsg = str(e)
+        else:
+            self.fail("SrFitError not raised")
+        self.assertTrue("a1 -> a4 -> a3 -> a2 -> a1" in emsg
+                or "a4 -> a3 -> a2 -> a1 -> a4" in emsg
+                or "a3 -> a2 -> a1 -> a4 -> a3" in emsg
+                or "a2 -> a1 -> a4 -> a3 -> a2" in emsg, emsg)
+        return
+
+
+    def testConstraintUpdates(self):
+        """Check that only the affected constraints are updated."""
+        recipe = self.recipe
+        con = self.fitcontribution
+        recipe.newVar("u", 1)
+        recipe.newVar("v", 2)
+        recipe.newVar("w", 3)
+        recipe.constrain(con.A, "u + 1")
+        recipe.constrain(con.k, "2 * v")
+        recipe.constrain(con.c, "A * k", {"A" : con.A, "k" : con.k})
+        recipe.residual()
+        recipe.residual()
+        self.assertEqual(0, recipe.getConstraintUpdateCount())
+        # w is not used in constraints
+        recipe.residual([1, 2, 4])
+        self.assertEqual(0, recipe.getConstraintUpdateCount())
+        # v changes k and c
+        recipe.residual([1, 3, 4])
+        self.assertEqual(2, recipe.getConstraintUpdateCount())
+        self.assertEqual(6, con.k.value)
+        self.assertEqual(12, con.c.value)
+        recipe.residual([2, 2, 4])
+        self.assertEqual(3, recipe.getConstraintUpdateCount())
+        self.assertEqual(12, con.c.value)
+        # changed constrained parameter is restored, this also updates c
+        con.k.value = 7
+        recipe.residual()
+        self.assertEqual(2, recipe.getConstraintUpdateCount())
+        self.assertEqual(4, con.k.value)
+        self.assertEqual(12, con.c.value)
+        return
+
+
+    def testAffineConstraints(self):
+        """Check evaluation of affine constraints as a matrix transform."""
+        recipe = self.recipe
+        con = self.fitcontribution
+        recipe.newVar("u", 1)
+        recipe.newVar("v", 2)
+        recipe.newVar("w", 0.5)
+        recipe.constrain(con.A, "1 - u")
+        recipe.constrain(con.k, "2 * (A + v) / 4", {"A" : con.A})
+        recipe.constrain(con.c, "w**2")
+        recipe.newVar("d", 0)
+        recipe.constrain("d", "k - c", {"k" : con.k, "c" : con.c})
+        recipe._prepare()
+        affine = recipe._affine
+        self.assertEqual(2, len(affine.constraints))
+        self.assertEqual(["A", "k"], [c.par.name for c in affine.constraints])
+        self.assertEqual(2, len(recipe._nlconstraints))
+        self.assertEqual((2, 2), affine.matrix.shape)
+        for p in ([1, 2, 0.5], [3, 1, 0.5], [3, 1, 2]):
+            recipe.residual(p)
+            u, v, w = p
+            self.assertAlmostEqual(1 - u, con.A.value)
+            self.assertAlmostEqual((1 - u + v) / 2.0, con.k.value)
+            self.assertAlmostEqual(w**2, con.c.value)
+            self.assertAlmostEqual(con.k.value - con.c.value, recipe.d.value)
+        # only w changed in the last step
+        self.assertEqual(2, recipe.getConstraintUpdateCount())
+        recipe.residual([3, 2, 2])
+        self.assertEqual(2, recipe.getConstraintUpdateCount())
+        self.assertAlmostEqual(0, con.k.value)
+        # changed constrained parameter is restored
+        con.A.value = 5
+        recipe.residual()
+        self.assertEqual(-2, con.A.value)
+        return
+
+
+    def testAffineConstraintsRounding(self):
+        """Compare affine constraints with the Equation evaluation."""
+        recipe = self.recipe
+        con = self.fitcontribution
+        recipe.newVar("u", 1)
+        recipe.newVar("v", 2)
+        recipe.constrain(con.A, "u / 3")
+        recipe.constrain(con.k, "0.1 + (u - 0.2) / 7 - 3 * v / 0.3")
+        recipe.constrain(con.c, "(A + 0.3) / 3 + 0.1", {"A" : con.A})
+        recipe._prepare()
+        self.assertEqual(3, len(recipe._affine.constraints))
+        rng = numpy.random.RandomState(0)
+        eps = numpy.finfo(float).eps
+        for p in 10.0 ** rng.uniform(-3, 3, size=(50, 2)):
+            recipe.residual(p)
+            # equal up to the rounding errors of the largest term
+            tol = 4 * eps * (1 + 10 * max(p))
+            for c in recipe._affine.constraints:
+                self.assertTrue(abs(c.par.value - c.eq()) <= tol)
+        return
+
+
+    def _numericJacobian(self, recipe, h = 1e-6):
+        p0 = recipe.getValues()
+        cols = []
+        for k in range(len(p0)):
+            p = p0.copy()
+            p[k] += h
+            rp = recipe.residual(p)
+            p[k] -= 2 * h
+            rm = recipe.residual(p)
+            cols.append((rp - rm) / (2 * h))
+        recipe.residual(p0)
+        return numpy.array(cols).T
+
+
+    def testJacobian(self):
+        """Test the Jacobian with constraints and restraints."""
+        recipe = self.recipe
+        con = self.fitcontribution
+        recipe.addVar(con.A, 1.5)
+        recipe.addVar(con.k, 0.9)
+        recipe.newVar("B", 0.5)
+        recipe.constrain(con.c, "B**2 + A")
+        recipe.restrain(con.k, 1.0, 2.0, sig = 0.1, scaled = True)
+        rb = recipe.restrain("B", 1.0, 2.0, sig = 0.2)
+        jac = recipe.jacobian()
+        self.assertEqual((12, 3), jac.shape)
+        jnum = self._numericJacobian(recipe)
+        self.assertTrue(numpy.allclose(jnum, jac, rtol=1e-5, atol=1e-7))
+        # exact derivatives of the contribution residual
+        x = self.profile.x
+        A, k, c = 1.5, 0.9, 0.25 + 1.5
+        numpy.testing.assert_array_almost_equal(
+                sin(k * x + c) + A * cos(k * x + c), jac[:10, 0])
+        numpy.testing.assert_array_almost_equal(
+                A * x * cos(k * x + c), jac[:10, 1])
+        numpy.testing.assert_array_almost_equal(
+                A * cos(k * x + c), jac[:10, 2])
+        # restraint on B contributes only to its own column
+        irb = 10 + recipe._restraintlist.index(rb)
+        self.assertEqual(-5, jac[irb, 2])
+        self.assertFalse(jac[irb, :2].any())
+        # Jacobian is evaluated at the passed values
+        recipe.fix("k")
+        jac2 = recipe.jacobian([1.2, 0.3])
+        self.assertEqual((12, 2), jac2.shape)
+        self.assertEqual(1.2, con.A.value)
+        self.assertTrue(numpy.allclose(
+            self._numericJacobian(recipe), jac2, rtol=1e-5, atol=1e-7))
+        return
+
+
+    def testJacobianProfileGenerator(self):
+        """Test the Jacobian of a ProfileGenerator with derivatives."""
+
+        class _Cosine(ProfileGenerator):
+
+            ncalls = 0
+
+            def __init__(self):
+                ProfileGenerator.__init__(self, "cg")
+                self._newParameter("w", 1.0)
+                self._newParameter("f", 0.0)
+
+            def __call__(self, x):
+                return cos(self.w.value * x + self.f.value)
+
+            def derivatives(self, x, pars):
+                self.ncalls += 1
+                w, f = self.w.value, self.f.value
+                d = {self.w : -x * sin(w * x + f), self.f : -sin(w * x + f)}
+                return [d[p] for p in pars]
+
+        recipe = self.recipe
+        con = self.fitcontribution
+        gen = _Cosine()
+        con.addProfileGenerator(gen)
+        con.setEquation("A * cg")
+        recipe.addVar(con.A, 2.0)
+        recipe.addVar(gen.w, 0.8)
+        recipe.newVar("phase", 0.2)
+        recipe.constrain(gen.f, "3 * phase")
+        jac = recipe.jacobian()
+        self.assertEqual(1, gen.ncalls)
+        self.assertTrue(numpy.allclose(self._numericJacobian(recipe), jac,
+            rtol=1e-5, atol=1e-7))
+        # numerical fallback gives the same result
+        gen.derivatives = lambda x, pars : None
+        jac2 = recipe.jacobian()
+        self.assertTrue(numpy.allclose(jac, jac2, rtol=1e-5, atol=1e-6))
+        return
+
+
+    def testJacobianSparsity(self):
+        """Test the dependency map of variables and contributions."""
+        recipe = self.recipe
+        con1 = self.fitcontribution
+        con2 = FitContribution("cont2")
+        profile2 = Profile()
+        x2 = linspace(0, 1, 5)
+        profile2.setObservedProfile(x2, x2)
+        con2.setProfile(profile2)
+        con2.setEquation("B * x + D")
+        recipe.addContribution(con2)
+        recipe.addVar(con1.A, 1.5)
+        recipe.addVar(con1.k, 0.9)
+        recipe.addVar(con2.B, 2)
+        recipe.newVar("off", 0.1)
+        recipe.constrain(con2.D, "off**2")
+        recipe.constrain(con1.c, "off")
+        r = recipe.restrain("B", 1.0, 1.5, sig = 0.2)
+        deps = recipe._getDependencies()
+        self.assertEqual(4, len(deps))
+        self.assertEqual((set([0]), set()), deps[0])
+        self.assertEqual((set([0]), set()), deps[1])
+        self.assertEqual((set([1]), set([0])), deps[2])
+        self.assertEqual((set([0, 1]), set()), deps[3])
+        sp = recipe.getJacobianSparsity()
+        self.assertEqual((16, 4), sp.shape)
+        self.assertTrue(sp[:10, :2].all())
+        self.assertFalse(sp[10:, :2].any())
+        self.assertEqual([False] * 10 + [True] * 6, list(sp[:, 2]))
+        self.assertEqual([True] * 15 + [False], list(sp[:, 3]))
+        jac = recipe.jacobian()
+        self.assertFalse(jac[~sp].any())
+        # scaled restraints are affected by all contributions
+        r.scaled = True
+        recipe._updateConfiguration()
+        sp = recipe.getJacobianSparsity()
+        self.assertTrue(sp[15].all())
+        # sparse output
+        jsp = recipe.jacobian(sparse = True)
+        self.assertTrue(numpy.allclose(recipe.jacobian(), jsp.toarray(),
+            rtol=1e-12, atol=0))
+        self.assertTrue(jsp.nnz <= sp.sum())
+        self.assertFalse(jsp.toarray()[~sp].any())
+        # the residual blocks agree with the residual
+        blocks = recipe._residualBlocks([])
+        self.assertEqual(3, len(blocks))
+        self.assertTrue(numpy.array_equal(recipe.residual(),
+            numpy.concatenate(blocks)))
+        p = recipe.getValues()
+        p[2] = 1.7
+        b2 = recipe._residualBlocks(p, deps[2], blocks)
+        self.assertTrue(b2[0] is blocks[0])
+        self.assertTrue(numpy.array_equal(recipe.residual(),
+            numpy.concatenate(b2)))
+        return
+
+
+    def testLinearVars(self):
+        """Check the projection of linear variables."""
+        from diffpy.srfit.fitbase.fitresults import FitResults
+        recipe = FitRecipe("linear")
+        recipe.clearFitHooks()
+        x = linspace(-2, 3, 51)
+        y = 2 * numpy.exp(-0.5 * (x - 1)**2 / 0.5**2) + 0.1 * x + 0.3
+        profile = Profile()
+        profile.setObservedProfile(x, y)
+        con = FitContribution("g")
+        con.setProfile(profile)
+        con.setEquation("A * exp(-0.5 * (x - x0)**2 / sig**2) + "
+                "polyval(array(b1, b0), x)")
+        recipe.addContribution(con)
+        for name, value in [("A", 1), ("x0", 0.9), ("sig", 0.6),
+                ("b1", 0), ("b0", 0)]:
+            recipe.addVar(con.get(name), value)
+        self.assertEqual(["A", "b1", "b0"], recipe.findLinearVars())
+        recipe.setLinear(*recipe.findLinearVars())
+        self.assertTrue(recipe.isLinear(recipe.A))
+        self.assertEqual(["x0", "sig"], recipe.getNames())
+        self.assertEqual([], recipe.fixednames)
+        # linear variables are solved in the residual
+        r = recipe.residual([1, 0.5])
+        self.assertAlmostEqual(0, numpy.dot(r, r))
+        self.assertAlmostEqual(2, recipe.A.value)
+        self.assertAlmostEqual(0.1, recipe.b1.value)
+        self.assertAlmostEqual(0.3, recipe.b0.value)
+        # Jacobian of the projected residual, it is exact at zero residual
+        jac = recipe.jacobian([1, 0.5])
+        jsp = recipe.jacobian([1, 0.5], sparse = True)
+        self.assertTrue(numpy.allclose(jac, jsp.toarray()))
+        numjac = self._numericJacobian(recipe)
+        self.assertTrue(numpy.allclose(numjac, jac, rtol=1e-5, atol=1e-6))
+        from scipy.optimize import leastsq
+        p, ier = leastsq(recipe.residual, [0.9, 0.6], Dfun=recipe.jacobian)
+        self.assertTrue(numpy.allclose([1, 0.5], p))
+        recipe.residual([0.9, 0.6])
+        # the results include linear variables
+        results = FitResults(recipe)
+        self.assertEqual(["A", "x0", "sig", "b1", "b0"], results.varnames)
+        self.assertEqual((5, 5), results.cov.shape)
+        self.assertEqual(["x0", "sig"], recipe.getNames())
+        recipe.projectlinear = False
+        self.assertEqual(5, len(recipe.getNames()))
+        results2 = FitResults(recipe)
+        self.assertTrue(numpy.allclose(results.cov, results2.cov))
+        recipe.projectlinear = True
+        recipe.setNonlinear("A")
+        self.assertFalse(recipe.isLinear(recipe.A))
+        self.assertEqual(["A", "x0", "sig"], recipe.getNames())
+        # product of linear variables is not linear
+        recipe.newVar("s", 1)
+        recipe.constrain(recipe.A, "s * b0")
+        self.assertEqual(["b1", "b0"], recipe.findLinearVars())
+        return
+
+
+    def testRefine(self):
+        """Check staged refinement with FitRecipe.refine."""
+        recipe = self.recipe
+        con = self.fitcontribution
+        recipe.addVar(con.A, 2, tag = "amp")
+        recipe.addVar(con.k, 1.1, tag = "phase")
+        recipe.addVar(con.c, 0.1, tag = "phase")
+        recipe.residual()
+        generation = recipe._generation
+        stages = recipe.refine(["amp", "phase", "all"])
+        self.assertEqual(generation, recipe._generation)
+        self.assertEqual(3, len(stages))
+        self.assertEqual(["A"], stages[0]["names"])
+        self.assertEqual(["k", "c"], stages[1]["names"])
+        self.assertEqual(["A", "k", "c"], stages[2]["names"])
+        for st in stages:
+            self.assertTrue(st["nfev"] > 0)
+            self.assertTrue(st["njev"] > 0)
+            self.assertTrue(st["time"] >= 0)
+        self.assertTrue(stages[0]["chi2"] >= stages[2]["chi2"])
+        self.assertAlmostEqual(0, stages[2]["chi2"])
+        self.assertTrue(numpy.allclose([1, 1, 0], recipe.getValues()))
+        # custom optimizer and a stage of several names
+        calls = []
+        def optimizer(fun, x0, jac, scale = 1):
+            calls.append(list(x0))
+            return scale * numpy.asarray(x0)
+        stages = recipe.refine([["A", "c"]], optimizer, scale = 2)
+        self.assertEqual([["A", "c"]], [st["stage"] for st in stages])
+        self.assertEqual(1, len(calls))
+        self.assertEqual(["A", "c"], recipe.getNames())
+        self.assertAlmostEqual(2, recipe.A.value)
+        self.assertRaises(ValueError, recipe.refine, ["foo"])
+        # variables fixed by the user are not refined
+        recipe.free("all")
+        recipe.fix(k = 1.2)
+        stages = recipe.refine()
+        self.assertEqual(["A", "c"], stages[0]["names"])
+        self.assertEqual(["k"], recipe.fixednames)
+        self.assertEqual(1.2, recipe.k.value)
+        # a bad stage does not change the fixed and free variables
+        self.assertRaises(ValueError, recipe.refine, [["A", "nope"]])
+        self.assertEqual(["A", "c"], recipe.getNames())
+        def badoptimizer(fun, x0, jac):
+            raise RuntimeError("optimizer failed")
+        self.assertRaises(RuntimeError, recipe.refine, ["A"], badoptimizer)
+        self.assertEqual(["A", "c"], recipe.getNames())
+        return
+
+
+    def testResidualBatch(self):
+        """Test the residual of a population of variable values."""
+        recipe = self.recipe
+        con = self.fitcontribution
+        recipe.addVar(con.A, 1.5)
+        recipe.addVar(con.k, 0.9)
+        recipe.newVar("B", 0.5)
+        recipe.constrain(con.c, "B**2 + A")
+        recipe.restrain(con.k, 1.0, 2.0, sig = 0.1, scaled = True)
+        recipe.restrain("B", 1.0, 2.0, sig = 0.2)
+        # second contribution with a ProfileGenerator
+        gen = _CosineGenerator("cg")
+        con2 = FitContribution("cont2")
+        profile2 = Profile()
+        profile2.setObservedProfile(linspace(0, 1, 5), linspace(0, 1, 5))
+        con2.setProfile(profile2)
+        con2.addProfileGenerator(gen)
+        recipe.addContribution(con2, weight = 2)
+        recipe.addVar(gen.w, 0.8)
+        recipe.constrain(gen.f, "3 * B")
+        P = numpy.array([[1.4, 0.9, 0.5, 0.7], [1.0, 1.2, -0.3, 1.1],
+            [0.2, 1.5, 1.2, 0.4]])
+        p0 = recipe.getValues()
+        r0 = recipe.residual()
+        gen.ncalls = 0
+        rb = recipe.residualBatch(P)
+        self.assertEqual((3, 17), rb.shape)
+        self.assertEqual(3, gen.ncalls)
+        self.assertTrue(numpy.array_equal(p0, recipe.getValues()))
+        self.assertTrue(numpy.array_equal(r0, recipe.residual()))
+        rows = numpy.array([recipe.residual(p) for p in P])
+        self.assertTrue(numpy.allclose(rows, rb, rtol=1e-12, atol=1e-12))
+        # single row and worker processes
+        self.assertTrue(numpy.allclose(rows[:1], recipe.residualBatch(P[0])))
+        rb2 = recipe.residualBatch(P, workers = 2)
+        self.assertTrue(numpy.allclose(rows, rb2, rtol=1e-12, atol=1e-12))
+        self.assertRaises(ValueError, recipe.residualBatch, P[:, :3])
+        return
+
+# End of class TestFitRecipe
+
+
+class _CosineGenerator(ProfileGenerator):
+    """ProfileGenerator that cannot be broadcast, it counts its calls."""
+
+    ncalls = 0
+
+    def __init__(self, name):
+        ProfileGenerator.__init__(self, name)
+        self._newParameter("w", 1.0)
+        self._newParameter("f", 0.0)
+        return
+
+    def __call__(self, x):
+        self.ncalls += 1
+        return cos(self.w.value * x + self.f.value)
+
+# End of class _CosineGenerator
+
+
 if __name__ == "__main__":
     unittest.main()
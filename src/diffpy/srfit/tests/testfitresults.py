@@ -17,8 +17,11 @@
 
 import unittest
 
-from diffpy.srfit.fitbase.fitrecipe import FitRecipe
-from diffpy.srfit.fitbase.fitresults import initializeRecipe
+import numpy
+
+from diffpy.srfit.fitbase import FitContribution, FitRecipe, Profile
+from diffpy.srfit.fitbase.fitresults import FitResults, initializeRecipe
+from diffpy.srfit.fitbase.fitresults import _recipeRw
 from diffpy.srfit.tests.utils import datafile
 
 
@@ -76,6 +79,82 @@ class TestInitializeRecipe(unittest.TestCase):
         self.assertAlmostEqual(self.x0val, recipe.x0.value)
         return
 
+class TestFitResults(unittest.TestCase):
+
+    def setUp(self):
+        x = numpy.linspace(-3, 3, 25)
+        profile = Profile()
+        profile.setObservedProfile(x, numpy.exp(-0.5 * x**2))
+        contribution = FitContribution("g")
+        contribution.setProfile(profile)
+        contribution.setEquation("A * exp(-0.5 * (x - x0)**2 / sig**2)")
+        self.recipe = recipe = FitRecipe("recipe")
+        recipe.clearFitHooks()
+        recipe.addContribution(contribution)
+        recipe.addVar(contribution.A, 1.1)
+        recipe.addVar(contribution.x0, 0.1)
+        recipe.newVar("w", 0.8)
+        recipe.constrain(contribution.sig, "w**2")
+        recipe.restrain("A", 0, 1, sig = 0.1)
+        return
+
+
+    def testJacobianMethods(self):
+        """Check analytic and numeric Jacobians give the same results."""
+        res = FitResults(self.recipe)
+        jac = res._calculateJacobian()
+        dcon = res._dcon
+        self.assertEqual((1, 3), dcon.shape)
+        self.assertAlmostEqual(1.6, dcon[0, 2])
+        res.derivmethod = "numeric"
+        jnum = res._calculateJacobian()
+        self.assertTrue(numpy.allclose(jnum, jac, rtol=1e-5, atol=1e-6))
+        self.assertTrue(numpy.allclose(res._dcon, dcon))
+        res.derivmethod = "invalid"
+        self.assertRaises(ValueError, res._calculateJacobian)
+        return
+
+
+    def testUpdate(self):
+        """Check uncertainties from the analytic Jacobian."""
+        res = FitResults(self.recipe)
+        rnum = FitResults(self.recipe, update=False)
+        rnum.derivmethod = "numeric"
+        rnum.update()
+        self.assertTrue(numpy.allclose(rnum.varunc, res.varunc, rtol=1e-5))
+        self.assertTrue(numpy.allclose(rnum.conunc, res.conunc, rtol=1e-5))
+        return
+
+
+    def testParallelJacobian(self):
+        """Check the parallel numeric Jacobian matches the serial one."""
+        res = FitResults(self.recipe, update=False)
+        res.derivmethod = "numeric"
+        res.update()
+        jac = res._calculateJacobian()
+        dcon = res._dcon
+        res.workers = 2
+        jpar = res._calculateJacobian()
+        self.assertTrue(numpy.array_equal(jac, jpar))
+        self.assertTrue(numpy.array_equal(dcon, res._dcon))
+        self.assertEqual(list(res.varvals), list(self.recipe.getValues()))
+        return
+
+
+    def testRecipeRw(self):
+        """Check the Rw without the covariance calculation."""
+        recipe = self.recipe
+        rw = FitResults(recipe).rw
+        calls = []
+        jacobian = recipe.jacobian
+        recipe.jacobian = lambda *args: calls.append(args) or jacobian(*args)
+        self.assertEqual(rw, _recipeRw(recipe))
+        self.assertEqual([], calls)
+        self.assertEqual(0, _recipeRw(FitRecipe("empty")))
+        return
+
+# End of class TestFitResults
+
 if __name__ == "__main__":
 
     unittest.main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      Complex Modeling Initiative
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""Tests for the fitservice module."""
+
+import time
+import unittest
+
+import numpy
+
+from diffpy.srfit.exceptions import SrFitError
+from diffpy.srfit.fitbase import FitContribution, FitRecipe, Profile
+from diffpy.srfit.fitbase.fitservice import FitService
+
+
+def _makeRecipe(A, k):
+    """Create a recipe for the exponential decay A * exp(-k * x)."""
+    recipe = FitRecipe("recipe")
+    recipe.clearFitHooks()
+    x = numpy.linspace(0, 5, 50)
+    profile = Profile()
+    profile.setObservedProfile(x, A * numpy.exp(-k * x))
+    con = FitContribution("decay")
+    con.setProfile(profile)
+    con.setEquation("A * exp(-k * x)")
+    recipe.addContribution(con)
+    recipe.addVar(con.A, 1.0)
+    recipe.addVar(con.k, 0.5)
+    return recipe
+
+
+def _slowOptimizer(fun, x0, jac):
+    """Optimizer that never finishes."""
+    while True:
+        fun(x0)
+        time.sleep(0.01)
+
+
+def _failingOptimizer(fun, x0, jac):
+    raise ValueError("optimizer failed")
+
+
+def _waitForStatus(job, status, timeout = 10):
+    """Wait until the job has the given status."""
+    end = time.time() + timeout
+    while job.status != status and time.time() < end:
+        time.sleep(0.01)
+    return job.status == status
+
+
+class TestFitService(unittest.TestCase):
+
+    def setUp(self):
+        self.service = FitService(workers = 1, interval = 0)
+        return
+
+
+    def tearDown(self):
+        self.service.close(cancel = True)
+        return
+
+
+    def testSubmit(self):
+        """check refinement of the submitted recipes"""
+        service = self.service
+        recipe = _makeRecipe(2, 0.4)
+        job = service.submit(recipe)
+        rv = job.result(timeout = 10)
+        self.assertEqual("done", job.status)
+        self.assertEqual(["A", "k"], rv["names"])
+        self.assertTrue(numpy.allclose([2, 0.4], rv["values"]))
+        self.assertTrue(rv["chi2"] < 1e-10)
+        self.assertEqual(1, len(rv["stages"]))
+        # the submitted recipe is updated only by apply
+        self.assertEqual(1.0, recipe.A.value)
+        job.apply()
+        self.assertAlmostEqual(2, recipe.A.value)
+        self.assertTrue(job.progress["count"] > 0)
+        done = []
+        job.addDoneCallback(done.append)
+        self.assertEqual([job], done)
+        return
+
+
+    def testFixedVariable(self):
+        """check that the fixed variables of the recipe are not refined"""
+        recipe = _makeRecipe(2, 0.4)
+        recipe.fix(A = 2)
+        job = self.service.submit(recipe, schedule = ["k", "all"])
+        rv = job.result(timeout = 10)
+        self.assertEqual(["A"], rv["fixed"])
+        self.assertEqual(["k"], rv["stages"][1]["names"])
+        self.assertEqual(2, rv["values"][0])
+        self.assertAlmostEqual(0.4, rv["values"][1])
+        return
+
+
+    def testPriority(self):
+        """check jobs with higher priority are started first"""
+        service = self.service
+        first = service.submit(_makeRecipe(2, 0.4),
+                optimizer = _slowOptimizer)
+        self.assertTrue(_waitForStatus(first, "running"))
+        done = []
+        low = service.submit(_makeRecipe(2, 0.4))
+        low.addDoneCallback(done.append)
+        high = service.submit(_makeRecipe(3, 0.6), priority = 1)
+        high.addDoneCallback(done.append)
+        self.assertTrue(first.cancel())
+        self.assertFalse(first.cancel())
+        self.assertTrue(low.wait(10))
+        self.assertEqual([high, low], done)
+        self.assertEqual("cancelled", first.status)
+        self.assertRaises(SrFitError, first.result)
+        return
+
+
+    def testTimeout(self):
+        """check timed out and failed jobs"""
+        service = self.service
+        job = service.submit(_makeRecipe(2, 0.4), timeout = 0.2,
+                optimizer = _slowOptimizer)
+        self.assertTrue(job.wait(10))
+        self.assertEqual("timeout", job.status)
+        job = service.submit(_makeRecipe(2, 0.4),
+                optimizer = _failingOptimizer)
+        self.assertRaises(SrFitError, job.result, 10)
+        self.assertEqual("failed", job.status)
+        # the worker process is restarted after the timeout
+        job = service.submit(_makeRecipe(2, 0.4))
+        self.assertTrue(numpy.allclose([2, 0.4], job.result(10)["values"]))
+        service.close()
+        self.assertRaises(SrFitError, service.submit, _makeRecipe(2, 0.4))
+        return
+
+
+
+    def testDeadWorker(self):
+        """check jobs sent to a worker process that has died"""
+        import multiprocessing
+        service = self.service
+        job = service.submit(_makeRecipe(2, 0.4))
+        self.assertTrue(job.wait(10))
+        self.assertEqual("done", job.status)
+        for proc in multiprocessing.active_children():
+            proc.terminate()
+            proc.join()
+        job = service.submit(_makeRecipe(2, 0.4))
+        self.assertTrue(job.wait(10))
+        self.assertEqual("failed", job.status)
+        # the worker process is restarted
+        job = service.submit(_makeRecipe(2, 0.4))
+        self.assertTrue(numpy.allclose([2, 0.4], job.result(10)["values"]))
+        return
+
+# End of class TestFitService
+
+if __name__ == '__main__':
+    unittest.main()
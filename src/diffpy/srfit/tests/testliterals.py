@@ -189,6 +189,42 @@ class TestConvolutionOperator(unittest.TestCase):
         self.assertAlmostEqual(0, sum((g3-g3c)**2))
         return
 
+
+    def testFFT(self):
+        """Check the FFT convolution and the cached kernel transform."""
+        x = numpy.linspace(0, 10, 1000)
+        a1 = literals.Argument(name="g1", value=numpy.exp(-(x - 4)**2))
+        a2 = literals.Argument(name="g2", value=numpy.exp(-x))
+        op = literals.ConvolutionOperator()
+        op.addLiteral(a1)
+        op.addLiteral(a2)
+        c = op.value
+        kfft = op._kernelfft
+        self.assertFalse(kfft is None)
+        op.fftthreshold = None
+        c0 = op.operation(a1.value, a2.value)
+        self.assertTrue(numpy.allclose(c0, c, rtol=0, atol=1e-12))
+        # kernel transform is reused for a new signal
+        op.fftthreshold = 1000
+        a1.setValue(numpy.exp(-(x - 5)**2))
+        c = op.value
+        self.assertTrue(kfft is op._kernelfft)
+        op.fftthreshold = None
+        c0 = op.operation(a1.value, a2.value)
+        self.assertTrue(numpy.allclose(c0, c, rtol=0, atol=1e-12))
+        # and recalculated for a new kernel
+        op.fftthreshold = 1000
+        a2.setValue(numpy.exp(-2 * x))
+        self.assertFalse(numpy.allclose(c0, op.value))
+        self.assertFalse(kfft is op._kernelfft)
+        # short signals use the direct convolution
+        op2 = literals.ConvolutionOperator()
+        c = op2.operation([0, 1, 2, 1, 0], [0.5, 1, 0.5])
+        self.assertAlmostEqual(4, numpy.sum(c))
+        self.assertAlmostEqual(2, numpy.dot(c, range(5)) / 4)
+        self.assertTrue(op2._kernelfft is None)
+        return
+
 # ----------------------------------------------------------------------------
 
 class TestArrayOperator(unittest.TestCase):
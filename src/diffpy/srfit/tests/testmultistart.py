@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      Complex Modeling Initiative
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""Tests for the multistart module."""
+
+import unittest
+
+import numpy
+
+from diffpy.srfit.fitbase import FitContribution, FitRecipe, Profile
+from diffpy.srfit.fitbase import FitHook
+from diffpy.srfit.fitbase.multistart import multiStart, _sampleStarts
+
+
+class _CountingFitHook(FitHook):
+    """FitHook that counts the residual calls."""
+
+    count = 0
+
+    def precall(self, recipe):
+        self.count += 1
+        return
+
+# End of class _CountingFitHook
+
+
+class TestMultiStart(unittest.TestCase):
+
+    def setUp(self):
+        # a frequency fit with many local minima
+        self.recipe = recipe = FitRecipe("recipe")
+        recipe.clearFitHooks()
+        x = numpy.linspace(0, 10, 200)
+        profile = Profile()
+        y = numpy.sin(2.3 * x) + 0.01 * numpy.cos(7 * x)
+        profile.setObservedProfile(x, y)
+        con = FitContribution("sine")
+        con.setProfile(profile)
+        con.setEquation("sin(k * x)")
+        recipe.addContribution(con)
+        recipe.addVar(con.k, 0.6)
+        recipe.k.bounds = [0.5, 3]
+        return
+
+
+    def testSampleStarts(self):
+        """check the starting points of multiStart"""
+        recipe = self.recipe
+        recipe.newVar("b", 1.5)
+        starts = _sampleStarts(recipe, 10, 7)
+        self.assertEqual((10, 2), starts.shape)
+        self.assertEqual([0.6, 1.5], list(starts[0]))
+        self.assertTrue(numpy.all(starts[:, 0] >= 0.5))
+        self.assertTrue(numpy.all(starts[:, 0] <= 3))
+        self.assertTrue(numpy.all(starts[:, 1] == 1.5))
+        self.assertTrue(numpy.array_equal(starts,
+            _sampleStarts(recipe, 10, 7)))
+        return
+
+
+    def testMultiStart(self):
+        """check the ranked solutions of multiStart"""
+        recipe = self.recipe
+        results = multiStart(recipe, nstarts = 12, seed = 1)
+        self.assertTrue(len(results) > 1)
+        chi2 = [res.chi2 for res in results]
+        self.assertEqual(sorted(chi2), chi2)
+        self.assertAlmostEqual(2.3, results[0].varvals[0], 2)
+        self.assertTrue(results[0].rw < 0.02)
+        # the recipe is set to the best solution
+        self.assertAlmostEqual(2.3, recipe.k.value, 2)
+        # the solutions are distinct
+        k = [res.varvals[0] for res in results]
+        self.assertEqual(len(k), len(set(numpy.round(k, 3))))
+        # the same seed gives the same solutions
+        recipe.k.value = 0.6
+        results2 = multiStart(recipe, nstarts = 12, seed = 1)
+        self.assertEqual(k, [res.varvals[0] for res in results2])
+        return
+
+
+    def testTargetRw(self):
+        """check early termination of multiStart"""
+        recipe = self.recipe
+        recipe.k.value = 2.25
+        results = multiStart(recipe, nstarts = 12, seed = 1, targetrw = 0.02)
+        self.assertEqual(1, len(results))
+        self.assertAlmostEqual(2.3, recipe.k.value, 2)
+        return
+
+
+    def testFitHooks(self):
+        """check that FitHooks are not called for the results"""
+        recipe = self.recipe
+        hook = _CountingFitHook()
+        recipe.pushFitHook(hook)
+        results = multiStart(recipe, nstarts = 4, seed = 1)
+        self.assertTrue(len(results) > 0)
+        self.assertEqual(0, hook.count)
+        self.assertEqual([hook], recipe.getFitHooks())
+        recipe.residual()
+        self.assertEqual(1, hook.count)
+        return
+
+
+    def testWorkers(self):
+        """check multiStart in a pool of worker processes"""
+        recipe = self.recipe
+        results = multiStart(recipe, nstarts = 6, seed = 1)
+        recipe.k.value = 0.6
+        results2 = multiStart(recipe, nstarts = 6, seed = 1, workers = 2)
+        self.assertEqual([res.varvals for res in results],
+                [res.varvals for res in results2])
+        return
+
+# End of class TestMultiStart
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      Complex Modeling Initiative
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""Tests for the equation profiler module."""
+
+import unittest
+
+import diffpy.srfit.equation.literals as literals
+from diffpy.srfit.equation import Equation, EquationProfiler
+from diffpy.srfit.exceptions import SrFitError
+from diffpy.srfit.tests.utils import _makeArgs
+
+
+class TestEquationProfiler(unittest.TestCase):
+
+    def setUp(self):
+        # equation (v1 + v2) * v3
+        self.v1, self.v2, self.v3 = _makeArgs(3)
+        self.plus = literals.AdditionOperator()
+        self.plus.addLiteral(self.v1)
+        self.plus.addLiteral(self.v2)
+        self.mult = literals.MultiplicationOperator()
+        self.mult.addLiteral(self.plus)
+        self.mult.addLiteral(self.v3)
+        self.eq = Equation("eq", self.mult)
+        self.profiler = EquationProfiler()
+        return
+
+
+    def tearDown(self):
+        self.profiler.disable()
+        return
+
+
+    def testStats(self):
+        """check counts of evaluations, hits and invalidations"""
+        eq, profiler = self.eq, self.profiler
+        eq()
+        with profiler:
+            self.assertTrue(profiler.enabled)
+            self.assertEqual(9, eq())
+            self.v3.setValue(4)
+            self.assertEqual(12, eq())
+            self.v1.setValue(2)
+            self.assertEqual(16, eq())
+        self.assertFalse(profiler.enabled)
+        eq()
+        self.assertEqual(3, profiler.getStats(eq)["evaluations"])
+        smult = profiler.getStats(self.mult)
+        self.assertEqual(2, smult["evaluations"])
+        self.assertEqual(1, smult["hits"])
+        self.assertEqual(2, smult["invalidations"])
+        splus = profiler.getStats(self.plus)
+        self.assertEqual(1, splus["evaluations"])
+        self.assertEqual(1, splus["hits"])
+        self.assertEqual(1, splus["invalidations"])
+        self.assertTrue(smult["time"] >= splus["time"])
+        self.assertTrue(smult["selftime"] <= smult["time"])
+        # no observers are left after disable
+        self.v1.setValue(5)
+        eq()
+        self.assertEqual(1, profiler.getStats(self.plus)["invalidations"])
+        profiler.clear()
+        self.assertEqual(None, profiler.getStats(eq))
+        return
+
+
+    def testCompiled(self):
+        """check profiling of a compiled equation"""
+        eq, profiler = self.eq, self.profiler
+        eq.setCompiled(True)
+        with profiler:
+            self.assertEqual(9, eq())
+            self.assertRaises(SrFitError, EquationProfiler().enable)
+        self.assertTrue(eq.compiled)
+        self.assertEqual(1, profiler.getStats(self.plus)["evaluations"])
+        return
+
+
+    def testFormat(self):
+        """check the annotated tree"""
+        eq, profiler = self.eq, self.profiler
+        with profiler:
+            eq()
+        lines = profiler.format(eq).split("\n")
+        self.assertEqual(4, len(lines))
+        self.assertTrue(lines[0].split()[:3] == ["evals", "hits", "invalid"])
+        self.assertTrue(lines[1].endswith("  eq = ((v1 + v2) * v3)"))
+        self.assertTrue(lines[3].endswith("      (v1 + v2)"))
+        self.assertEqual(["1", "0", "0"], lines[3].split()[:3])
+        lines = profiler.format(eq, eqskip="eq").split("\n")
+        self.assertEqual(2, len(lines))
+        return
+
+# End of class TestEquationProfiler
+
+if __name__ == '__main__':
+    unittest.main()
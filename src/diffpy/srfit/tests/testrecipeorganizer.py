@@ -506,6 +506,43 @@ class TestRecipeOrganizer(unittest.TestCase):
         return
 
 
+    def testBatchUpdate(self):
+        """Verify coalesced notifications in batchUpdate."""
+        m = self.m
+        x = m._newParameter('x', 1)
+        y = m._newParameter('y', 2)
+        eq = equationFromString('x + y', m._eqfactory)
+        self.assertEqual(3, eq())
+        calls = []
+        observer = lambda semaphors: calls.append(semaphors)
+        x.addObserver(observer)
+        y.addObserver(observer)
+        with m.batchUpdate():
+            x.setValue(3)
+            with m.batchUpdate():
+                y.setValue(4)
+                x.setValue(5)
+            self.assertEqual([], calls)
+        # observer is called only once
+        self.assertEqual(1, len(calls))
+        self.assertEqual(9, eq())
+        # notifications outside of a batch are not coalesced
+        x.setValue(6)
+        y.setValue(7)
+        self.assertEqual(3, len(calls))
+        self.assertEqual(13, eq())
+        # batch does not postpone the notifications from other threads
+        import threading
+        with m.batchUpdate():
+            t = threading.Thread(target=y.setValue, args=(8,))
+            t.start()
+            t.join()
+            self.assertEqual(4, len(calls))
+        self.assertEqual(4, len(calls))
+        self.assertEqual(14, eq())
+        return
+
+
     def test_show(self):
         """Verify output from the show function.
         """
@@ -17,7 +17,9 @@
 
 import unittest
 
-from diffpy.srfit.fitbase.restraint import Restraint
+import numpy
+
+from diffpy.srfit.fitbase.restraint import Restraint, RestraintGroup
 from diffpy.srfit.fitbase.recipeorganizer import equationFromString
 from diffpy.srfit.fitbase.parameter import Parameter
 from diffpy.srfit.equation.builder import EquationFactory
@@ -62,7 +64,6 @@ class TestRestraint(unittest.TestCase):
         self.assertEqual(13.5, r.penalty(1.5))
 
         # Make a really large number to check the upper bound
-        import numpy
         r.ub = numpy.inf
         p1.setValue(1e100)
         self.assertEqual(0, r.penalty())
@@ -70,5 +71,78 @@ class TestRestraint(unittest.TestCase):
         return
 
 
+    def testRestraintGroup(self):
+        """Test the RestraintGroup class."""
+        factory = EquationFactory()
+        pars = [Parameter("p%i" % i, 0.5 * i - 2) for i in range(8)]
+        restraints = []
+        for i, p in enumerate(pars):
+            factory.registerArgument(p.name, p)
+            eq = equationFromString("2 * %s" % p.name, factory)
+            restraints.append(Restraint(eq, -1, 1.5, sig = 0.1 * (i + 1),
+                scaled = bool(i % 3)))
+        group = RestraintGroup(restraints)
+        self.assertEqual(8, len(group))
+        for w in (1.0, 2.5):
+            expected = [numpy.sqrt(r.penalty(w)) for r in restraints]
+            self.assertTrue(numpy.array_equal(expected, group.residual(w)))
+        out = numpy.zeros(10)
+        group.residual(2.5, out = out[2:])
+        self.assertTrue(numpy.array_equal(expected, out[2:]))
+        # subclasses that override penalty cannot be grouped
+        class ExpRestraint(Restraint):
+            def penalty(self, w = 1.0):
+                return numpy.exp(self.eq())
+        self.assertTrue(RestraintGroup.isGroupable(restraints[0]))
+        self.assertFalse(RestraintGroup.isGroupable(
+            ExpRestraint(restraints[0].eq)))
+        return
+
+
+    def testObserversWithoutInit(self):
+        """Check observers of a Restraint that skips Restraint.__init__."""
+        class BareRestraint(Restraint):
+            def __init__(self, sig):
+                self.sig = sig
+        res = BareRestraint(2)
+        self.assertEqual(2, res.sig)
+        calls = []
+        def observer(other):
+            calls.append(other)
+        res.addObserver(observer)
+        self.assertTrue(res.hasObserver(observer))
+        res.sig = 3
+        self.assertEqual(1, len(calls))
+        self.assertFalse(BareRestraint(1).hasObserver(observer))
+        return
+
+
+    def testRestraintGroupUpdate(self):
+        """Check RestraintGroup values and changes of the bounds."""
+        factory = EquationFactory()
+        a = Parameter("a", 1.0)
+        b = Parameter("b", 2.0)
+        factory.registerArgument("a", a)
+        factory.registerArgument("b", b)
+        restraints = [Restraint(equationFromString(s, factory), 0, 1)
+                for s in ("a", "a - 2 * b + 1", "a * b", "b**2")]
+        group = RestraintGroup(restraints)
+        self.assertEqual([0, 1], group._rows)
+        self.assertEqual([2, 3], [i for i, res in group._others])
+        for va, vb in ((1.0, 2.0), (3.0, -0.5)):
+            a.setValue(va)
+            b.setValue(vb)
+            expected = [res.eq() for res in restraints]
+            self.assertTrue(numpy.array_equal(expected, group.values()))
+        # bounds are read again after a change
+        restraints[1].ub = 10
+        restraints[2].sig = 0.5
+        restraints[3].scaled = True
+        expected = [numpy.sqrt(r.penalty(2.0)) for r in restraints]
+        self.assertTrue(numpy.array_equal(expected, group.residual(2.0)))
+        self.assertEqual(10, group.ub[1])
+        return
+
+
 if __name__ == "__main__":
     unittest.main()
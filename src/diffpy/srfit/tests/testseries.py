@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      Complex Modeling Initiative
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""Tests for the series module."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from diffpy.srfit.fitbase import FitContribution, FitRecipe, Profile
+from diffpy.srfit.fitbase.series import SeriesRefinement, SeriesStore
+
+
+def _loadPoint(recipe, t):
+    """Load the dataset of the series point t into the recipe."""
+    x = numpy.linspace(0, 5, 50)
+    y = (2 + 0.5 * t) * numpy.exp(-(0.4 + 0.1 * t) * x)
+    recipe.decay.profile.setObservedProfile(x, y)
+    return
+
+
+class TestSeriesRefinement(unittest.TestCase):
+
+    def setUp(self):
+        self.recipe = recipe = FitRecipe("recipe")
+        recipe.clearFitHooks()
+        con = FitContribution("decay")
+        con.setProfile(Profile())
+        con.setEquation("A * exp(-k * x)")
+        recipe.addContribution(con)
+        _loadPoint(recipe, 0)
+        recipe.addVar(con.A, 1.0)
+        recipe.addVar(con.k, 0.5)
+        self.tmpdir = tempfile.mkdtemp()
+        return
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        return
+
+
+    def testRun(self):
+        """check refinement of a series"""
+        series = SeriesRefinement(self.recipe, _loadPoint)
+        store = series.run([0, 1, 2, 3])
+        self.assertEqual(["0", "1", "2", "3"], store.labels)
+        self.assertEqual(["A", "k"], store.names)
+        self.assertTrue(numpy.allclose([2, 2.5, 3, 3.5], store.column("A")))
+        self.assertTrue(numpy.allclose([0.4, 0.5, 0.6, 0.7],
+            store.column("k")))
+        self.assertTrue(numpy.all(store.rw < 1e-6))
+        self.assertEqual((4,), store.time.shape)
+        return
+
+
+    def testFixedVariable(self):
+        """check that variables fixed by the user are not refined"""
+        recipe = self.recipe
+        recipe.fix(A = 2.5)
+        series = SeriesRefinement(recipe, _loadPoint, schedule = ["A", "all"])
+        store = series.run([0, 1, 2])
+        self.assertTrue(numpy.all(store.column("A") == 2.5))
+        self.assertAlmostEqual(0.5, store.column("k")[1])
+        self.assertAlmostEqual(0, store.chi2[1])
+        self.assertTrue(store.chi2[0] > 0)
+        self.assertEqual(["A"], recipe.fixednames)
+        self.assertEqual(["k"], recipe.getNames())
+        # the free variables are refined at every point
+        recipe.free("A")
+        store = series.run([0, 1, 2])
+        self.assertTrue(numpy.allclose([2, 2.5, 3], store.column("A")))
+        self.assertEqual(["A", "k"], recipe.getNames())
+        return
+
+
+    def testExtrapolate(self):
+        """check the extrapolated starting point"""
+        recipe = self.recipe
+        series = SeriesRefinement(recipe, _loadPoint, extrapolate = True)
+        store = SeriesStore(["A", "k"])
+        store.append("0", [2, 0.4], 0, 0, 0)
+        series._setStart(store)
+        self.assertEqual([2, 0.4], [recipe.A.value, recipe.k.value])
+        store.append("1", [2.5, 0.5], 0, 0, 0)
+        series._setStart(store)
+        self.assertAlmostEqual(3, recipe.A.value)
+        self.assertAlmostEqual(0.6, recipe.k.value)
+        series.extrapolate = False
+        series._setStart(store)
+        self.assertEqual([2.5, 0.5], [recipe.A.value, recipe.k.value])
+        return
+
+
+    def testResume(self):
+        """check the store file and resuming of a series"""
+        filename = os.path.join(self.tmpdir, "series.npz")
+        loaded = []
+        def loader(recipe, t):
+            loaded.append(t)
+            _loadPoint(recipe, t)
+        series = SeriesRefinement(self.recipe, loader)
+        store1 = series.run([0, 1], filename)
+        self.assertEqual([0, 1], loaded)
+        store2 = SeriesStore.load(filename)
+        self.assertEqual(store1.labels, store2.labels)
+        self.assertTrue(numpy.array_equal(store1.values, store2.values))
+        self.assertTrue(numpy.array_equal(store1.rw, store2.rw))
+        self.assertTrue(numpy.array_equal(store1.time, store2.time))
+        self.assertEqual((2,), store2.chi2.shape)
+        self.assertFalse(os.path.exists(filename + ".tmp"))
+        store = series.run([0, 1, 2], filename)
+        self.assertEqual([0, 1, 2], loaded)
+        self.assertEqual(3, len(store))
+        self.assertAlmostEqual(3, store.column("A")[-1])
+        self.assertEqual(3, len(SeriesStore.load(filename)))
+        self.assertRaises(ValueError, series.run, [5, 1, 2], filename)
+        return
+
+
+    def testRunChains(self):
+        """check refinement of parallel chains"""
+        series = SeriesRefinement(self.recipe, _loadPoint)
+        chains = [[0, 1], [3, 2]]
+        filenames = [os.path.join(self.tmpdir, "c%i.npz" % i)
+                for i in range(2)]
+        stores = series.runChains(chains, filenames, workers = 2)
+        self.assertEqual(["3", "2"], stores[1].labels)
+        self.assertTrue(numpy.allclose([3.5, 3], stores[1].column("A")))
+        self.assertTrue(os.path.exists(filenames[1]))
+        # the recipe of the series is not changed
+        self.assertEqual(1.0, self.recipe.A.value)
+        stores2 = series.runChains(chains)
+        for s1, s2 in zip(stores, stores2):
+            self.assertTrue(numpy.allclose(s1.values, s2.values))
+        return
+
+# End of class TestSeriesRefinement
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      Complex Modeling Initiative
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""Tests for the snapshot module."""
+
+import shutil
+import tempfile
+import unittest
+import cPickle
+
+import numpy
+
+from diffpy.srfit.fitbase import FitContribution, FitRecipe, Profile
+from diffpy.srfit.fitbase.parameter import ParameterAdapter
+from diffpy.srfit.fitbase.snapshot import RecipeSnapshot
+
+
+class _Holder(object):
+    """Object with a value accessed through methods."""
+
+    def __init__(self):
+        self.value = 3.0
+
+    def getValue(self):
+        return self.value
+
+    def setValue(self, value):
+        self.value = value
+
+    def __getPrivate(self):
+        return -self.value
+
+    def getPrivate(self):
+        return self.__getPrivate
+
+# End class _Holder
+
+
+class _DerivedHolder(_Holder):
+    """Holder with the private method defined in the base class."""
+
+# End class _DerivedHolder
+
+
+class TestRecipeSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.recipe = recipe = FitRecipe("recipe")
+        recipe.clearFitHooks()
+        x = numpy.linspace(0, 5, 40)
+        profile = Profile()
+        profile.setObservedProfile(x, 2 * numpy.exp(-0.5 * x))
+        con = FitContribution("decay")
+        con.setProfile(profile)
+        con.setEquation("A * exp(-k * x)")
+        recipe.addContribution(con)
+        recipe.addVar(con.A, 1.0)
+        recipe.addVar(con.k, 0.3)
+        self.tmpdir = tempfile.mkdtemp()
+        return
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        return
+
+
+    def testClone(self):
+        """check the clone shares the Profile arrays"""
+        recipe = self.recipe
+        chiv = recipe.residual()
+        recipe2 = recipe.clone()
+        self.assertTrue(numpy.array_equal(chiv, recipe2.residual()))
+        p1 = recipe.decay.profile
+        p2 = recipe2.decay.profile
+        self.assertTrue(p1.xobs is p2.xobs)
+        self.assertTrue(p1.y is p2.y)
+        # the variables are independent
+        recipe2.residual([2, 0.5])
+        self.assertEqual(1.0, recipe.A.value)
+        self.assertTrue(numpy.allclose(0, recipe2.residual()))
+        self.assertTrue(numpy.array_equal(chiv, recipe.residual()))
+        return
+
+
+    def testSaveOpen(self):
+        """check the snapshot saved to a directory"""
+        snapshot = RecipeSnapshot(self.recipe)
+        p = self.recipe.decay.profile
+        self.assertTrue(any(b is p.xobs for b in snapshot.buffers))
+        snapshot.save(self.tmpdir)
+        snapshot2 = RecipeSnapshot.open(self.tmpdir)
+        self.assertTrue(isinstance(snapshot2.buffers[0], numpy.memmap))
+        recipe2 = snapshot2.load()
+        self.assertTrue(numpy.array_equal(self.recipe.residual(),
+            recipe2.residual()))
+        x2 = recipe2.decay.profile.x
+        self.assertTrue(any(b is x2 for b in snapshot2.buffers))
+        snapshot3 = RecipeSnapshot.open(self.tmpdir, mmap_mode = None)
+        self.assertFalse(isinstance(snapshot3.buffers[0], numpy.memmap))
+        return
+
+
+    def testMethodPickling(self):
+        """check pickling of ParameterAdapter with method accessors"""
+        holder = _Holder()
+        par = ParameterAdapter("v", holder, _Holder.getValue,
+                _Holder.setValue)
+        par2 = cPickle.loads(cPickle.dumps(par, cPickle.HIGHEST_PROTOCOL))
+        self.assertEqual(3.0, par2.getValue())
+        par2.setValue(4.0)
+        self.assertEqual(4.0, par2.getValue())
+        self.assertEqual(3.0, holder.value)
+        bound = cPickle.loads(cPickle.dumps(holder.getValue))
+        self.assertEqual(3.0, bound())
+        # private method of the base class
+        derived = _DerivedHolder()
+        for f in (holder.getPrivate(), derived.getPrivate()):
+            f2 = cPickle.loads(cPickle.dumps(f, cPickle.HIGHEST_PROTOCOL))
+            self.assertEqual(-3.0, f2())
+        return
+
+# End of class TestRecipeSnapshot
+
+if __name__ == '__main__':
+    unittest.main()
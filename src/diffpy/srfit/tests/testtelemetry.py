@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      Complex Modeling Initiative
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""Tests for the telemetry module."""
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from diffpy.srfit.fitbase import FitContribution, FitRecipe, Profile
+from diffpy.srfit.fitbase.executor import ThreadExecutor
+from diffpy.srfit.fitbase.telemetry import TelemetryFitHook, STAGES
+
+
+class TestTelemetryFitHook(unittest.TestCase):
+
+    def setUp(self):
+        self.recipe = recipe = FitRecipe("recipe")
+        recipe.clearFitHooks()
+        x = numpy.linspace(0, 5, 30)
+        for name in ("c1", "c2"):
+            profile = Profile()
+            profile.setObservedProfile(x, numpy.exp(-0.5 * x))
+            con = FitContribution(name)
+            con.setProfile(profile)
+            con.setEquation("A * exp(-k * x)")
+            recipe.addContribution(con)
+        recipe.addVar(recipe.c1.A, 1.0, name="A")
+        recipe.constrain(recipe.c2.A, "A")
+        recipe.addVar(recipe.c1.k, 0.3, name="k")
+        recipe.constrain(recipe.c2.k, "k")
+        recipe.restrain("k", lb = 0, ub = 1)
+        self.hook = TelemetryFitHook(size = 20)
+        recipe.pushFitHook(self.hook)
+        self.tmpdir = tempfile.mkdtemp()
+        return
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        return
+
+
+    def testRecords(self):
+        """check the recorded events"""
+        hook = self.hook
+        self.recipe.residual([1, 0.4])
+        self.assertEqual(1, hook.count)
+        rec = hook.getRecords()
+        names = [STAGES[c] for c in rec["codes"]]
+        self.assertEqual(["precall", "update", "contribution",
+            "contribution", "restraints", "postcall"], names)
+        self.assertEqual([-1, -1, 0, 1, -1, -1], list(rec["index"]))
+        self.assertTrue(numpy.all(numpy.diff(rec["times"]) >= 0))
+        # ring buffer keeps the last records
+        for i in range(5):
+            self.recipe.residual([1, 0.5 + 0.01 * i])
+        self.assertEqual(6, hook.count)
+        rec = hook.getRecords()
+        self.assertEqual(20, len(rec["calls"]))
+        self.assertEqual(6, rec["calls"][-1])
+        self.assertTrue(numpy.all(numpy.diff(rec["calls"]) >= 0))
+        dur = hook.getDurations()
+        self.assertEqual(3, len(dur["residual"]))
+        self.assertEqual(6, len(dur["contribution"]))
+        self.assertEqual(0, len(dur["contributions"]))
+        hook.clear()
+        self.assertEqual(0, len(hook.getRecords()["times"]))
+        # parallel executor
+        self.recipe.setExecutor(ThreadExecutor(2))
+        self.recipe.residual([1, 0.3])
+        dur = hook.getDurations()
+        self.assertEqual(1, len(dur["contributions"]))
+        self.assertEqual(0, len(dur["contribution"]))
+        self.recipe.setExecutor(None)
+        return
+
+
+    def testStageHooks(self):
+        """check the list of FitHooks called at the residual stages"""
+        recipe = self.recipe
+        self.assertEqual([self.hook], recipe._stagehooks)
+        recipe.popFitHook(self.hook)
+        self.assertEqual([], recipe._stagehooks)
+        recipe.residual([1, 0.4])
+        self.assertEqual(0, self.hook.count)
+        recipe.pushFitHook(self.hook)
+        recipe.popFitHook()
+        self.assertEqual([], recipe.getFitHooks())
+        recipe.pushFitHook(self.hook)
+        recipe.clearFitHooks()
+        self.assertEqual([], recipe._stagehooks)
+        return
+
+
+    def testSave(self):
+        """check the npz and Chrome trace files"""
+        hook = self.hook
+        self.recipe.residual([1, 0.4])
+        self.recipe.residual([1, 0.5])
+        fnpz = os.path.join(self.tmpdir, "telemetry.npz")
+        hook.save(fnpz)
+        data = numpy.load(fnpz)
+        self.assertEqual(list(STAGES), list(data["stages"]))
+        self.assertTrue(numpy.array_equal(hook.getRecords()["times"],
+            data["times"]))
+        ftrace = os.path.join(self.tmpdir, "trace.json")
+        hook.saveChromeTrace(ftrace)
+        with open(ftrace) as fp:
+            trace = json.load(fp)
+        events = trace["traceEvents"]
+        self.assertEqual(2 * 5, len(events))
+        self.assertEqual("contribution[1]", events[2]["name"])
+        self.assertEqual("residual", events[4]["name"])
+        self.assertTrue(all(e["ph"] == "X" and e["dur"] >= 0
+            for e in events))
+        return
+
+# End of class TestTelemetryFitHook
+
+if __name__ == '__main__':
+    unittest.main()
@@ -19,6 +19,8 @@ import diffpy.srfit.equation.visitors as visitors
 import diffpy.srfit.equation.literals as literals
 import unittest
 
+import numpy
+
 from diffpy.srfit.tests.utils import _makeArgs
 
 class TestValidator(unittest.TestCase):
@@ -205,5 +207,174 @@ class TestSwapper(unittest.TestCase):
         return
 
 
+class TestDifferentiator(unittest.TestCase):
+
+    def setUp(self):
+        from diffpy.srfit.equation.builder import EquationFactory
+        self.factory = EquationFactory()
+        self.x = numpy.linspace(0.1, 3, 20)
+        self.factory.registerArgument("x", literals.Argument("x", self.x))
+        return
+
+
+    def _numericDerivatives(self, eq, names, h=1e-6):
+        rv = []
+        for n in names:
+            a = eq.argdict[n]
+            v0 = a.value
+            a.setValue(v0 + h)
+            yp = eq()
+            a.setValue(v0 - h)
+            ym = eq()
+            a.setValue(v0)
+            rv.append((yp - ym) / (2 * h))
+        return rv
+
+
+    def _checkEquation(self, eqstr, values, decimal=6):
+        eq = self.factory.makeEquation(eqstr)
+        names = sorted(values)
+        for n in names:
+            eq.argdict[n].setValue(values[n])
+        args = [eq.argdict[n] for n in names]
+        ders = visitors.getDerivatives(eq, args)
+        expected = self._numericDerivatives(eq, names)
+        for d, e in zip(ders, expected):
+            self.assertEqual(numpy.shape(e), numpy.shape(d))
+            numpy.testing.assert_array_almost_equal(e, d, decimal)
+        return ders
+
+
+    def testArithmetic(self):
+        """Test derivatives of arithmetic operators."""
+        d = self._checkEquation("(A + B * x) / (C - x) - A**B + (-C) % 7",
+                dict(A=1.5, B=0.7, C=5.0))
+        self.assertEqual(3, len(d))
+        # derivative with respect to unused argument is zero
+        eq = self.factory.makeEquation("A * x")
+        a = eq.argdict["A"]
+        b = literals.Argument("B", 2.0)
+        da, db = visitors.getDerivatives(eq, [a, b])
+        self.assertTrue(numpy.array_equal(self.x, da))
+        self.assertTrue(numpy.array_equal(numpy.zeros_like(self.x), db))
+        return
+
+
+    def testFunctions(self):
+        """Test derivatives of ufunc, sum and polyval operators."""
+        self._checkEquation("sin(A * x) + exp(-B * x) * sqrt(x + A)",
+                dict(A=0.8, B=1.2))
+        self._checkEquation("log(A + x) * tanh(B) + arctan(A * B)",
+                dict(A=0.5, B=0.3))
+        self._checkEquation("sum(A * x**2) + B", dict(A=2.0, B=3.0))
+        self._checkEquation("polyval(array(B, A, C), A * x)",
+                dict(A=0.5, B=0.3, C=2.0))
+        return
+
+
+    def testNumericFallback(self):
+        """Test local finite differences for unknown operations."""
+        self.factory.registerFunction("hypot2",
+                lambda a, b : numpy.hypot(a, b)**2, ["a", "b"])
+        eq = self.factory.makeEquation("hypot2(A * x, B)")
+        eq.argdict["A"].setValue(1.3)
+        eq.argdict["B"].setValue(0.4)
+        da, db = visitors.getDerivatives(eq,
+                [eq.argdict["A"], eq.argdict["B"]])
+        numpy.testing.assert_array_almost_equal(2 * 1.3 * self.x**2, da, 5)
+        numpy.testing.assert_array_almost_equal(0.8 * numpy.ones(20), db, 5)
+        # convolution
+        self._checkEquation("convolve(exp(-(x - A)**2), exp(-B * x))",
+                dict(A=1.5, B=2.0), decimal=5)
+        return
+
+
+    def testEmbeddedEquation(self):
+        """Test derivatives through embedded equations and proxies."""
+        from diffpy.srfit.fitbase.parameter import Parameter, ParameterProxy
+        eq1 = self.factory.makeEquation("A * x**2")
+        eq1.name = "eq1"
+        self.factory.registerOperator("eq1", eq1)
+        eq2 = self.factory.makeEquation("eq1 + eq1 * B")
+        a = eq1.argdict["A"]
+        b = eq2.argdict["B"]
+        a.setValue(3.0)
+        b.setValue(2.0)
+        da, db = visitors.getDerivatives(eq2, [a, b])
+        numpy.testing.assert_array_almost_equal(3 * self.x**2, da)
+        numpy.testing.assert_array_almost_equal(3 * self.x**2, db)
+        # seeds are matched through proxies
+        p = Parameter("p", 4.0)
+        proxy = ParameterProxy("q", p)
+        eq3 = self.factory.makeEquation("q * x")
+        visitors.swap(eq3.root, eq3.argdict["q"], proxy)
+        dp, = visitors.getDerivatives(eq3, [p])
+        self.assertTrue(numpy.array_equal(self.x, dp))
+        return
+
+
+class TestAffineDecomposer(unittest.TestCase):
+
+    def setUp(self):
+        from diffpy.srfit.equation.builder import EquationFactory
+        self.factory = EquationFactory()
+        self.factory.registerArgument("x", literals.Argument("x", 2.0))
+        self.factory.registerArgument("y", literals.Argument("y", 3.0))
+        self.factory.registerConstant("c", 4.0)
+        self.factory.registerArgument("v", literals.Argument("v",
+            numpy.arange(3.0)))
+        return
+
+
+    def _decompose(self, eqstr, **kw):
+        eq = self.factory.makeEquation(eqstr)
+        v = visitors.AffineDecomposer(**kw)
+        form = eq.identify(v)
+        if form is None:
+            return None
+        coefs, offset = form
+        names = dict((id(a), a.name) for a in v.inputs.values())
+        coefs = dict((names[k], c) for k, c in coefs.items())
+        self.assertAlmostEqual(eq(), offset +
+                sum(c * eq.argdict[n].value for n, c in coefs.items()))
+        return coefs, offset
+
+
+    def testAffine(self):
+        """Check decomposition of affine equations."""
+        self.assertEqual(({"x" : 1}, 0), self._decompose("x"))
+        self.assertEqual(({"x" : -1}, 1), self._decompose("1 - x"))
+        self.assertEqual(({"x" : 8, "y" : -0.5}, 4),
+                self._decompose("c * (2*x + 1) - y / 2"))
+        self.assertEqual(({"x" : 0, "y" : 1}, 0),
+                self._decompose("x - x + y"))
+        self.assertEqual(({}, 0.5), self._decompose("2.0 / c"))
+        return
+
+
+    def testNotAffine(self):
+        """Check equations that are not affine."""
+        self.assertTrue(self._decompose("x * y") is None)
+        self.assertTrue(self._decompose("x / y") is None)
+        self.assertTrue(self._decompose("x**2") is None)
+        self.assertTrue(self._decompose("sin(x)") is None)
+        self.assertTrue(self._decompose("v + x") is None)
+        self.assertTrue(self._decompose("x / (c - 4)") is None)
+        return
+
+
+    def testSubstitution(self):
+        """Check the substituted and excluded Arguments."""
+        eq = self.factory.makeEquation("x + y")
+        x = eq.argdict["x"]
+        y = eq.argdict["y"]
+        form = ({id(x) : 2.0}, 1.0)
+        v = visitors.AffineDecomposer(forms = {id(y) : form})
+        self.assertEqual(({id(x) : 3.0}, 1.0), eq.identify(v))
+        v = visitors.AffineDecomposer(exclude = [id(y)])
+        self.assertTrue(eq.identify(v) is None)
+        return
+
+
 if __name__ == "__main__":
     unittest.main()
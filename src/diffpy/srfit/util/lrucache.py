@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      Complex Modeling Initiative
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE.txt for license information.
+#
+##############################################################################
+
+"""LRUCache class.
+
+The LRUCache class is a bounded dictionary that discards the least recently
+used items when it is full.  It keeps count of the lookup hits and misses.
+"""
+
+__all__ = ["LRUCache"]
+
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """Bounded mapping that discards the least recently used items.
+
+    Attributes
+    maxsize --  The maximum number of items in the cache.
+    hits    --  The number of successful lookups.
+    misses  --  The number of failed lookups.
+    _data   --  OrderedDict of the cached items, the most recently used item
+                is the last one.
+    """
+
+    def __init__(self, maxsize = 128):
+        """Initialize the cache.
+
+        maxsize --  The maximum number of items in the cache (default 128).
+
+        Raises ValueError if maxsize is not positive.
+        """
+        if maxsize < 1:
+            raise ValueError("maxsize must be positive.")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        return
+
+
+    def __len__(self):
+        """Number of the items in the cache."""
+        return len(self._data)
+
+
+    def __contains__(self, key):
+        """Check if key is in the cache, this does not count as a lookup."""
+        return key in self._data
+
+
+    def get(self, key, default = None):
+        """Look up the value of key and mark it as recently used.
+
+        key     --  The key of the item.
+        default --  The value to be returned for a missing key.
+
+        Returns the cached value or default.
+        """
+        value = self._data.pop(key, self)
+        if value is self:
+            self.misses += 1
+            return default
+        self._data[key] = value
+        self.hits += 1
+        return value
+
+
+    def put(self, key, value):
+        """Store value in the cache under key.
+
+        The least recently used item is discarded when the cache is full.
+        """
+        self._data.pop(key, None)
+        self._data[key] = value
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+        return
+
+
+    def clear(self):
+        """Remove all items from the cache.  The statistics are kept."""
+        self._data.clear()
+        return
+
+
+    def info(self):
+        """Return a dictionary with the cache statistics.
+
+        The dictionary has keys "hits", "misses", "size" and "maxsize".
+        """
+        rv = dict(hits=self.hits, misses=self.misses,
+                size=len(self._data), maxsize=self.maxsize)
+        return rv
+
+# End class LRUCache
+
+# End of file
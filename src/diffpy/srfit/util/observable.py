@@ -11,7 +11,11 @@
 # Derived from pyre-1.0/packages/pyre/patterns/Observable.py
 # See pyre-1.0 for full copyright and license information
 
-__all__ = ["Observable"]
+__all__ = ["Observable", "notificationBatch"]
+
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 
 
 from diffpy.srfit.util.weakrefcallable import weak_ref
@@ -43,11 +47,25 @@ class Observable(object):
     def notify(self, other=()):
         """
         Notify all observers
+
+        Within notificationBatch the notification is postponed until the end of the batch.
         """
+        if _batch.depth:
+            _batch.pending.setdefault(id(self), (self, other))
+            return
         # build a list before notification, just in case the observer's callback behavior
         # involves removing itself from our callback set
         semaphors = (self,) + other
+        called = _batch.called
+        if called is None:
+            for callable in tuple(self._observers):
+                callable(semaphors)
+            return
+        # invalidation wave at the end of a batch, call each observer only once
         for callable in tuple(self._observers):
+            if callable in called:
+                continue
+            called.add(callable)
             callable(semaphors)
         return
 
@@ -88,6 +106,73 @@ class Observable(object):
 
 # end of class Observable
 
+# Batched notifications ------------------------------------------------------
+
+@contextmanager
+def notificationBatch():
+    """
+    Context manager that coalesces the notifications of Observable objects.
+
+    The notifications issued within the context are postponed.  At the end of the
+    outermost batch every notifying object is processed once and every observer is
+    called at most once, which gives a single invalidation wave through the observer
+    graph.  Literal observers already skip the repeated invalidations of an invalid
+    value, so the batch saves the repeated observer calls of the shared dependents
+    and the notifications that RecipeContainers forward up the hierarchy for every
+    changed Parameter.  Cached values of the observers are not invalidated within
+    the batch, therefore they should not be evaluated before the batch ends.
+
+    The batch is local to the calling thread.  Notifications from other threads
+    are issued immediately.
+    """
+    _batch.depth += 1
+    try:
+        yield
+    finally:
+        _batch.depth -= 1
+        if not _batch.depth:
+            _batch.flush()
+    return
+
+
+class _NotificationBatch(threading.local):
+    """
+    State of the batched notifications in the current thread.
+
+    depth       --  nesting level of notificationBatch contexts
+    pending     --  OrderedDict of (observable, other) pairs for the postponed
+                    notifications, indexed by id of the observable
+    called      --  set of observers called in the current invalidation wave
+                    or None when there is no wave
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.pending = OrderedDict()
+        self.called = None
+        return
+
+
+    def flush(self):
+        """
+        Issue the postponed notifications in one deduplicated wave.
+        """
+        if self.called is not None:
+            return
+        self.called = set()
+        try:
+            while self.pending:
+                key, (observable, other) = self.pending.popitem(last=False)
+                observable.notify(other)
+        finally:
+            self.called = None
+            self.pending.clear()
+        return
+
+# end of class _NotificationBatch
+
+_batch = _NotificationBatch()
+
 # Local helpers --------------------------------------------------------------
 
 def _fbRemoveObserver(fobs, semaphors):